@@ -1,8 +1,12 @@
 from django.contrib import admin
-from form_designer.models import FormDefinition, FormDefinitionField, FormDefinitionFieldChoice, FormSubmission, FormFieldSubmission
+from django.contrib.admin.views.main import ChangeList
+from form_designer import app_settings, search
+from form_designer.routers import for_reporting
+from form_designer.models import FormDefinition, FormDefinitionField, FormDefinitionFieldChoice, FormSubmission, FormFieldSubmission, FormDefinitionWebhook, WebhookDelivery
 from django import forms
 from django.utils.translation import ugettext as _
-from django.db import models
+from django.db import models, router
+from django.core.urlresolvers import reverse, NoReverseMatch
 from django.conf import settings
 import os
 
@@ -11,12 +15,35 @@ MEDIA_SUBDIR = 'form_designer'
 
 #==============================================================================
 class FormDefinitionFieldInlineForm(forms.ModelForm):
-    
+    """
+    Choices are edited as lines of text scoped to this field instead of
+    through a widget listing every choice in the database.
+    """
+
+    choice_list = forms.CharField(label=_('Choices'), help_text=_('One choice per line, as "value|label", or just "value" if label and value are the same.'),
+        widget=forms.Textarea(attrs={'rows': 5}), required=False)
+
     #--------------------------------------------------------------------------
     class Meta:
         model = FormDefinitionField
-        
-        
+        exclude = ('choices',)
+
+
+    #--------------------------------------------------------------------------
+    def __init__(self, *args, **kwargs):
+        super(FormDefinitionFieldInlineForm, self).__init__(*args, **kwargs)
+        self.position_deferred = False
+        if self.instance.pk:
+            self.initial.setdefault('choice_list', u'\r\n'.join([self.format_choice(choice.value, choice.label) for choice in self.instance.get_ordered_choices()]))
+
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def format_choice(value, label):
+        value, label = value or u'', label or u''
+        return value if value == label else u'%s|%s' % (value, label)
+
+
     #--------------------------------------------------------------------------
     def clean_choice_model(self):
         if not self.cleaned_data['choice_model'] and self.cleaned_data.has_key('field_class') and self.cleaned_data['field_class'] in ('forms.ModelChoiceField', 'forms.ModelMultipleChoiceField'):
@@ -24,24 +51,71 @@ class FormDefinitionFieldInlineForm(forms.ModelForm):
         return self.cleaned_data['choice_model']
 
 
+    #--------------------------------------------------------------------------
+    def clean_choice_list(self):
+        choices = []
+        for line in self.cleaned_data['choice_list'].splitlines():
+            if not line.strip():
+                continue
+            value, separator, label = line.partition('|')
+            choices.append((value.strip(), label.strip() if separator else value.strip()))
+        return choices
+
+
+    #--------------------------------------------------------------------------
+    def has_changed(self):
+        # fields that were only moved are updated in bulk by
+        # FormDefinitionAdmin.save_formset
+        if self.position_deferred:
+            return False
+        return super(FormDefinitionFieldInlineForm, self).has_changed()
+
+
+    #--------------------------------------------------------------------------
+    def save(self, commit=True):
+        instance = super(FormDefinitionFieldInlineForm, self).save(commit)
+        if commit:
+            self.save_choices(instance)
+        else:
+            save_m2m = self.save_m2m
+            def save_m2m_and_choices():
+                save_m2m()
+                self.save_choices(instance)
+            self.save_m2m = save_m2m_and_choices
+        return instance
+
+
+    #--------------------------------------------------------------------------
+    def save_choices(self, instance):
+        instance.set_choices(self.cleaned_data.get('choice_list', []))
+
+
 
 #==============================================================================
 class FormDefinitionFieldInline(admin.StackedInline):
     form = FormDefinitionFieldInlineForm
     model = FormDefinitionField
-    extra = 8
+    extra = 1
     fieldsets = [
         (_('Basic'), {'fields': ['name', 'field_class', 'required', 'initial']}),
-        (_('Display'), {'fields': ['label', 'widget', 'help_text', 'position', 'include_result']}),
-        (_('Text'), {'fields': ['max_length', 'min_length']}),
-        (_('Numbers'), {'fields': ['max_value', 'min_value', 'max_digits', 'decimal_places']}),
-        (_('Regex'), {'fields': ['regex']}),
-        (_('Choices'), {'fields': ['choices']}),
-        (_('Model Choices'), {'fields': ['choice_model', 'choice_model_empty_label']}),
+        (_('Display'), {'fields': ['label', 'widget', 'help_text', 'position', 'page', 'include_result'], 'classes': ['collapse']}),
+        (_('Text'), {'fields': ['max_length', 'min_length'], 'classes': ['collapse']}),
+        (_('Numbers'), {'fields': ['max_value', 'min_value', 'max_digits', 'decimal_places'], 'classes': ['collapse']}),
+        (_('Regex'), {'fields': ['regex'], 'classes': ['collapse']}),
+        (_('Files'), {'fields': ['max_file_size', 'allowed_file_types'], 'classes': ['collapse']}),
+        (_('Choices'), {'fields': ['choice_list'], 'classes': ['collapse']}),
+        (_('Model Choices'), {'fields': ['choice_model', 'choice_model_empty_label'], 'classes': ['collapse']}),
     ]
 
 
 
+#==============================================================================
+class FormDefinitionWebhookInline(admin.TabularInline):
+    model = FormDefinitionWebhook
+    extra = 0
+
+
+
 #==============================================================================
 class FormDefinitionForm(forms.ModelForm):
     
@@ -81,8 +155,8 @@ class FormDefinitionForm(forms.ModelForm):
 #==============================================================================
 class FormDefinitionAdmin(admin.ModelAdmin):
     fieldsets = [
-        (_('Basic'), {'fields': ['name', 'method', 'action', 'title', 'allow_get_initial', 'log_data', 'success_redirect', 'success_clear']}),
-        (_('Mail form'), {'fields': ['mail_to', 'mail_from', 'mail_subject'], 'classes': ['collapse']}),
+        (_('Basic'), {'fields': ['name', 'method', 'action', 'relay_action', 'title', 'allow_get_initial', 'log_data', 'success_redirect', 'success_clear']}),
+        (_('Mail form'), {'fields': ['mail_to', 'mail_from', 'mail_subject', 'mail_digest_interval', 'mail_digest_size'], 'classes': ['collapse']}),
         (_('Templates'), {'fields': ['message_template', 'form_template_name'], 'classes': ['collapse']}),
         (_('Messages'), {'fields': ['success_message', 'error_message', 'submit_label'], 'classes': ['collapse']}),
     ]
@@ -90,23 +164,97 @@ class FormDefinitionAdmin(admin.ModelAdmin):
     form = FormDefinitionForm
     inlines = [
         FormDefinitionFieldInline,
+        FormDefinitionWebhookInline,
     ]
 
 
+    #--------------------------------------------------------------------------
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not FormDefinitionField:
+            return super(FormDefinitionAdmin, self).save_formset(request, form, formset, change)
+        # reordering by drag & drop changes the position of many fields;
+        # write those in a single query instead of saving each field
+        positions = {}
+        for inline_form in formset.initial_forms:
+            if inline_form.instance.pk and inline_form.changed_data == ['position'] and not inline_form.cleaned_data.get('DELETE'):
+                positions[inline_form.instance.pk] = inline_form.cleaned_data['position'] or 0
+                inline_form.position_deferred = True
+        formset.save()
+        FormDefinitionField.objects.update_positions(positions)
+
+
 
 #==============================================================================
 class FormFieldSubmissionInline(admin.StackedInline):
     model = FormFieldSubmission
     extra = 0
+    raw_id_fields = ('definition_field',)
+
+
+
+#==============================================================================
+class FormSubmissionChangeList(ChangeList):
+    """
+    Runs on the reporting database and answers the search box from the
+    submission search index instead of scanning all submitted values with
+    icontains.
+    """
+
+    #--------------------------------------------------------------------------
+    def get_query_set(self):
+        # also used for the result counts, which is why it is moved here
+        self.root_query_set = for_reporting(self.root_query_set)
+        query = self.query
+        if not query:
+            return super(FormSubmissionChangeList, self).get_query_set()
+        self.query = ''
+        try:
+            queryset = super(FormSubmissionChangeList, self).get_query_set()
+        finally:
+            self.query = query
+        return search.search(queryset, query)
 
 
 
 #==============================================================================
 class FormSubmissionAdmin(admin.ModelAdmin):
     list_display = ('form_title', 'form_name', 'created')
+    # filtering by partition only reads the partition's tables on PostgreSQL
+    list_filter = ('definition', 'partition') if app_settings.get('FORM_DESIGNER_PARTITIONING') else ('definition',)
+    # only used to show the search box, see FormSubmissionChangeList
+    search_fields = ('fields__value',)
     inlines = [
         FormFieldSubmissionInline,
     ]
+
+
+    #--------------------------------------------------------------------------
+    def queryset(self, request):
+        return super(FormSubmissionAdmin, self).queryset(request).select_related('definition')
+
+
+    #--------------------------------------------------------------------------
+    def get_changelist(self, request, **kwargs):
+        return FormSubmissionChangeList
+
+
+    #--------------------------------------------------------------------------
+    def changelist_view(self, request, extra_context=None):
+        extra_context = dict(extra_context or {})
+        try:
+            # pass on the changelist's filters and search
+            extra_context['export_csv_url'] = reverse('form_designer_export_csv') + ('?' + request.GET.urlencode() if request.GET else '')
+        except NoReverseMatch:
+            # admin_urls are not included
+            pass
+        return super(FormSubmissionAdmin, self).changelist_view(request, extra_context)
+
+
+    #--------------------------------------------------------------------------
+    def response_action(self, request, queryset):
+        # actions like deleting the selected submissions write, so they must
+        # not use the changelist's queryset on the reporting database
+        return super(FormSubmissionAdmin, self).response_action(request, queryset.using(router.db_for_write(self.model)))
     
     
     #--------------------------------------------------------------------------
@@ -122,8 +270,40 @@ class FormSubmissionAdmin(admin.ModelAdmin):
     
 
 
+#==============================================================================
+class FormDefinitionFieldChoiceAdmin(admin.ModelAdmin):
+    list_display = ('label', 'value')
+    search_fields = ('label', 'value')
+
+
+
+#==============================================================================
+class FormFieldSubmissionAdmin(admin.ModelAdmin):
+    list_display = ('definition_field', 'submission', 'value')
+    raw_id_fields = ('submission', 'definition_field')
+    list_select_related = True
+
+
+
+#==============================================================================
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('webhook', 'status', 'attempts', 'next_attempt', 'created')
+    list_filter = ('status',)
+    raw_id_fields = ('webhook',)
+    actions = ['retry']
+
+
+    #--------------------------------------------------------------------------
+    def retry(self, request, queryset):
+        import datetime
+        queryset.update(status=WebhookDelivery.STATUS_PENDING, attempts=0, next_attempt=datetime.datetime.now())
+    retry.short_description = _('Retry selected deliveries')
+
+
+
 admin.site.register(FormDefinition, FormDefinitionAdmin)
-admin.site.register(FormDefinitionFieldChoice)
+admin.site.register(FormDefinitionFieldChoice, FormDefinitionFieldChoiceAdmin)
 admin.site.register(FormSubmission, FormSubmissionAdmin)
-admin.site.register(FormFieldSubmission)
+admin.site.register(FormFieldSubmission, FormFieldSubmissionAdmin)
+admin.site.register(WebhookDelivery, WebhookDeliveryAdmin)
 
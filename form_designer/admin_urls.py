@@ -2,6 +2,7 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns('',
     
-    url(r'^formlog/export_csv/$', 'form_designer.admin_views.export_csv', name='form_designer_export_csv'),
+    url(r'^formsubmission/export_csv/$', 'form_designer.admin_views.export_csv', name='form_designer_export_csv'),
+    url(r'^formsubmission/search/$', 'form_designer.admin_views.search_submissions', name='form_designer_search_submissions'),
     
 )
@@ -1,5 +1,6 @@
 # encoding=utf-8
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.contrib.admin.views.decorators import staff_member_required
 from form_designer import app_settings
 from django.utils.translation import ugettext as _
 from form_designer.templatetags.friendly import friendly
@@ -13,8 +14,8 @@ def get_change_list_query_set(model_admin, model, request):
     """
     
     from django.contrib import admin
-    from django.contrib.admin.views.main import ChangeList
     a = model_admin(model, admin.site)
+    ChangeList = a.get_changelist(request)
     cl = ChangeList(request, a.model, a.list_display, a.list_display_links, a.list_filter,
         a.date_hierarchy, a.search_fields, a.list_select_related, a.list_per_page, a.list_editable, a)
     return cl.get_query_set()
@@ -23,23 +24,29 @@ def get_change_list_query_set(model_admin, model, request):
 #------------------------------------------------------------------------------
 def export_csv(request):
     """
-    TODO: Re-code this. Executing this now will result in an error (No such
-    class "FormLogAdmin").
+    Exports the submissions visible in the admin changelist, with its
+    filters and search applied, as CSV. Like the changelist, this runs on the
+    reporting database.
     """
     
+    from form_designer.admin import FormSubmissionAdmin
+    from form_designer.models import FormDefinition, FormSubmission, FormFieldSubmission
+    
     response = HttpResponse(mimetype='text/csv')
     response['Content-Disposition'] = 'attachment; filename='+app_settings.get('FORM_DESIGNER_CSV_EXPORT_FILENAME')
     writer = csv.writer(response, delimiter=app_settings.get('FORM_DESIGNER_CSV_EXPORT_DELIMITER'))
-    qs = get_change_list_query_set(FormLogAdmin, FormLog, request)
+    qs = get_change_list_query_set(FormSubmissionAdmin, FormSubmission, request)
+    db = qs.db
+    submissions = list(qs.values_list('pk', 'created'))
     
-    from django.db.models import Count
-    distinct_forms = qs.aggregate(Count('form_definition', distinct=True))['form_definition__count']
+    definitions = list(FormDefinition.objects.using(db).filter(fields__submissions__submission__in=qs.values('pk')).distinct())
     
     include_created = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_CREATED')
     include_pk = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_PK')
-    include_header = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_HEADER') and distinct_forms == 1
-    include_form = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_FORM') and distinct_forms > 1
+    include_header = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_HEADER') and len(definitions) == 1
+    include_form = app_settings.get('FORM_DESIGNER_CSV_EXPORT_INCLUDE_FORM') and len(definitions) > 1
 
+    columns = None
     if include_header:
         header = [] 
         if include_form:
@@ -48,24 +55,81 @@ def export_csv(request):
             header.append(_('Created'))
         if include_pk:
             header.append(_('ID'))
-        for field in qs.all()[0].data:
-            header.append(field['label'] if field['label'] else field['key'])
-        writer.writerow(header)
+        columns = list(definitions[0].fields.order_by('position', 'pk'))
+        for field in columns:
+            header.append(field.label if field.label else field.name)
+        writer.writerow([friendly(value).encode(settings.DEFAULT_CHARSET) for value in header])
 
-    for entry in qs:
-        row = []
-        if include_form:
-            row.append(entry.form_definition)
-        if include_created:
-            row.append(entry.created)
-        if include_pk:
-            row.append(entry.pk)
-        for field in entry.data:
-            value = friendly(field['value'])
-            if not isinstance(value, basestring):
-                value = unicode(value)
-            value = value.encode(settings.DEFAULT_CHARSET)
-            row.append(value)
-        writer.writerow(row)
+    # the values of a batch of submissions are loaded with a single query
+    batch_size = 500
+    for offset in range(0, len(submissions), batch_size):
+        batch = submissions[offset:offset + batch_size]
+        values = {}
+        forms = {}
+        for field in FormFieldSubmission.objects.using(db).filter(submission__in=[pk for pk, created in batch]).select_related('definition_field__form_definition').order_by('definition_field__position', 'pk'):
+            values.setdefault(field.submission_id, []).append((field.definition_field_id, field.value))
+            forms[field.submission_id] = field.definition_field.form_definition
+        for pk, created in batch:
+            row = []
+            if include_form:
+                row.append(forms.get(pk, ''))
+            if include_created:
+                row.append(created)
+            if include_pk:
+                row.append(pk)
+            if columns is not None:
+                field_values = dict(values.get(pk, []))
+                row.extend([field_values.get(field.pk, '') for field in columns])
+            else:
+                row.extend([value for field_id, value in values.get(pk, [])])
+            writer.writerow([friendly(value).encode(settings.DEFAULT_CHARSET) for value in row])
 
     return response
+export_csv = staff_member_required(export_csv)
+
+
+
+#------------------------------------------------------------------------------
+def search_submissions(request):
+    """
+    Returns the submissions matching the query parameter "q" as JSON, a page
+    at a time ("page", "per_page"). Results can be limited to one form by
+    passing its name as "form".
+    """
+    
+    from django.core.paginator import Paginator, InvalidPage
+    from django.utils import simplejson
+    from form_designer import search
+    from form_designer.models import FormSubmission, FormFieldSubmission
+    from form_designer.routers import for_reporting
+    from form_designer.webhooks import json_value
+    
+    queryset = for_reporting(FormSubmission.objects.all())
+    if request.GET.get('form'):
+        queryset = queryset.filter(definition__name=request.GET['form'])
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = search.search(queryset, query)
+    
+    try:
+        per_page = min(max(int(request.GET.get('per_page', 20)), 1), app_settings.get('FORM_DESIGNER_SEARCH_MAX_PER_PAGE'))
+        page = Paginator(queryset, per_page).page(int(request.GET.get('page', 1)))
+    except (ValueError, InvalidPage):
+        return HttpResponseBadRequest(_('Invalid page.'))
+    
+    submissions = list(page.object_list)
+    results = dict([(submission.pk, {'id': submission.pk, 'created': submission.created.isoformat(), 'form': None, 'fields': []}) for submission in submissions])
+    for field in FormFieldSubmission.objects.using(queryset.db).filter(submission__in=results.keys()).select_related('definition_field__form_definition').order_by('definition_field__position', 'pk'):
+        result = results[field.submission_id]
+        result['form'] = field.definition_field.form_definition.name
+        result['fields'].append({'name': field.definition_field.name, 'label': json_value(field.definition_field.label), 'value': field.value})
+    
+    data = {
+        'query': query,
+        'count': page.paginator.count,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'results': [results[submission.pk] for submission in submissions],
+    }
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')
+search_submissions = staff_member_required(search_submissions)
@@ -0,0 +1,6 @@
+from django.conf.urls.defaults import *
+
+# Same as form_designer.urls, but mails are sent by a background thread
+urlpatterns = patterns('',
+    url(r'^(?P<object_name>[-\w]+)/$', 'form_designer.views.detail', {'background': True}, name='form_designer_background_detail'),
+)
@@ -0,0 +1,152 @@
+"""
+Write-behind buffering of form submissions.
+
+With FORM_DESIGNER_BUFFERED_LOGGING enabled, FormDefinition.log() appends
+submissions to a local SQLite spool (in WAL mode, shared by all processes on
+the host) instead of writing them to the database. The flush_submission_buffer
+management command moves them to FormSubmission/FormFieldSubmission in large
+batches, deleting them from the spool only after the database transaction
+has been committed. Submissions therefore survive crashes of both web
+processes and the flusher, but a crash right after a commit may cause a
+batch to be written twice. Run a single flusher per spool.
+"""
+
+import datetime
+import sqlite3
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.utils.encoding import smart_unicode
+from form_designer import app_settings
+from form_designer.models import FormSubmission, FormFieldSubmission, FormDefinitionField
+from form_designer.partitions import get_partition
+from form_designer.search import index_submissions
+from form_designer.serialized_field import dumps, loads
+
+_lock = threading.Lock()
+_buffer = None
+
+
+#------------------------------------------------------------------------------
+def get_buffer():
+    global _buffer
+    _lock.acquire()
+    try:
+        if _buffer is None:
+            path = app_settings.get('FORM_DESIGNER_BUFFER_PATH')
+            if not path:
+                raise ImproperlyConfigured('FORM_DESIGNER_BUFFER_PATH must be set to use buffered logging.')
+            _buffer = SubmissionBuffer(path, app_settings.get('FORM_DESIGNER_BUFFER_MAX_ENTRIES'))
+    finally:
+        _lock.release()
+    return _buffer
+
+
+
+#==============================================================================
+class SubmissionBuffer(object):
+
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+
+    #--------------------------------------------------------------------------
+    @property
+    def connection(self):
+        # sqlite connections may not be shared between threads
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.execute('CREATE TABLE IF NOT EXISTS submissions (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    #--------------------------------------------------------------------------
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+
+    #--------------------------------------------------------------------------
+    def append(self, form_definition, form_data):
+        """
+        Buffers a submission. Returns False without buffering anything if
+        the buffer is full.
+        """
+        field_dict = form_definition.get_field_dict()
+        data = dumps({
+            'created': datetime.datetime.now(),
+            'definition': form_definition.pk,
+            'fields': [(field_dict[item['name']].pk, smart_unicode(item['value'])) for item in form_data],
+        })
+        connection = self.connection
+        # the check and the insert happen in one write transaction, so
+        # concurrent writers cannot overshoot the limit
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if self.max_entries and connection.execute('SELECT COUNT(*) FROM submissions').fetchone()[0] >= self.max_entries:
+                connection.execute('ROLLBACK')
+                return False
+            connection.execute('INSERT INTO submissions (data) VALUES (?)', (data,))
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return True
+
+    #--------------------------------------------------------------------------
+    def flush(self, batch_size=1000, using='default'):
+        """
+        Writes up to batch_size buffered submissions to the database and
+        removes them from the buffer. Returns the number of submissions
+        written.
+        """
+        rows = self.connection.execute('SELECT id, data FROM submissions ORDER BY id LIMIT ?', (batch_size,)).fetchall()
+        if not rows:
+            return 0
+        write_submissions([loads(data) for spool_id, data in rows], using)
+        self.connection.execute('DELETE FROM submissions WHERE id <= ?', (rows[-1][0],))
+        return len(rows)
+
+
+
+#------------------------------------------------------------------------------
+def write_submissions(entries, using='default'):
+    """
+    Inserts buffered submissions in one transaction: one INSERT per
+    submission (to get its id) and a single multi-row INSERT for all field
+    values.
+    """
+    transaction.commit_on_success(using=using)(_insert_submissions)(entries, using)
+
+
+#------------------------------------------------------------------------------
+def _insert_submissions(entries, using):
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    submission_meta = FormSubmission._meta
+    field_meta = FormFieldSubmission._meta
+    # entries buffered by older versions don't include their definition
+    field_ids = [entry['fields'][0][0] for entry in entries if not 'definition' in entry and entry['fields']]
+    definitions = dict(FormDefinitionField.objects.using(using).filter(pk__in=field_ids).values_list('pk', 'form_definition')) if field_ids else {}
+    cursor = connection.cursor()
+    field_rows = []
+    documents = []
+    for entry in entries:
+        definition_id = entry.get('definition') or (definitions.get(entry['fields'][0][0]) if entry['fields'] else None)
+        partition = get_partition(definition_id, entry['created'])
+        # raw INSERT, as saving the model would overwrite created (auto_now)
+        cursor.execute('INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, %%s)' % (qn(submission_meta.db_table), qn(submission_meta.get_field('created').column),
+            qn(submission_meta.get_field('definition').column), qn(submission_meta.get_field('partition').column)),
+            [connection.ops.value_to_db_datetime(entry['created']), definition_id, partition])
+        submission_id = connection.ops.last_insert_id(cursor, submission_meta.db_table, submission_meta.pk.column)
+        for field_id, value in entry['fields']:
+            field_rows.append((submission_id, field_id, value, partition))
+        documents.append((submission_id, [value for field_id, value in entry['fields']]))
+    if field_rows:
+        cursor.executemany('INSERT INTO %s (%s, %s, %s, %s) VALUES (%%s, %%s, %%s, %%s)' % (qn(field_meta.db_table),
+            qn(field_meta.get_field('submission').column), qn(field_meta.get_field('definition_field').column),
+            qn(field_meta.get_field('value').column), qn(field_meta.get_field('partition').column)), field_rows)
+    index_submissions(documents, using)
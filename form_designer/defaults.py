@@ -15,6 +15,8 @@ FORM_DESIGNER_FIELD_CLASSES = (
     ('forms.ModelChoiceField', _('Model Choice')),
     ('forms.ModelMultipleChoiceField', _('Model Multiple Choice')),
     ('forms.RegexField', _('Regex')),
+    ('forms.FileField', _('File')),
+    ('forms.ImageField', _('Image')),
 )
 
 FORM_DESIGNER_WIDGET_CLASSES = (
@@ -52,4 +54,91 @@ FORM_DESIGNER_CSV_EXPORT_INCLUDE_FORM = True
 
 FORM_DESIGNER_CSV_EXPORT_FILENAME = 'export.csv'
 
-FORM_DESIGNER_SUBMIT_FLAG_NAME = 'submit__%s'
\ No newline at end of file
+FORM_DESIGNER_SUBMIT_FLAG_NAME = 'submit__%s'
+
+# JSON values at least this many characters long are zlib-compressed by
+# SerializedObjectField; None disables compression
+FORM_DESIGNER_SERIALIZED_FIELD_COMPRESS_THRESHOLD = 1024
+
+# Dotted path to the storage class uploaded files are saved to. If None, the
+# project's DEFAULT_FILE_STORAGE (usually the local filesystem) is used.
+FORM_DESIGNER_FILE_STORAGE = None
+
+# Path within the storage, passed through strftime
+FORM_DESIGNER_FILE_UPLOAD_TO = 'form_designer/%Y/%m/%d'
+
+# Size limit in bytes for file fields that don't define their own
+FORM_DESIGNER_FILE_MAX_SIZE = 10 * 1024 * 1024
+
+# Webhook delivery: number of worker threads, request timeout in seconds,
+# attempts before a delivery is given up, and the backoff delay in seconds
+# after the first failure (doubled for each further failure, up to the max)
+FORM_DESIGNER_WEBHOOK_WORKERS = 4
+FORM_DESIGNER_WEBHOOK_TIMEOUT = 10
+FORM_DESIGNER_WEBHOOK_MAX_ATTEMPTS = 8
+FORM_DESIGNER_WEBHOOK_RETRY_DELAY = 30
+FORM_DESIGNER_WEBHOOK_MAX_RETRY_DELAY = 6 * 60 * 60
+
+# Seconds after which a delivery claimed by deliver_webhooks is considered
+# abandoned, e.g. because the process was killed, and may be sent again
+FORM_DESIGNER_WEBHOOK_CLAIM_TIMEOUT = 10 * 60
+
+# Relay mode: number of forwarding threads, maximum number of submissions
+# waiting to be forwarded, request timeout in seconds, and the number of
+# consecutive failures after which a target host is skipped for
+# FORM_DESIGNER_RELAY_RESET_TIMEOUT seconds
+FORM_DESIGNER_RELAY_WORKERS = 4
+FORM_DESIGNER_RELAY_QUEUE_SIZE = 1000
+FORM_DESIGNER_RELAY_TIMEOUT = 5
+FORM_DESIGNER_RELAY_FAILURE_THRESHOLD = 5
+FORM_DESIGNER_RELAY_RESET_TIMEOUT = 60
+
+# Send notification mails from background threads instead of while the
+# request is processed. Can also be enabled per URL, see background_urls.
+FORM_DESIGNER_BACKGROUND_MAIL = False
+FORM_DESIGNER_MAIL_WORKERS = 2
+FORM_DESIGNER_MAIL_QUEUE_SIZE = 1000
+
+# Buffered logging: submissions are appended to the SQLite spool file at
+# FORM_DESIGNER_BUFFER_PATH and written to the database in batches of
+# FORM_DESIGNER_BUFFER_FLUSH_SIZE by the flush_submission_buffer command.
+# If more than FORM_DESIGNER_BUFFER_MAX_ENTRIES are waiting, submissions are
+# written directly again.
+FORM_DESIGNER_BUFFERED_LOGGING = False
+FORM_DESIGNER_BUFFER_PATH = None
+FORM_DESIGNER_BUFFER_MAX_ENTRIES = 100000
+FORM_DESIGNER_BUFFER_FLUSH_SIZE = 1000
+
+# Full-text index for submissions: 'auto' picks SQLite FTS5 or PostgreSQL
+# full-text search if available and falls back to 'tokens', a plain inverted
+# index table. Set to None to disable indexing and search with icontains.
+FORM_DESIGNER_SEARCH_BACKEND = 'auto'
+
+# Maximum results per page of the JSON search view
+FORM_DESIGNER_SEARCH_MAX_PER_PAGE = 100
+
+# Reject regular expressions with ambiguous nested unbounded repetition, like
+# "(a+)+", or repeated overlapping alternatives, like "(a|aa)+", which can
+# take exponential time to match, when saving a field
+FORM_DESIGNER_REGEX_LINT = True
+
+# Number of compiled regular expressions kept per process
+FORM_DESIGNER_REGEX_CACHE_SIZE = 500
+
+# Database alias that reporting queries (submission changelist, CSV export,
+# submission search) are sent to, usually a read replica. None runs them on
+# the primary. See form_designer.routers.
+FORM_DESIGNER_REPORTING_DATABASE = None
+
+# Partitioning of submission storage: None, 'month', 'definition' or
+# 'definition-month'. See form_designer.partitions.
+FORM_DESIGNER_PARTITIONING = None
+
+# Number of months ahead for which setup_submission_partitions creates month
+# partitions. Run it at least this often; submissions whose partition does
+# not exist yet are stored in the default partition.
+FORM_DESIGNER_PARTITION_MONTHS_AHEAD = 3
+
+# Seconds for which the answers of completed pages of a multi-step form are
+# accepted, see form_designer.steps
+FORM_DESIGNER_STEP_MAX_AGE = 86400
@@ -0,0 +1,102 @@
+"""
+Digest mails: instead of one mail per submission, submissions of definitions
+with a digest interval or size are collected as MailDigestEntry rows and
+mailed together by the send_mail_digests management command.
+"""
+
+import datetime
+import decimal
+
+from django.core.mail import EmailMessage, get_connection
+from django.utils.translation import ugettext as _
+from form_designer.models import FormDefinition, MailDigestEntry
+from form_designer.templatetags.friendly import friendly
+
+DIGEST_SEPARATOR = u'\n\n' + u'-' * 70 + u'\n\n'
+
+
+#------------------------------------------------------------------------------
+def storable_value(value):
+    """
+    Converts values that can't be stored in a SerializedObjectField, such as
+    model instances and querysets, to their friendly text representation.
+    """
+    if value is None or isinstance(value, (bool, int, long, float, basestring, datetime.date, datetime.time, decimal.Decimal)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [storable_value(item) for item in value]
+    return friendly(value)
+
+
+#------------------------------------------------------------------------------
+def queue(form_definition, form_data):
+    return MailDigestEntry.objects.create(form_definition=form_definition, form_data=[
+        {'name': item['name'], 'label': unicode(item['label'] or ''), 'value': storable_value(item['value'])} for item in form_data])
+
+
+#------------------------------------------------------------------------------
+def is_due(form_definition, count, oldest, now):
+    if form_definition.mail_digest_size and count >= form_definition.mail_digest_size:
+        return True
+    if form_definition.mail_digest_interval and oldest <= now - datetime.timedelta(minutes=form_definition.mail_digest_interval):
+        return True
+    return False
+
+
+#------------------------------------------------------------------------------
+def build_messages(form_definition, entries, connection=None):
+    """
+    Builds one message per distinct sender and recipient list (these are
+    templates, so they can differ between entries), each containing all of
+    the group's entries. Returns a list of (message, entries) pairs.
+    """
+    groups = []
+    grouped = {}
+    for entry in entries:
+        mail_subject, mail_from, mail_to = form_definition.get_mail_headers(entry.form_data)
+        key = (mail_from, tuple(mail_to))
+        if not key in grouped:
+            grouped[key] = (mail_subject, [])
+            groups.append(key)
+        grouped[key][1].append(entry)
+
+    messages = []
+    for key in groups:
+        mail_from, mail_to = key
+        mail_subject, group_entries = grouped[key]
+        body = DIGEST_SEPARATOR.join([form_definition.compile_message(entry.form_data) for entry in group_entries])
+        subject = _('%(subject)s (%(count)d submissions)') % {'subject': mail_subject, 'count': len(group_entries)}
+        messages.append((EmailMessage(subject, body, mail_from or None, list(mail_to), connection=connection), group_entries))
+    return messages
+
+
+#------------------------------------------------------------------------------
+def send_due_digests(now=None):
+    """
+    Sends the digests of all definitions that are due, over a single SMTP
+    connection, and right away for definitions that no longer use digests.
+    Entries are deleted as soon as the message containing them has been
+    sent, or without being sent if the definition no longer has recipients.
+    Returns (digests sent, entries sent).
+    """
+    now = now or datetime.datetime.now()
+    connection = get_connection()
+    sent_messages = sent_entries = 0
+    connection.open()
+    try:
+        for form_definition in FormDefinition.objects.filter(digest_entries__isnull=False).distinct():
+            if not form_definition.mail_to:
+                form_definition.digest_entries.all().delete()
+                continue
+            entries = list(form_definition.digest_entries.order_by('pk'))
+            if not entries or (form_definition.uses_mail_digest and not is_due(form_definition, len(entries), entries[0].created, now)):
+                continue
+            for message, group_entries in build_messages(form_definition, entries, connection):
+                # if a later message fails, this one is not sent again
+                connection.send_messages([message])
+                MailDigestEntry.objects.filter(pk__in=[entry.pk for entry in group_entries]).delete()
+                sent_messages += 1
+                sent_entries += len(group_entries)
+    finally:
+        connection.close()
+    return sent_messages, sent_entries
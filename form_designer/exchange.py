@@ -0,0 +1,270 @@
+"""
+Export and import of form definitions, including their fields and choices,
+for copying forms between installations.
+
+The exported document looks like this:
+
+    {
+        "format": "form_designer",
+        "version": 1,
+        "definitions": [
+            {"name": "contact", "title": "Contact", ..., "fields": [
+                {"name": "email", "field_class": "forms.EmailField", ..., "choices": [
+                    {"value": "a", "label": "Option A"}, ...
+                ]},
+            ]},
+        ]
+    }
+
+Definitions are matched by name and fields by name within their definition.
+Importing only writes what differs from the existing rows. Before anything
+is written, every definition and field is validated with full_clean(), as
+it will be after the import, and field classes and widgets must be among the
+configured ones.
+"""
+
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import models, transaction
+from form_designer import app_settings
+from form_designer.models import FormDefinition, FormDefinitionField
+
+FORMAT = 'form_designer'
+VERSION = 1
+
+DEFINITION_EXCLUDE = ('id',)
+FIELD_EXCLUDE = ('id', 'form_definition')
+
+
+#==============================================================================
+class ExchangeError(ValueError):
+    pass
+
+
+
+#------------------------------------------------------------------------------
+def _attributes(model, exclude):
+    return [field for field in model._meta.fields if not field.name in exclude]
+
+
+#------------------------------------------------------------------------------
+def export_definitions(queryset):
+    """
+    Returns the definitions in queryset as an export document.
+    """
+    definition_attributes = _attributes(FormDefinition, DEFINITION_EXCLUDE)
+    field_attributes = _attributes(FormDefinitionField, FIELD_EXCLUDE)
+    data = []
+    for definition in queryset.order_by('name'):
+        item = dict([(field.name, field.value_from_object(definition)) for field in definition_attributes])
+        item['fields'] = []
+        for def_field in definition.fields.order_by('position', 'pk'):
+            field_item = dict([(field.name, field.value_from_object(def_field)) for field in field_attributes])
+            field_item['choices'] = [{'value': choice.value, 'label': choice.label} for choice in def_field.get_ordered_choices()]
+            item['fields'].append(field_item)
+        data.append(item)
+    return {'format': FORMAT, 'version': VERSION, 'definitions': data}
+
+
+#------------------------------------------------------------------------------
+def _diff(instance, attributes, data):
+    """
+    Returns a dictionary of the attributes whose value in data differs from
+    the instance.
+    """
+    changes = {}
+    for field in attributes:
+        if field.name in data:
+            value = field.to_python(data[field.name])
+            if value != field.value_from_object(instance):
+                changes[field.attname] = value
+    return changes
+
+
+#------------------------------------------------------------------------------
+def _check(document):
+    if not isinstance(document, dict) or document.get('format') != FORMAT:
+        raise ExchangeError('Not a form_designer export.')
+    if document.get('version') != VERSION:
+        raise ExchangeError('Unsupported export version %r, expected %d.' % (document.get('version'), VERSION))
+    definition_names = set()
+    for item in document.get('definitions', []):
+        if not item.get('name'):
+            raise ExchangeError('Found a definition without a name.')
+        if item['name'] in definition_names:
+            raise ExchangeError('Definition "%s" appears more than once.' % item['name'])
+        definition_names.add(item['name'])
+        names = set()
+        for field_item in item.get('fields', []):
+            if not field_item.get('name'):
+                raise ExchangeError('Definition "%s" has a field without a name.' % item['name'])
+            if field_item['name'] in names:
+                raise ExchangeError('Definition "%s" has more than one field named "%s".' % (item['name'], field_item['name']))
+            names.add(field_item['name'])
+
+
+#------------------------------------------------------------------------------
+def _build(model, attributes, data, existing):
+    """
+    Returns an unsaved instance as it will be after importing data over
+    existing (which may be None), and a dictionary of the values that could
+    not be converted.
+    """
+    instance = model()
+    errors = {}
+    if existing:
+        instance.pk = existing.pk
+        # so that validate_unique() doesn't find the existing row
+        instance._state.adding = False
+        instance._state.db = existing._state.db
+    for field in attributes:
+        if field.name in data:
+            try:
+                value = field.to_python(data[field.name])
+            except ValidationError as error:
+                errors[field.name] = error.messages
+                continue
+        elif existing:
+            value = getattr(existing, field.attname)
+        else:
+            continue
+        setattr(instance, field.attname, value)
+    return instance, errors
+
+
+#------------------------------------------------------------------------------
+def _full_clean(instance, errors, exclude=None):
+    """
+    Validates instance like a ModelForm in the admin does, adding the
+    errors to errors.
+    """
+    try:
+        instance.full_clean(exclude=list(exclude or []) + errors.keys())
+    except ValidationError as error:
+        for name, messages in error.message_dict.items():
+            errors.setdefault(name, messages)
+    # model SlugFields leave this to their form field
+    for field in instance._meta.fields:
+        if isinstance(field, models.SlugField) and not field.name in errors:
+            try:
+                validate_slug(getattr(instance, field.attname))
+            except ValidationError as error:
+                errors[field.name] = error.messages
+    return errors
+
+
+#------------------------------------------------------------------------------
+def _format_errors(errors):
+    return '; '.join(['%s: %s' % (name, ' '.join([unicode(message) for message in messages])) for name, messages in sorted(errors.items())])
+
+
+#------------------------------------------------------------------------------
+def _validate(items, definitions, existing_fields, definition_attributes, field_attributes):
+    """
+    Checks every definition and field as it will be after the import with
+    full_clean(), and raises ExchangeError for the first invalid one. Field
+    classes and widgets must be configured ones, since they are evaluated
+    when the form is rendered.
+    """
+    field_classes = [name for name, label in app_settings.get('FORM_DESIGNER_FIELD_CLASSES')]
+    widget_classes = [name for name, label in app_settings.get('FORM_DESIGNER_WIDGET_CLASSES')]
+    for item in items:
+        existing = definitions.get(item['name'])
+        definition, errors = _build(FormDefinition, definition_attributes, item, existing)
+        if _full_clean(definition, errors):
+            raise ExchangeError('Definition "%s": %s' % (item['name'], _format_errors(errors)))
+        for field_item in item.get('fields', []):
+            def_field, errors = _build(FormDefinitionField, field_attributes, field_item,
+                existing and existing_fields.get((existing.pk, field_item['name'])))
+            if def_field.field_class and not def_field.field_class in field_classes:
+                errors.setdefault('field_class', [u'"%s" is not a configured field class.' % def_field.field_class])
+            if def_field.widget and not def_field.widget in widget_classes:
+                errors.setdefault('widget', [u'"%s" is not a configured widget.' % def_field.widget])
+            if _full_clean(def_field, errors, exclude=['form_definition']):
+                raise ExchangeError('Definition "%s", field "%s": %s' % (item['name'], field_item['name'], _format_errors(errors)))
+
+
+#------------------------------------------------------------------------------
+def import_definitions(document, prune=False):
+    """
+    Creates or updates the definitions of an export document in a single
+    transaction. With prune, fields that are not in the document are
+    deleted (along with their submitted values). Returns a dictionary of
+    statistics.
+    """
+    _check(document)
+    return transaction.commit_on_success(_import)(document, prune)
+
+
+#------------------------------------------------------------------------------
+def _import(document, prune):
+    start = time.time()
+    stats = dict([(key, 0) for key in ('definitions_created', 'definitions_updated', 'definitions_unchanged',
+        'fields_created', 'fields_updated', 'fields_unchanged', 'fields_deleted', 'choices_updated')])
+    definition_attributes = _attributes(FormDefinition, DEFINITION_EXCLUDE)
+    field_attributes = _attributes(FormDefinitionField, FIELD_EXCLUDE)
+    items = document.get('definitions', [])
+
+    # load everything that may be touched with three queries up front
+    definitions = dict([(definition.name, definition) for definition in FormDefinition.objects.filter(name__in=[item['name'] for item in items])])
+    existing_fields = {}
+    for def_field in FormDefinitionField.objects.filter(form_definition__in=definitions.values()):
+        existing_fields[(def_field.form_definition_id, def_field.name)] = def_field
+    existing_choices = {}
+    through = FormDefinitionField.choices.through
+    for link in through.objects.filter(formdefinitionfield__in=existing_fields.values()).select_related('formdefinitionfieldchoice').order_by('pk'):
+        existing_choices.setdefault(link.formdefinitionfield_id, []).append(link.formdefinitionfieldchoice)
+
+    _validate(items, definitions, existing_fields, definition_attributes, field_attributes)
+
+    for item in items:
+        definition = definitions.get(item['name'])
+        if definition is None:
+            definition = FormDefinition()
+            for field in definition_attributes:
+                if field.name in item:
+                    setattr(definition, field.attname, field.to_python(item[field.name]))
+            definition.save()
+            stats['definitions_created'] += 1
+        else:
+            changes = _diff(definition, definition_attributes, item)
+            if changes:
+                FormDefinition.objects.filter(pk=definition.pk).update(**changes)
+                stats['definitions_updated'] += 1
+            else:
+                stats['definitions_unchanged'] += 1
+
+        names = []
+        for field_item in item.get('fields', []):
+            names.append(field_item['name'])
+            def_field = existing_fields.get((definition.pk, field_item['name']))
+            choices = [(unicode(choice.get('value', '')), unicode(choice.get('label', ''))) for choice in field_item.get('choices', [])]
+            if def_field is None:
+                def_field = FormDefinitionField(form_definition=definition)
+                for field in field_attributes:
+                    if field.name in field_item:
+                        setattr(def_field, field.attname, field.to_python(field_item[field.name]))
+                def_field.save()
+                stats['fields_created'] += 1
+                if choices:
+                    def_field.set_choices(choices, [])
+                continue
+            changes = _diff(def_field, field_attributes, field_item)
+            if changes:
+                FormDefinitionField.objects.filter(pk=def_field.pk).update(**changes)
+                stats['fields_updated'] += 1
+            else:
+                stats['fields_unchanged'] += 1
+            if def_field.set_choices(choices, existing_choices.get(def_field.pk, [])):
+                stats['choices_updated'] += 1
+
+        if prune:
+            obsolete = [def_field.pk for (definition_id, name), def_field in existing_fields.items() if definition_id == definition.pk and not name in names]
+            if obsolete:
+                FormDefinitionField.objects.filter(pk__in=obsolete).delete()
+                stats['fields_deleted'] += len(obsolete)
+
+    stats['seconds'] = time.time() - start
+    return stats
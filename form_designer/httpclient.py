@@ -0,0 +1,125 @@
+"""
+A small thread-safe HTTP client that keeps connections to each host open and
+reuses them across requests.
+"""
+
+import errno
+import httplib
+import socket
+import threading
+import urlparse
+
+# errors with which a server that closed an idle connection rejects the
+# next request on it
+STALE_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+
+#==============================================================================
+class HTTPError(Exception):
+    pass
+
+
+
+#------------------------------------------------------------------------------
+def is_stale(error):
+    """
+    Returns True if error means that the server closed the connection
+    without answering, as opposed to a timeout or an invalid response, after
+    which the request may well have been processed.
+    """
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, httplib.BadStatusLine):
+        # raised with an empty line, or a message about it, if no bytes
+        # were received
+        return error.line in ("''", '""') or 'closed the connection' in error.line
+    return isinstance(error, socket.error) and error.errno in STALE_ERRNOS
+
+
+
+#==============================================================================
+class ConnectionPool(object):
+    """
+    Keeps up to max_idle idle keep-alive connections per (scheme, host, port).
+    """
+
+    def __init__(self, timeout=10, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def get_connection(self, key):
+        self.lock.acquire()
+        try:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop()
+        finally:
+            self.lock.release()
+        scheme, host, port = key
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout)
+
+    #--------------------------------------------------------------------------
+    def release_connection(self, key, connection):
+        self.lock.acquire()
+        try:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        finally:
+            self.lock.release()
+        connection.close()
+
+    #--------------------------------------------------------------------------
+    def request(self, method, url, body=None, headers=None):
+        """
+        Performs a request and returns (status, response body). Raises
+        HTTPError if no response could be obtained.
+        """
+        parts = urlparse.urlsplit(url)
+        if not parts.scheme in ('http', 'https') or not parts.hostname:
+            raise HTTPError('Unsupported URL "%s"' % url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        # a pooled connection may have been closed by the server in the
+        # meantime, so a reused connection that was closed before any
+        # response arrived is retried once on a fresh one
+        for attempt in (1, 2):
+            connection = self.get_connection(key)
+            reused = connection.sock is not None
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+            except (httplib.HTTPException, IOError) as error:
+                connection.close()
+                if reused and attempt == 1 and is_stale(error):
+                    continue
+                raise HTTPError('%s %s failed: %s' % (method, url, error))
+            try:
+                data = response.read()
+            except (httplib.HTTPException, IOError) as error:
+                connection.close()
+                raise HTTPError('%s %s failed: %s' % (method, url, error))
+            if response.will_close:
+                connection.close()
+            else:
+                self.release_connection(key, connection)
+            return response.status, data
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        self.lock.acquire()
+        try:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+        finally:
+            self.lock.release()
@@ -0,0 +1,410 @@
+"""
+Load generation against the form views, used by the loadtest_forms
+management command.
+
+Requests are made in-process with the Django test client, so middleware,
+views, templates and the database are all exercised without a web server.
+The "plugin" operation calls process_form() and renders the form template
+the way the Django CMS plugin does, without going through a CMS page.
+
+Each worker thread sends its share of the requests, picking operations at
+random according to the configured mix, and records the latency, the number
+of database queries (counted with DEBUG enabled for the duration of the run)
+and whether the request failed.
+"""
+
+import datetime
+import math
+import multiprocessing
+import random
+import threading
+import time
+import urllib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.template.loader import render_to_string
+from django.test.client import Client, FakePayload, encode_multipart, BOUNDARY, MULTIPART_CONTENT
+from form_designer import app_settings, partitions, steps
+from form_designer.models import FormDefinition, FormDefinitionField, FormSubmission
+from form_designer.uploads import FILE_FIELD_CLASSES
+
+OPERATIONS = ('render', 'valid', 'invalid', 'export', 'plugin')
+DEFAULT_MIX = 'render=50,valid=35,invalid=10,export=5'
+
+SYNTHETIC_PREFIX = 'loadtest-'
+# field class and attributes of the fields of synthetic definitions, used in
+# turn
+SYNTHETIC_FIELDS = (
+    ('forms.CharField', {'max_length': 100}),
+    ('forms.EmailField', {}),
+    ('forms.IntegerField', {'min_value': 0, 'max_value': 150}),
+    ('forms.ChoiceField', {}),
+    ('forms.BooleanField', {'required': False}),
+    ('forms.DateField', {}),
+    ('forms.CharField', {'widget': 'widgets.Textarea', 'required': False}),
+)
+SYNTHETIC_CHOICES = [(u'a', u'Option A'), (u'b', u'Option B'), (u'c', u'Option C')]
+
+CHOICE_FIELD_CLASSES = ('forms.ChoiceField', 'forms.MultipleChoiceField', 'forms.ModelChoiceField', 'forms.ModelMultipleChoiceField')
+
+
+#------------------------------------------------------------------------------
+def parse_mix(text):
+    """
+    Parses a mix like "render=50,valid=40,invalid=10" into a list of
+    (operation, weight) pairs.
+    """
+    mix = []
+    for item in text.split(','):
+        operation, separator, weight = item.strip().partition('=')
+        if not operation in OPERATIONS:
+            raise ValueError('Unknown operation "%s", expected one of %s' % (operation, ', '.join(OPERATIONS)))
+        try:
+            weight = float(weight or 1)
+        except ValueError:
+            raise ValueError('Invalid weight for "%s"' % operation)
+        if weight > 0:
+            mix.append((operation, weight))
+    if not mix:
+        raise ValueError('The mix does not contain any operation')
+    return mix
+
+
+#------------------------------------------------------------------------------
+def percentile(values, fraction):
+    """
+    Returns the value below which fraction of the sorted values lie (nearest
+    rank).
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(math.ceil(fraction * len(values))) - 1))
+    return values[index]
+
+
+#------------------------------------------------------------------------------
+def create_definitions(count, field_count):
+    """
+    Creates count form definitions with field_count fields each.
+    """
+    definitions = []
+    for index in range(count):
+        definition = FormDefinition.objects.create(name='%s%d' % (SYNTHETIC_PREFIX, index), title='Load test %d' % index, log_data=True)
+        for position in range(field_count):
+            field_class, attributes = SYNTHETIC_FIELDS[position % len(SYNTHETIC_FIELDS)]
+            def_field = FormDefinitionField(form_definition=definition, name='field%d' % position, label='Field %d' % position,
+                field_class=field_class, position=position)
+            for name, value in attributes.items():
+                setattr(def_field, name, value)
+            def_field.save()
+            if field_class == 'forms.ChoiceField':
+                def_field.set_choices(SYNTHETIC_CHOICES)
+        definitions.append(definition)
+    return definitions
+
+
+#------------------------------------------------------------------------------
+def delete_definitions(definitions):
+    """
+    Deletes the given definitions along with their submissions.
+    """
+    partitions.delete_submissions(FormSubmission.objects.filter(definition__in=definitions))
+    for definition in definitions:
+        for def_field in definition.fields.all():
+            def_field.set_choices([])
+        definition.delete()
+
+
+#------------------------------------------------------------------------------
+def sample_value(def_field, index, choices=None):
+    """
+    Returns a valid raw value for def_field, or None if none can be made up.
+    choices are the values to pick from for choice fields.
+    """
+    field_class = def_field.field_class
+    if field_class in CHOICE_FIELD_CLASSES:
+        return [choices[index % len(choices)]] if choices else None
+    if field_class == 'forms.EmailField':
+        return [u'user%d@example.com' % index]
+    if field_class == 'forms.URLField':
+        return [u'http://example.com/%d' % index]
+    if field_class in ('forms.IntegerField', 'forms.DecimalField'):
+        low = int(def_field.min_value or 0)
+        high = int(def_field.max_value if def_field.max_value is not None else low + 100)
+        return [unicode(low + index % max(high - low, 1))]
+    if field_class == 'forms.BooleanField':
+        return [u'on']
+    if field_class == 'forms.DateField':
+        return [unicode(datetime.date(2000, 1, 1) + datetime.timedelta(days=index % 3650))]
+    if field_class == 'forms.DateTimeField':
+        return [u'2000-01-01 12:00:00']
+    if field_class == 'forms.TimeField':
+        return [u'12:00']
+    if field_class == 'forms.RegexField':
+        return [def_field.initial] if def_field.initial else None
+    if field_class in FILE_FIELD_CLASSES:
+        return None
+    length = max(def_field.min_length or 0, min(def_field.max_length or 40, 40))
+    return [(u'Load test %d ' % index * (length // 10 + 1))[:length] or u'x']
+
+
+
+#==============================================================================
+class Target(object):
+    """
+    A form definition under test, with everything needed to build requests
+    for it loaded up front.
+    """
+
+    def __init__(self, form_definition):
+        self.form_definition = form_definition
+        self.def_fields = list(form_definition.fields.all())
+        self.pages = steps.get_pages(self.def_fields)
+        self.choices = dict([(def_field.name, [unicode(choice.value) for choice in def_field.get_choices()])
+            for def_field in self.def_fields if def_field.field_class in CHOICE_FIELD_CLASSES])
+        self.submit_flag_name = form_definition.submit_flag_name
+        self.steps_field_name = form_definition.steps_field_name
+        self._url = None
+        self.template = form_definition.form_template_name or app_settings.get('FORM_DESIGNER_DEFAULT_FORM_TEMPLATE')
+
+    #--------------------------------------------------------------------------
+    @property
+    def url(self):
+        if self._url is None:
+            self._url = reverse('form_designer_detail', kwargs={'object_name': self.form_definition.name})
+        return self._url
+
+    #--------------------------------------------------------------------------
+    def get_data(self, index, valid=True):
+        """
+        Returns POST data for a submission. Multi-step definitions are
+        submitted on their last page, carrying the earlier pages in a signed
+        payload.
+        """
+        values = {}
+        for def_field in self.def_fields:
+            value = sample_value(def_field, index, self.choices.get(def_field.name))
+            if value is not None:
+                values[def_field.name] = value
+        if not valid:
+            # leave out a required value, or else send text to a field that
+            # expects something else
+            required = [def_field.name for def_field in self.def_fields if def_field.required]
+            typed = [def_field.name for def_field in self.def_fields if def_field.field_class in ('forms.EmailField', 'forms.IntegerField', 'forms.DecimalField', 'forms.DateField')]
+            if required:
+                values[required[index % len(required)]] = [u'']
+            elif typed:
+                values[typed[index % len(typed)]] = [u'not valid']
+        data = {self.submit_flag_name: u'1'}
+        if len(self.pages) > 1:
+            step_data = []
+            for page in self.pages[:-1]:
+                names = [def_field.name for def_field in self.def_fields if steps.get_page(def_field, self.pages) == page]
+                step_data.append((page, dict([(name, values.pop(name)) for name in names if name in values])))
+            data[self.steps_field_name] = steps.sign(self.form_definition, self.pages[-1], step_data)
+        for name, value in values.items():
+            data[name] = value if len(value) > 1 else value[0]
+        return data
+
+
+
+#------------------------------------------------------------------------------
+def build_request(method, data):
+    """
+    Returns a WSGIRequest like the one the CMS would pass to the plugin.
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': '/',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': 'http',
+    }
+    if method == 'GET':
+        environ.update({'QUERY_STRING': urllib.urlencode(data, True), 'wsgi.input': FakePayload('')})
+    else:
+        body = encode_multipart(BOUNDARY, data)
+        environ.update({'QUERY_STRING': '', 'CONTENT_TYPE': MULTIPART_CONTENT, 'CONTENT_LENGTH': len(body), 'wsgi.input': FakePayload(body)})
+    return WSGIRequest(environ)
+
+
+
+#==============================================================================
+class LoadTest(object):
+    """
+    Runs requests against targets and collects (operation, seconds, queries,
+    error) tuples in results.
+    """
+
+    def __init__(self, targets, mix, credentials=None, seed=None):
+        self.targets = targets
+        self.mix = mix
+        self.credentials = credentials
+        self.seed = seed if seed is not None else int(time.time())
+        self.results = []
+        self.lock = threading.Lock()
+        self.export_url = reverse('form_designer_export_csv') if 'export' in dict(mix) else None
+
+    #--------------------------------------------------------------------------
+    def choose(self, rng):
+        point = rng.uniform(0, sum([weight for operation, weight in self.mix]))
+        for operation, weight in self.mix:
+            point -= weight
+            if point <= 0:
+                break
+        return operation
+
+    #--------------------------------------------------------------------------
+    def request(self, client, operation, target, data):
+        """
+        Performs one operation, posting data if it is not None. Returns an
+        error description, or None.
+        """
+        if operation == 'render':
+            response = client.get(target.url)
+        elif operation in ('valid', 'invalid'):
+            response = client.post(target.url, data)
+        elif operation == 'export':
+            response = client.get(self.export_url, {'definition__id__exact': target.form_definition.pk})
+        else:
+            from form_designer.views import process_form
+            request = build_request(data is None and 'GET' or 'POST', data or {})
+            context = process_form(request, target.form_definition, {}, is_cms_plugin=True)
+            render_to_string(target.template, context)
+            return None
+        if response.status_code >= 400:
+            return 'HTTP %d' % response.status_code
+        return None
+
+    #--------------------------------------------------------------------------
+    def work(self, number, count):
+        rng = random.Random(self.seed + number)
+        client = Client()
+        if self.credentials:
+            client.login(**self.credentials)
+        results = []
+        for sequence in range(count):
+            operation = self.choose(rng)
+            target = rng.choice(self.targets)
+            index = number * count + sequence
+            data = None
+            # half of the plugin requests render the form, half submit it
+            if operation in ('valid', 'invalid') or (operation == 'plugin' and index % 2):
+                data = target.get_data(index, operation != 'invalid')
+            for connection in connections.all():
+                connection.queries = []
+            start = time.time()
+            try:
+                error = self.request(client, operation, target, data)
+            except Exception as exception:
+                error = '%s: %s' % (exception.__class__.__name__, exception)
+            seconds = time.time() - start
+            queries = sum([len(connection.queries) for connection in connections.all()])
+            results.append((operation, seconds, queries, error))
+        for connection in connections.all():
+            connection.close()
+        self.lock.acquire()
+        try:
+            self.results.extend(results)
+        finally:
+            self.lock.release()
+
+    #--------------------------------------------------------------------------
+    def run(self, requests, concurrency):
+        """
+        Sends requests spread over concurrency threads. Returns the elapsed
+        time in seconds.
+        """
+        debug = settings.DEBUG
+        # queries are only recorded in debug mode
+        settings.DEBUG = True
+        try:
+            threads = []
+            for number in range(concurrency):
+                count = requests // concurrency + (1 if number < requests % concurrency else 0)
+                threads.append(threading.Thread(target=self.work, args=(number, count), name='form-designer-loadtest-%d' % number))
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return time.time() - start
+        finally:
+            settings.DEBUG = debug
+
+
+
+#------------------------------------------------------------------------------
+def _run_process(args):
+    names, mix, credentials, seed, requests, concurrency = args
+    targets = [Target(form_definition) for form_definition in FormDefinition.objects.filter(name__in=names)]
+    load_test = LoadTest(targets, mix, credentials, seed)
+    load_test.run(requests, concurrency)
+    return load_test.results
+
+
+#------------------------------------------------------------------------------
+def run_processes(names, mix, credentials, seed, requests, concurrency, processes):
+    """
+    Runs the load test in several processes with concurrency threads each,
+    to get around the global interpreter lock. Returns the results and the
+    elapsed time in seconds.
+    """
+    # the processes must not share the parent's database connections
+    for connection in connections.all():
+        connection.close()
+    pool = multiprocessing.Pool(processes)
+    start = time.time()
+    try:
+        parts = pool.map(_run_process, [(names, mix, credentials, seed + number * concurrency,
+            requests // processes + (1 if number < requests % processes else 0), concurrency) for number in range(processes)])
+    finally:
+        pool.terminate()
+    elapsed = time.time() - start
+    return [result for part in parts for result in part], elapsed
+
+
+#------------------------------------------------------------------------------
+def summarize(results, elapsed):
+    """
+    Returns a list of dictionaries with statistics per operation, followed
+    by the totals.
+    """
+    rows = []
+    operations = [operation for operation in OPERATIONS if operation in set([result[0] for result in results])]
+    for operation in operations + [None]:
+        selected = [result for result in results if operation is None or result[0] == operation]
+        latencies = sorted([result[1] for result in selected])
+        rows.append({
+            'operation': operation or 'total',
+            'requests': len(selected),
+            'errors': len([result for result in selected if result[3]]),
+            'throughput': len(selected) / elapsed if elapsed else 0.0,
+            'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+            'queries': float(sum([result[2] for result in selected])) / len(selected) if selected else 0.0,
+        })
+    return rows
+
+
+#------------------------------------------------------------------------------
+def create_staff_user():
+    """
+    Creates a superuser for the export requests. Returns the user and the
+    credentials to log in with.
+    """
+    password = '%x' % random.getrandbits(64)
+    user = User.objects.create_user('%sadmin-%x' % (SYNTHETIC_PREFIX, random.getrandbits(32)), 'loadtest@example.com', password)
+    user.is_staff = user.is_superuser = True
+    user.save()
+    return user, {'username': user.username, 'password': password}
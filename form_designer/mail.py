@@ -0,0 +1,34 @@
+"""
+Sending of notification mails outside the request/response cycle.
+"""
+
+import threading
+
+from django.core.mail import send_mail
+from form_designer import app_settings
+from form_designer.workers import WorkerPool
+
+_lock = threading.Lock()
+_pool = None
+
+
+#------------------------------------------------------------------------------
+def get_pool():
+    global _pool
+    _lock.acquire()
+    try:
+        if _pool is None:
+            _pool = WorkerPool('form-designer-mail', app_settings.get('FORM_DESIGNER_MAIL_WORKERS'), app_settings.get('FORM_DESIGNER_MAIL_QUEUE_SIZE'))
+    finally:
+        _lock.release()
+    return _pool
+
+
+#------------------------------------------------------------------------------
+def send_in_background(subject, message, from_email, recipient_list):
+    """
+    Queues a mail for sending by a worker thread. If the queue is full, the
+    mail is sent right away instead of being dropped.
+    """
+    if not get_pool().submit(send_mail, subject, message, from_email, recipient_list, fail_silently=False):
+        send_mail(subject, message, from_email, recipient_list, fail_silently=False)
@@ -0,0 +1,10 @@
+from django.db.models import signals
+from form_designer import models as form_designer_models
+
+
+def create_search_index(sender, **kwargs):
+    # the FTS tables are not models, so syncdb doesn't create them
+    from form_designer.search import setup
+    setup(kwargs.get('db', 'default'))
+
+signals.post_syncdb.connect(create_search_index, sender=form_designer_models)
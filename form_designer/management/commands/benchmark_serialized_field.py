@@ -0,0 +1,75 @@
+"""
+Compares the storage size and encode/decode throughput of the legacy
+PickledObjectField format with SerializedObjectField's JSON format.
+"""
+
+import base64
+import datetime
+import decimal
+import sys
+import time
+from optparse import make_option
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.management.base import BaseCommand
+from form_designer import app_settings
+from form_designer import serialized_field
+
+
+def sample_payloads():
+    small = [
+        {'name': 'name', 'label': u'Name', 'value': u'Jane Doe'},
+        {'name': 'email', 'label': u'E-mail address', 'value': u'jane@example.com'},
+        {'name': 'subscribe', 'label': u'Subscribe', 'value': True},
+    ]
+    large = []
+    for i in range(100):
+        large.append({'name': 'field_%d' % i, 'label': u'Field %d' % i, 'value': u'Some submitted text for field %d. ' % i * 5})
+        large.append({'name': 'date_%d' % i, 'label': u'Date %d' % i, 'value': datetime.date(2010, 1, 1 + i % 28)})
+        large.append({'name': 'amount_%d' % i, 'label': u'Amount %d' % i, 'value': decimal.Decimal('%d.50' % i)})
+    return (('small form (3 fields)', small), ('large form (300 fields)', large))
+
+
+def pickle_dumps(value):
+    return base64.b64encode(pickle.dumps(value))
+
+
+def pickle_loads(data):
+    return pickle.loads(base64.b64decode(data))
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks pickled vs. serialized JSON field encoding.'
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', dest='iterations', type='int', default=2000,
+            help='Number of encode/decode rounds per payload and format.'),
+    )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        threshold = app_settings.get('FORM_DESIGNER_SERIALIZED_FIELD_COMPRESS_THRESHOLD')
+        formats = (
+            ('pickle+base64', pickle_dumps, pickle_loads),
+            ('json', lambda value: serialized_field.dumps(value), serialized_field.loads),
+            ('json+zlib', lambda value: serialized_field.dumps(value, threshold), serialized_field.loads),
+        )
+
+        sys.stdout.write('%-24s %-14s %10s %14s %14s\n' % ('payload', 'format', 'bytes', 'encode/s', 'decode/s'))
+        for payload_name, payload in sample_payloads():
+            for format_name, dumps, loads in formats:
+                start = time.time()
+                for i in xrange(iterations):
+                    data = dumps(payload)
+                encode_time = time.time() - start
+
+                start = time.time()
+                for i in xrange(iterations):
+                    loads(data)
+                decode_time = time.time() - start
+
+                sys.stdout.write('%-24s %-14s %10d %14.0f %14.0f\n' % (payload_name, format_name, len(data),
+                    iterations / max(encode_time, 1e-9), iterations / max(decode_time, 1e-9)))
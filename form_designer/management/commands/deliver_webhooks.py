@@ -0,0 +1,34 @@
+"""
+Sends pending webhook deliveries. Run it from cron, or keep it running with
+--loop.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from form_designer import app_settings
+from form_designer.webhooks import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued form submissions to their webhooks.'
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=None,
+            help='Number of delivery threads (default: FORM_DESIGNER_WEBHOOK_WORKERS).'),
+        make_option('--limit', dest='limit', type='int', default=1000,
+            help='Maximum number of deliveries per run.'),
+        make_option('--loop', dest='loop', type='float', default=None,
+            help='Keep running, waiting this many seconds between runs.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        while True:
+            delivered, failed = deliver_pending(options['workers'] or app_settings.get('FORM_DESIGNER_WEBHOOK_WORKERS'), options['limit'])
+            if verbosity > 1 or (verbosity and (delivered or failed)):
+                sys.stdout.write('Delivered %d, failed %d\n' % (delivered, failed))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
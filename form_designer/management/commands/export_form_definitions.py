@@ -0,0 +1,55 @@
+"""
+Exports form definitions with their fields and choices as JSON or YAML, for
+loading into another installation with import_form_definitions.
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+from form_designer.exchange import export_definitions
+from form_designer.models import FormDefinition
+
+
+class Command(BaseCommand):
+    args = '[name name ...]'
+    help = 'Exports form definitions (all, or the ones named).'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='json',
+            help='json (default) or yaml.'),
+        make_option('--output', '-o', dest='output', default=None,
+            help='File to write to (default: standard output).'),
+        make_option('--indent', dest='indent', type='int', default=2,
+            help='Indentation of the output.'),
+    )
+
+    def handle(self, *args, **options):
+        queryset = FormDefinition.objects.all()
+        if args:
+            queryset = queryset.filter(name__in=args)
+            missing = set(args) - set(queryset.values_list('name', flat=True))
+            if missing:
+                raise CommandError('Unknown form definitions: %s' % ', '.join(sorted(missing)))
+        document = export_definitions(queryset)
+
+        if options['format'] == 'yaml':
+            try:
+                import yaml
+            except ImportError:
+                raise CommandError('YAML output requires PyYAML.')
+            output = yaml.safe_dump(document, indent=options['indent'], default_flow_style=False, allow_unicode=True)
+        elif options['format'] == 'json':
+            output = simplejson.dumps(document, indent=options['indent'], sort_keys=True)
+        else:
+            raise CommandError('Unknown format "%s"' % options['format'])
+
+        if options['output']:
+            stream = open(options['output'], 'w')
+            try:
+                stream.write(output)
+            finally:
+                stream.close()
+            sys.stderr.write('Exported %d form definitions\n' % len(document['definitions']))
+        else:
+            sys.stdout.write(output)
@@ -0,0 +1,40 @@
+"""
+Writes buffered form submissions to the database. Run it from cron, or keep
+it running with --loop. Only one flusher should run per buffer file.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from form_designer import app_settings
+from form_designer.buffer import get_buffer
+
+
+class Command(BaseCommand):
+    help = 'Moves buffered form submissions to the database in batches.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=None,
+            help='Submissions per transaction (default: FORM_DESIGNER_BUFFER_FLUSH_SIZE).'),
+        make_option('--loop', dest='loop', type='float', default=None,
+            help='Keep running, waiting this many seconds whenever the buffer is empty.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options['batch_size'] or app_settings.get('FORM_DESIGNER_BUFFER_FLUSH_SIZE')
+        spool = get_buffer()
+        while True:
+            total = 0
+            start = time.time()
+            while True:
+                written = spool.flush(batch_size)
+                total += written
+                if written < batch_size:
+                    break
+            if verbosity > 1 or (verbosity and total):
+                sys.stdout.write('Flushed %d submissions in %.2fs\n' % (total, time.time() - start))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,52 @@
+"""
+Imports form definitions exported with export_form_definitions. Existing
+definitions are matched by name and only changed values are written; the
+whole import runs in one transaction.
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+from form_designer.exchange import ExchangeError, import_definitions
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Creates or updates form definitions from an export file.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default=None,
+            help='json or yaml (default: guessed from the file name).'),
+        make_option('--prune', dest='prune', action='store_true', default=False,
+            help='Delete fields that are not in the file, including their submitted values.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: import_form_definitions %s' % self.args)
+        path = args[0]
+        format = options['format'] or ('yaml' if path.endswith(('.yaml', '.yml')) else 'json')
+        stream = open(path)
+        try:
+            if format == 'yaml':
+                try:
+                    import yaml
+                except ImportError:
+                    raise CommandError('YAML input requires PyYAML.')
+                document = yaml.safe_load(stream)
+            else:
+                document = simplejson.load(stream)
+        finally:
+            stream.close()
+
+        try:
+            stats = import_definitions(document, prune=options['prune'])
+        except ExchangeError as error:
+            raise CommandError(error)
+
+        if int(options.get('verbosity', 1)):
+            sys.stdout.write('Definitions: %(definitions_created)d created, %(definitions_updated)d updated, %(definitions_unchanged)d unchanged\n'
+                'Fields: %(fields_created)d created, %(fields_updated)d updated, %(fields_unchanged)d unchanged, %(fields_deleted)d deleted\n'
+                'Choice lists updated: %(choices_updated)d\n'
+                'Finished in %(seconds).2fs\n' % stats)
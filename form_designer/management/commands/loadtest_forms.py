@@ -0,0 +1,107 @@
+"""
+Sends a mix of requests to the form views from several threads (and
+optionally processes) and reports throughput, latency percentiles, query
+counts and error rates per kind of request. Use it to compare changes to
+the form pipeline under load, on a database you don't mind filling with
+test submissions.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db.models import Max
+from form_designer import loadtest
+from form_designer.models import FormDefinition, FormSubmission
+
+
+class Command(BaseCommand):
+    help = 'Load-tests the form views with synthetic or existing form definitions.'
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', '-n', dest='requests', type='int', default=1000,
+            help='Total number of requests.'),
+        make_option('--concurrency', '-c', dest='concurrency', type='int', default=4,
+            help='Number of threads sending requests (per process).'),
+        make_option('--processes', dest='processes', type='int', default=1,
+            help='Number of processes, each running --concurrency threads.'),
+        make_option('--mix', dest='mix', default=loadtest.DEFAULT_MIX,
+            help='Weights of the operations %s (default: %s).' % ('/'.join(loadtest.OPERATIONS), loadtest.DEFAULT_MIX)),
+        make_option('--form', dest='forms', action='append', default=[],
+            help='Test an existing form definition (can be repeated) instead of synthetic ones.'),
+        make_option('--definitions', dest='definitions', type='int', default=5,
+            help='Number of synthetic form definitions.'),
+        make_option('--fields', dest='fields', type='int', default=7,
+            help='Number of fields per synthetic form definition.'),
+        make_option('--keep', dest='keep', action='store_true', default=False,
+            help='Keep the synthetic definitions, their submissions and the staff user afterwards.'),
+        make_option('--seed', dest='seed', type='int', default=None,
+            help='Random seed, to repeat the same sequence of requests.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(error)
+        for name in ('requests', 'concurrency', 'processes', 'definitions', 'fields'):
+            if options[name] < 1:
+                raise CommandError('--%s must be positive.' % name)
+
+        if options['forms']:
+            definitions = list(FormDefinition.objects.filter(name__in=options['forms']))
+            missing = set(options['forms']) - set([definition.name for definition in definitions])
+            if missing:
+                raise CommandError('Unknown form definitions: %s' % ', '.join(sorted(missing)))
+            created = []
+        else:
+            if FormDefinition.objects.filter(name__startswith=loadtest.SYNTHETIC_PREFIX).exists():
+                raise CommandError('There are form definitions named "%s*" left over from an earlier run; delete them first.' % loadtest.SYNTHETIC_PREFIX)
+            definitions = created = loadtest.create_definitions(options['definitions'], options['fields'])
+
+        user = credentials = None
+        if 'export' in dict(mix):
+            user, credentials = loadtest.create_staff_user()
+        last_submission = FormSubmission.objects.aggregate(Max('pk'))['pk__max'] or 0
+        seed = options['seed'] if options['seed'] is not None else int(time.time())
+        try:
+            try:
+                # fail early if the URLs are not included
+                reverse('form_designer_detail', kwargs={'object_name': definitions[0].name})
+                if 'export' in dict(mix):
+                    reverse('form_designer_export_csv')
+                if options['processes'] > 1:
+                    results, elapsed = loadtest.run_processes([definition.name for definition in definitions], mix, credentials, seed,
+                        options['requests'], options['concurrency'], options['processes'])
+                else:
+                    load_test = loadtest.LoadTest([loadtest.Target(definition) for definition in definitions], mix, credentials, seed)
+                    elapsed = load_test.run(options['requests'], options['concurrency'])
+                    results = load_test.results
+            except NoReverseMatch as error:
+                raise CommandError('%s. Include form_designer.urls (and form_designer.admin_urls for exports) in your URLconf.' % error)
+            logged = FormSubmission.objects.filter(pk__gt=last_submission).count()
+        finally:
+            if not options['keep']:
+                if created:
+                    loadtest.delete_definitions(created)
+                if user:
+                    user.delete()
+
+        sys.stdout.write('%d requests in %.2fs with %d process(es) x %d thread(s), seed %d\n\n' % (
+            len(results), elapsed, options['processes'], options['concurrency'], seed))
+        sys.stdout.write('%-8s %8s %7s %9s %9s %9s %9s %9s %9s %8s\n' % ('', 'requests', 'errors', 'req/s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'queries'))
+        for row in loadtest.summarize(results, elapsed):
+            sys.stdout.write('%-8s %8d %6.1f%% %9.1f %9.1f %9.1f %9.1f %9.1f %9.1f %8.1f\n' % (row['operation'], row['requests'],
+                100.0 * row['errors'] / row['requests'] if row['requests'] else 0.0, row['throughput'],
+                row['mean'] * 1000, row['p50'] * 1000, row['p90'] * 1000, row['p99'] * 1000, row['max'] * 1000, row['queries']))
+        sys.stdout.write('\nSubmissions logged: %d\n' % logged)
+
+        errors = {}
+        for operation, seconds, queries, error in results:
+            if error:
+                errors[(operation, error)] = errors.get((operation, error), 0) + 1
+        if errors and int(options.get('verbosity', 1)):
+            sys.stdout.write('\nErrors:\n')
+            for (operation, error), count in sorted(errors.items(), key=lambda item: -item[1])[:20]:
+                sys.stdout.write('%6d  %-8s %s\n' % (count, operation, error))
@@ -0,0 +1,81 @@
+"""
+Converts a column written by PickledObjectField to the SerializedObjectField
+format in batches. Change the model field to SerializedObjectField first; rows
+already in the new format are skipped, so the command can be re-run safely.
+"""
+
+import base64
+import sys
+from optparse import make_option
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from form_designer.serialized_field import is_serialized
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName> <field_name>'
+    help = 'Converts base64 pickled values of a model field to serialized JSON.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=500,
+            help='Number of rows converted per transaction.'),
+        make_option('--dry-run', dest='dry_run', action='store_true', default=False,
+            help='Decode all rows and report, but do not write anything.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: migrate_pickled_fields %s' % self.args)
+        try:
+            app_label, model_name = args[0].split('.')
+        except ValueError:
+            raise CommandError('Model must be given as app_label.ModelName')
+        model = models.get_model(app_label, model_name)
+        if model is None:
+            raise CommandError('Unknown model "%s"' % args[0])
+        field_name = args[1]
+        if not field_name in [field.name for field in model._meta.fields]:
+            raise CommandError('%s has no field "%s"' % (args[0], field_name))
+
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        manager = model._default_manager
+        converted = skipped = failed = 0
+        last_pk = None
+
+        while True:
+            queryset = manager.order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            # values_list returns the raw column, bypassing field decoding
+            rows = list(queryset.values_list('pk', field_name)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            updates = []
+            for pk, raw in rows:
+                if raw is None or is_serialized(raw):
+                    skipped += 1
+                    continue
+                try:
+                    updates.append((pk, pickle.loads(base64.b64decode(raw))))
+                except Exception as error:
+                    failed += 1
+                    sys.stderr.write('Could not decode %s pk=%s: %s\n' % (args[0], pk, error))
+
+            if not dry_run:
+                self.write_batch(manager, field_name, updates)
+            converted += len(updates)
+
+        sys.stdout.write('%s %d rows, skipped %d, failed %d\n' % ('Would convert' if dry_run else 'Converted', converted, skipped, failed))
+
+    @transaction.commit_on_success
+    def write_batch(self, manager, field_name, updates):
+        for pk, value in updates:
+            manager.filter(pk=pk).update(**{field_name: value})
@@ -0,0 +1,55 @@
+"""
+Deletes old form submissions. Month partitions that lie entirely before the
+cutoff are dropped as a whole; other submissions are deleted in batches.
+"""
+
+import datetime
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from form_designer import partitions
+from form_designer.models import FormDefinition
+
+
+class Command(BaseCommand):
+    help = 'Deletes submissions created before a date (YYYY-MM-DD or YYYY-MM).'
+    args = '--before=<date>'
+    option_list = BaseCommand.option_list + (
+        make_option('--before', dest='before', default=None,
+            help='Delete submissions created before this date.'),
+        make_option('--days', dest='days', type='int', default=None,
+            help='Delete submissions older than this many days, instead of --before.'),
+        make_option('--form', dest='form', default=None,
+            help='Only delete the submissions of the form definition with this name.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=1000,
+            help='Number of submissions deleted per transaction.'),
+        make_option('--database', dest='database', default='default',
+            help='Database whose submissions are deleted.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            before = datetime.datetime.now() - datetime.timedelta(days=options['days'])
+        elif options['before']:
+            try:
+                parts = [int(part) for part in options['before'].split('-')]
+                before = datetime.datetime(*(parts + [1] * (3 - len(parts))))
+            except (ValueError, TypeError):
+                raise CommandError('Invalid date "%s"' % options['before'])
+        else:
+            raise CommandError('Either --before or --days is required.')
+        definition = None
+        if options['form']:
+            try:
+                definition = FormDefinition.objects.using(options['database']).get(name=options['form'])
+            except FormDefinition.DoesNotExist:
+                raise CommandError('Unknown form definition "%s"' % options['form'])
+
+        start = time.time()
+        dropped, deleted = partitions.prune(before, definition, options['batch_size'], options['database'])
+        if int(options.get('verbosity', 1)):
+            for key in dropped:
+                sys.stdout.write('Dropped partition %s\n' % key)
+            sys.stdout.write('Deleted %d further submissions in %.2fs\n' % (deleted, time.time() - start))
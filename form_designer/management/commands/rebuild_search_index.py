@@ -0,0 +1,30 @@
+"""
+Rebuilds the full-text index of form submissions from scratch.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from form_designer import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index of form submissions.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=1000,
+            help='Number of submissions read and indexed at a time.'),
+        make_option('--database', dest='database', default='default',
+            help='Database whose submissions are indexed.'),
+    )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        # creates the index tables if syncdb has not done so
+        search.setup(options['database'])
+        # one transaction, so searches keep working on the old index until
+        # the new one is complete
+        count = transaction.commit_on_success(using=options['database'])(search.rebuild)(options['batch_size'], options['database'])
+        sys.stdout.write('Indexed %d submissions in %.2fs\n' % (count, time.time() - start))
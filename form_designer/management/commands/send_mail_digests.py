@@ -0,0 +1,30 @@
+"""
+Sends digest mails for form definitions that have a digest interval or size.
+Run it from cron at least as often as the shortest digest interval, or keep
+it running with --loop.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from form_designer.digest import send_due_digests
+
+
+class Command(BaseCommand):
+    help = 'Sends collected form submissions as digest mails.'
+    option_list = BaseCommand.option_list + (
+        make_option('--loop', dest='loop', type='float', default=None,
+            help='Keep running, waiting this many seconds between runs.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        while True:
+            messages, entries = send_due_digests()
+            if verbosity > 1 or (verbosity and messages):
+                sys.stdout.write('Sent %d digests containing %d submissions\n' % (messages, entries))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
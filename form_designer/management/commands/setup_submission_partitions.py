@@ -0,0 +1,66 @@
+"""
+Prepares existing submissions for partitioning: stores the form definition
+and partition key with submissions logged before they existed, and on
+PostgreSQL converts the submission tables to natively partitioned tables.
+Run it after changing FORM_DESIGNER_PARTITIONING, during a maintenance
+window, as the conversion copies all partitioned submissions.
+
+The conversion refuses to run while foreign keys point to the submission
+tables, since they cannot be kept; pass --drop-foreign-keys to drop them.
+
+Once the tables are partitioned, the command creates the partitions of all
+form definitions for the coming months. Run it regularly from cron with
+--partitions-only: monthly for month partitions, and more often with
+definition partitions, as submissions of forms created since the last run
+are stored in the default partition until then.
+"""
+
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from form_designer import partitions
+
+
+class Command(BaseCommand):
+    help = 'Backfills partition keys, sets up native partitioning where available and creates upcoming partitions.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int', default=1000,
+            help='Number of submissions updated at a time.'),
+        make_option('--database', dest='database', default='default',
+            help='Database whose submissions are partitioned.'),
+        make_option('--backfill-only', dest='backfill_only', action='store_true', default=False,
+            help='Only store definitions and partition keys, leave the tables as they are.'),
+        make_option('--partitions-only', dest='partitions_only', action='store_true', default=False,
+            help='Only create the partitions of the coming months.'),
+        make_option('--months-ahead', dest='months_ahead', type='int', default=None,
+            help='Number of months ahead to create partitions for (default: FORM_DESIGNER_PARTITION_MONTHS_AHEAD).'),
+        make_option('--drop-foreign-keys', dest='drop_foreign_keys', action='store_true', default=False,
+            help='Drop foreign keys that point to the submission tables instead of refusing to convert them.'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['partitions_only']:
+            start = time.time()
+            count = partitions.backfill(options['batch_size'], options['database'])
+            sys.stdout.write('Updated %d submissions in %.2fs\n' % (count, time.time() - start))
+        if options['backfill_only'] or not partitions.get_scheme():
+            return
+        backend = partitions.get_backend(options['database'])
+        if not options['partitions_only']:
+            start = time.time()
+            try:
+                converted = backend.setup(options['drop_foreign_keys'])
+            except partitions.PartitioningError as e:
+                raise CommandError(e)
+            if converted:
+                sys.stdout.write('Converted the submission tables to %d partitions in %.2fs\n' % (len(backend.list()), time.time() - start))
+            elif backend.native:
+                sys.stdout.write('The submission tables are already partitioned\n')
+        if not backend.native:
+            sys.stdout.write('This database does not support native partitioning; partitions are kept in the same tables\n')
+            return
+        start = time.time()
+        created = partitions.create_partitions(months_ahead=options['months_ahead'], using=options['database'])
+        sys.stdout.write('Created %d partitions in %.2fs\n' % (len(created), time.time() - start))
@@ -2,10 +2,12 @@ from django.db import models
 from django.utils.translation import ugettext, ugettext_lazy as _
 from django.forms import widgets
 from django.core.mail import send_mail
+from django.core.files.uploadedfile import UploadedFile
 from django.conf import settings
 from form_designer import app_settings
 import re
-from form_designer.pickled_object_field import PickledObjectField
+import datetime
+from form_designer.serialized_field import SerializedObjectField
 from form_designer.model_name_field import ModelNameField
 from form_designer.template_field import TemplateTextField, TemplateCharField
 
@@ -19,9 +21,12 @@ class FormDefinition(models.Model):
     name = models.SlugField(_('Name'), max_length=255, unique=True)
     title = models.CharField(_('Title'), max_length=255, blank=True, null=True)
     action = models.URLField(_('Target URL'), help_text=_('If you leave this empty, the page where the form resides will be requested, and you can use the mail form and logging features. You can also send data to external sites: For instance, enter "http://www.google.ch/search" to create a search form.'), max_length=255, blank=True, null=True)
+    relay_action = models.BooleanField(_('Relay to target URL'), help_text=_('Submit the form to this site first, so that it is validated, logged and mailed, and then forward the submitted data to the target URL in the background.'), default=False)
     mail_to = TemplateCharField(_('Send form data to e-mail address'), help_text=('Separate several addresses with a comma. Your form fields are available as template context. Example: "admin@domain.com, {{ from_email }}" if you have a field named `from_email`.'), max_length=255, blank=True, null=True)
     mail_from = TemplateCharField(_('Sender address'), max_length=255, help_text=('Your form fields are available as template context. Example: "{{ firstname }} {{ lastname }} <{{ from_email }}>" if you have fields named `first_name`, `last_name`, `from_email`.'), blank=True, null=True)
     mail_subject = TemplateCharField(_('e-Mail subject'), max_length=255, help_text=('Your form fields are available as template context. Example: "Contact form {{ subject }}" if you have a field named `subject`.'), blank=True, null=True)
+    mail_digest_interval = models.PositiveIntegerField(_('Digest interval'), help_text=_('In minutes. If set, submissions are collected and mailed together at most once per interval, instead of one e-mail per submission.'), blank=True, null=True)
+    mail_digest_size = models.PositiveIntegerField(_('Digest size'), help_text=_('If set, collected submissions are mailed as soon as there are this many of them.'), blank=True, null=True)
     method = models.CharField(_('Method'), max_length=10, default="POST", choices = (('POST', 'POST'), ('GET', 'GET')))
     success_message = models.CharField(_('Success message'), max_length=255, blank=True, null=True)
     error_message = models.CharField(_('Error message'), max_length=255, blank=True, null=True)
@@ -49,7 +54,14 @@ class FormDefinition(models.Model):
         
         
     #--------------------------------------------------------------------------
-    def get_form_data(self, form):
+    def get_form_data(self, form, store_files=False):
+        """
+        Returns the submitted values as a list of dictionaries. Uploaded
+        files are only saved to storage if store_files is True, as done by
+        log(); the stored reference then replaces the upload in the form's
+        cleaned data for subsequent calls, e.g. by send_mail(). Otherwise,
+        the file name is used.
+        """
         data = []
         field_dict = self.get_field_dict()
         form_keys = form.fields.keys()
@@ -57,6 +69,12 @@ class FormDefinition(models.Model):
         for key in form_keys:
             if key in def_keys and field_dict[key].include_result:
                 value = form.cleaned_data[key]
+                if isinstance(value, UploadedFile):
+                    if store_files:
+                        from form_designer.uploads import store_uploaded_file
+                        value = form.cleaned_data[key] = store_uploaded_file(value)
+                    else:
+                        value = value.name
                 if getattr(value, '__form_data__', False):
                     value = value.__form_data__()
                 data.append({'name': key, 'label': form.fields[key].label, 'value': value})
@@ -86,6 +104,17 @@ class FormDefinition(models.Model):
         return t.render(context)
 
 
+    #--------------------------------------------------------------------------
+    @property
+    def form_action(self):
+        """
+        The URL the browser submits the form to.
+        """
+        if self.relay_action:
+            return ''
+        return self.action or ''
+
+
     #--------------------------------------------------------------------------
     def count_fields(self):
         return self.fields.count()
@@ -100,25 +129,69 @@ class FormDefinition(models.Model):
     #--------------------------------------------------------------------------
     def log(self, form):
         """
-        Saves the form submission.
+        Saves the form submission. With FORM_DESIGNER_BUFFERED_LOGGING
+        enabled, the submission is only buffered and None is returned,
+        unless the buffer is full.
         """
         
-        form_data = self.get_form_data(form)
+        form_data = self.get_form_data(form, store_files=True)
+        if app_settings.get('FORM_DESIGNER_BUFFERED_LOGGING'):
+            from form_designer.buffer import get_buffer
+            if get_buffer().append(self, form_data):
+                return None
         field_dict = self.get_field_dict()
         
+        from form_designer import partitions
+        partition = partitions.get_partition(self.pk, datetime.datetime.now())
+        
         # create a submission
-        submission = FormSubmission()
+        submission = FormSubmission(definition=self, partition=partition)
         submission.save()
         
         # log each field's value individually
         for field_data in form_data:
             field_submission = FormFieldSubmission(submission=submission, definition_field=field_dict[field_data['name']],
-                value=field_data['value'])
+                value=field_data['value'], partition=partition)
             field_submission.save()
+
+        from form_designer.search import index_submissions
+        index_submissions([(submission.pk, [field_data['value'] for field_data in form_data])])
         
         return submission
 
 
+    #--------------------------------------------------------------------------
+    @property
+    def uses_mail_digest(self):
+        return bool(self.mail_digest_interval or self.mail_digest_size)
+
+
+    #--------------------------------------------------------------------------
+    def queue_mail_digest(self, form):
+        """
+        Stores the form data for the next digest mail, which is sent by the
+        send_mail_digests management command.
+        """
+        from form_designer import digest
+        return digest.queue(self, self.get_form_data(form))
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def has_active_webhooks(self):
+        return self.webhooks.filter(active=True).exists()
+
+
+    #--------------------------------------------------------------------------
+    def queue_webhooks(self, form, submission=None):
+        """
+        Adds the form data to the outbox of each active webhook. The actual
+        requests are made by the deliver_webhooks management command.
+        """
+        from form_designer import webhooks
+        return webhooks.queue(self, self.get_form_data(form), submission)
+
+
     #--------------------------------------------------------------------------
     def string_template_replace(self, text, context_dict):
         from django.template import Context, Template, TemplateSyntaxError
@@ -130,9 +203,11 @@ class FormDefinition(models.Model):
 
 
     #--------------------------------------------------------------------------
-    def send_mail(self, form):
-        form_data = self.get_form_data(form)
-        message = self.compile_message(form_data)
+    def get_mail_headers(self, form_data):
+        """
+        Returns the subject, sender and list of recipients for a mail
+        containing form_data.
+        """
         context_dict = self.get_form_data_dict(form_data)
 
         import re 
@@ -144,16 +219,35 @@ class FormDefinition(models.Model):
         if mail_from:
             mail_from = self.string_template_replace(mail_from, context_dict)
         
+        mail_subject = None
         if self.mail_subject:
             mail_subject = self.string_template_replace(self.mail_subject, context_dict)
-        else:
-            mail_subject = self.title
+        if not mail_subject:
+            mail_subject = unicode(self)
+
+        return mail_subject, mail_from, mail_to
+
+
+    #--------------------------------------------------------------------------
+    def send_mail(self, form, background=False):
+        """
+        Mails the form data. If background is True, the message is rendered
+        right away but handed to a worker thread for sending, so the caller
+        does not wait for the mail server.
+        """
+        form_data = self.get_form_data(form)
+        message = self.compile_message(form_data)
+        mail_subject, mail_from, mail_to = self.get_mail_headers(form_data)
         
         import logging
         logging.debug('Mail: '+repr(mail_from)+' --> '+repr(mail_to));
         
-        from django.core.mail import send_mail
-        send_mail(mail_subject, message, mail_from or None, mail_to, fail_silently=False)
+        if background:
+            from form_designer import mail
+            mail.send_in_background(mail_subject, message, mail_from or None, mail_to)
+        else:
+            from django.core.mail import send_mail
+            send_mail(mail_subject, message, mail_from or None, mail_to, fail_silently=False)
 
 
     #--------------------------------------------------------------------------
@@ -163,6 +257,22 @@ class FormDefinition(models.Model):
         while self.fields.filter(name__exact=name).count() > 0:
             name += '_'
         return name
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def steps_field_name(self):
+        """
+        Name of the hidden field carrying the values of completed pages of a
+        multi-step form.
+        """
+        return self.submit_flag_name + '_steps'
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def back_flag_name(self):
+        return self.submit_flag_name + '_back'
         
         
     
@@ -183,7 +293,7 @@ class FormDefinition(models.Model):
         for field in self.fields.all():
             choices = []
             if field.choices.count():
-                choices = [{'value': u'%s' % choice.value, 'label': u'%s' % choice.label} for choice in field.choices.all()]
+                choices = [{'value': u'%s' % choice.value, 'label': u'%s' % choice.label} for choice in field.get_ordered_choices()]
             elif field.choice_model:
                 choices = [{'value': u'%s' % obj.id, 'label': u'%s' % obj} for obj in ModelNameField.get_model_from_string(field.choice_model).objects.all()]
             
@@ -225,6 +335,33 @@ class FieldChoiceContainer(object):
 
 
 
+#==============================================================================
+class FormDefinitionFieldManager(models.Manager):
+
+    #--------------------------------------------------------------------------
+    def update_positions(self, positions):
+        """
+        Sets the position of many fields in a single UPDATE, given a
+        dictionary mapping field primary keys to positions.
+        """
+        if not positions:
+            return
+        from django.db import connections, transaction
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        pk_column = qn(self.model._meta.pk.column)
+        params = []
+        for pk, position in positions.items():
+            params.extend([pk, position])
+        params.extend(positions.keys())
+        cursor = connection.cursor()
+        cursor.execute('UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (
+            qn(self.model._meta.db_table), qn(self.model._meta.get_field('position').column), pk_column,
+            ' '.join(['WHEN %s THEN %s'] * len(positions)), pk_column, ', '.join(['%s'] * len(positions))), params)
+        transaction.commit_unless_managed(using=self.db)
+
+
+
 #==============================================================================
 class FormDefinitionField(models.Model):
     """
@@ -234,6 +371,7 @@ class FormDefinitionField(models.Model):
     form_definition = models.ForeignKey(FormDefinition, verbose_name=_('Form definition'), related_name='fields')
     field_class = models.CharField(_('Field class'), choices=app_settings.get('FORM_DESIGNER_FIELD_CLASSES'), max_length=32)
     position = models.IntegerField(_('Position'), blank=True, null=True)
+    page = models.PositiveIntegerField(_('Page'), help_text=_('To split the form into several steps, give the fields of each step a higher page number than those of the previous one.'), default=1, blank=True)
 
     name = models.SlugField(_('Name'), max_length=255)
     label = models.CharField(_('Label'), max_length=255, blank=True, null=True)
@@ -255,16 +393,51 @@ class FormDefinitionField(models.Model):
 
     regex = models.CharField(_('Regular Expression'), max_length=255, blank=True, null=True)
 
+    max_file_size = models.IntegerField(_('Max. file size'), help_text=_('In bytes. If empty, the FORM_DESIGNER_FILE_MAX_SIZE setting applies.'), blank=True, null=True)
+    allowed_file_types = models.CharField(_('Allowed file types'), help_text=_('Separate several file extensions or MIME types with a comma, e.g. "pdf, doc, image/*". Leave empty to allow any type.'), max_length=255, blank=True, null=True)
+
     choice_model_choices = app_settings.get('FORM_DESIGNER_CHOICE_MODEL_CHOICES')
     choice_model = ModelNameField(_('Data model'), max_length=255, blank=True, null=True, choices=choice_model_choices, help_text=_('your_app.models.ModelName' if not choice_model_choices else None))
     choice_model_empty_label = models.CharField(_('Empty label'), max_length=255, blank=True, null=True)
 
+    objects = FormDefinitionFieldManager()
+
     
+    #--------------------------------------------------------------------------
+    def clean_fields(self, exclude=None):
+        # checked here rather than in clean(), so that ModelForms show the
+        # errors on the fields concerned
+        from django.core.exceptions import ValidationError
+        from form_designer.validators import validate_field_spec
+        errors = {}
+        try:
+            super(FormDefinitionField, self).clean_fields(exclude)
+        except ValidationError as error:
+            errors = error.message_dict
+        for name, messages in validate_field_spec(self).items():
+            if not name in errors and not name in (exclude or []):
+                errors[name] = messages
+        if errors:
+            raise ValidationError(errors)
+
+
+    #--------------------------------------------------------------------------
+    def clean(self):
+        if not self.page:
+            self.page = 1
+
+
     #--------------------------------------------------------------------------
     def save(self, *args, **kwargs):
         if self.position == None:
             self.position = 0
-        super(FormDefinitionField, self).save()
+        if not self.page:
+            self.page = 1
+        super(FormDefinitionField, self).save(*args, **kwargs)
+        if self.regex:
+            # compile now, so that the first request doesn't have to
+            from form_designer.validators import compile_regex
+            compile_regex(self.regex)
 
 
     #--------------------------------------------------------------------------
@@ -279,6 +452,32 @@ class FormDefinitionField(models.Model):
         self.help_text = help_text
         
     
+    #--------------------------------------------------------------------------
+    def get_ordered_choices(self):
+        """
+        Returns this field's choices in the order they were added.
+        """
+        through = self.choices.through._meta
+        return self.choices.extra(order_by=['%s.%s' % (through.db_table, through.pk.column)])
+
+
+    #--------------------------------------------------------------------------
+    def set_choices(self, choices, existing=None):
+        """
+        Replaces this field's choices with a list of (value, label) tuples,
+        unless they are already the same. Choices that no field uses any
+        more are deleted. Returns True if the choices were changed.
+        """
+        if existing is None:
+            existing = list(self.get_ordered_choices())
+        if [(choice.value, choice.label) for choice in existing] == list(choices):
+            return False
+        self.choices.clear()
+        FormDefinitionFieldChoice.objects.filter(pk__in=[choice.pk for choice in existing], formdefinitionfield=None).delete()
+        self.choices.add(*[FormDefinitionFieldChoice.objects.create(value=value, label=label) for value, label in choices])
+        return True
+
+
     #--------------------------------------------------------------------------
     def get_choices(self, filter=None, order_by=None):
         queryset = None
@@ -327,15 +526,16 @@ class FormDefinitionField(models.Model):
 
         if self.field_class == 'forms.RegexField':
             if self.regex:
+                from form_designer.validators import compile_regex
                 args.update({
-                    'regex': self.regex
+                    'regex': compile_regex(self.regex)
                 })
 
         if self.field_class in ('forms.ChoiceField', 'forms.MultipleChoiceField'):
             #print "Choices count:", self.choices.count()
             if self.choices.count():
                 # new method of creating choices
-                choices = [(choice.value, choice.label) for choice in self.choices.all()]
+                choices = [(choice.value, choice.label) for choice in self.get_ordered_choices()]
                 args.update({
                     'choices': tuple(choices)
                 })
@@ -372,6 +572,22 @@ class FormDefinitionField(models.Model):
 
 
 
+#------------------------------------------------------------------------------
+def remember_choices(sender, instance, **kwargs):
+    # the links to the choices are gone by the time post_delete is sent
+    instance._deleted_choice_ids = list(instance.choices.values_list('pk', flat=True))
+
+#------------------------------------------------------------------------------
+def delete_orphaned_choices(sender, instance, **kwargs):
+    choice_ids = getattr(instance, '_deleted_choice_ids', None)
+    if choice_ids:
+        FormDefinitionFieldChoice.objects.filter(pk__in=choice_ids, formdefinitionfield=None).delete()
+
+models.signals.pre_delete.connect(remember_choices, sender=FormDefinitionField)
+models.signals.post_delete.connect(delete_orphaned_choices, sender=FormDefinitionField)
+
+
+
 #==============================================================================
 class FormSubmission(models.Model):
     """
@@ -379,6 +595,11 @@ class FormSubmission(models.Model):
     """
     
     created = models.DateTimeField(_('Created'), auto_now=True)
+    # stored with the submission so that a form's submissions can be queried
+    # without joining their values; empty for submissions logged before this
+    # field existed, see setup_submission_partitions
+    definition = models.ForeignKey(FormDefinition, verbose_name=_('Form definition'), related_name='submissions', null=True, blank=True, editable=False)
+    partition = models.CharField(_('Partition'), max_length=32, blank=True, db_index=True, editable=False)
     
     #--------------------------------------------------------------------------
     class Meta:
@@ -401,6 +622,8 @@ class FormSubmission(models.Model):
     #--------------------------------------------------------------------------
     @property
     def form_definition(self):
+        if self.definition_id:
+            return self.definition
         return self.fields.all()[0].definition_field.form_definition if self.fields.count() else None
 
 
@@ -417,6 +640,8 @@ class FormFieldSubmission(models.Model):
         help_text=_('The field in the form definition to which this submitted value belongs'),
         related_name='submissions')
     value = models.TextField(_('Value'), help_text=_('The actual submitted value'))
+    # same as the submission's, see form_designer.partitions
+    partition = models.CharField(_('Partition'), max_length=32, blank=True, db_index=True, editable=False)
     
     
     #--------------------------------------------------------------------------
@@ -447,6 +672,113 @@ class FormFieldSubmission(models.Model):
 
 
 
+#==============================================================================
+class SubmissionSearchToken(models.Model):
+    """
+    An entry of the portable search index: a token occurring in the values
+    of a submission. See form_designer.search.
+    """
+
+    token = models.CharField(_('Token'), max_length=64, db_index=True)
+    submission = models.ForeignKey(FormSubmission, verbose_name=_('Form submission'), related_name='search_tokens')
+
+
+    #--------------------------------------------------------------------------
+    def __unicode__(self):
+        return self.token
+
+
+
+#==============================================================================
+class MailDigestEntry(models.Model):
+    """
+    A submission waiting to be included in the next digest mail of its form
+    definition.
+    """
+
+    form_definition = models.ForeignKey(FormDefinition, verbose_name=_('Form definition'), related_name='digest_entries')
+    form_data = SerializedObjectField(_('Form data'))
+    created = models.DateTimeField(_('Created'), auto_now_add=True, db_index=True)
+
+
+    #--------------------------------------------------------------------------
+    class Meta:
+        verbose_name = _('digest entry')
+        verbose_name_plural = _('digest entries')
+        ordering = ['created']
+
+
+    #--------------------------------------------------------------------------
+    def __unicode__(self):
+        return u'%s at %s' % (self.form_definition, self.created)
+
+
+
+#==============================================================================
+class FormDefinitionWebhook(models.Model):
+    """
+    An HTTP endpoint that receives each submission of a form definition as
+    signed JSON.
+    """
+
+    form_definition = models.ForeignKey(FormDefinition, verbose_name=_('Form definition'), related_name='webhooks')
+    url = models.URLField(_('Target URL'), max_length=255)
+    secret = models.CharField(_('Secret'), help_text=_('If set, each request carries an HMAC-SHA256 signature of its body in the X-Form-Designer-Signature header.'), max_length=255, blank=True, null=True)
+    batch_size = models.PositiveIntegerField(_('Batch size'), help_text=_('If greater than 1, submissions are sent as a JSON list of up to this many payloads per request.'), default=1)
+    active = models.BooleanField(_('Active'), default=True)
+
+
+    #--------------------------------------------------------------------------
+    class Meta:
+        verbose_name = _('webhook')
+        verbose_name_plural = _('webhooks')
+
+
+    #--------------------------------------------------------------------------
+    def __unicode__(self):
+        return self.url
+
+
+
+#==============================================================================
+class WebhookDelivery(models.Model):
+    """
+    A submission payload waiting to be, or having been, sent to a webhook.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_DELIVERED = 'delivered'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_SENDING, _('Sending')),
+        (STATUS_DELIVERED, _('Delivered')),
+        (STATUS_DEAD, _('Failed permanently')),
+    )
+
+    webhook = models.ForeignKey(FormDefinitionWebhook, verbose_name=_('Webhook'), related_name='deliveries')
+    payload = models.TextField(_('Payload'))
+    status = models.CharField(_('Status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.IntegerField(_('Attempts'), default=0)
+    next_attempt = models.DateTimeField(_('Next attempt'), default=datetime.datetime.now, db_index=True)
+    last_error = models.TextField(_('Last error'), blank=True, null=True)
+    created = models.DateTimeField(_('Created'), auto_now_add=True)
+
+
+    #--------------------------------------------------------------------------
+    class Meta:
+        verbose_name = _('webhook delivery')
+        verbose_name_plural = _('webhook deliveries')
+        ordering = ['-created']
+
+
+    #--------------------------------------------------------------------------
+    def __unicode__(self):
+        return u'%s (%s)' % (self.webhook, self.get_status_display())
+
+
+
 #==============================================================================
 if 'cms' in settings.INSTALLED_APPS:
     from cms.models import CMSPlugin
@@ -0,0 +1,411 @@
+"""
+Partitioned storage of form submissions.
+
+With FORM_DESIGNER_PARTITIONING set to 'month', 'definition' or
+'definition-month', every FormSubmission and FormFieldSubmission is stored
+with a partition key such as "2026-10", "f12" or "f12-2026-10" (f12 being
+the form definition with id 12).
+
+On PostgreSQL, the setup_submission_partitions command turns both tables
+into natively partitioned tables (PARTITION BY LIST on the key). Each
+partition is a table of its own, so queries filtered by partition only scan
+its tables, and removing a partition is a DROP TABLE. The tables that existed
+before become the default partition, which also receives submissions whose
+partition has not been created.
+
+Creating a partition makes PostgreSQL scan the default partition under an
+exclusive lock, so partitions are never created while handling a request.
+Instead, the setup_submission_partitions command creates the partitions of
+all form definitions for the coming FORM_DESIGNER_PARTITION_MONTHS_AHEAD
+months; forms created since its last run get theirs on the next run.
+
+PostgreSQL requires the partition key to be part of every unique constraint
+of a partitioned table, so foreign keys can no longer point to submissions
+by id alone. The conversion therefore refuses to run while such foreign keys
+exist, unless told to drop them; Django still deletes related rows itself.
+
+On other databases, such as SQLite in tests, the key is an indexed column
+and removing a partition deletes its rows in batches.
+"""
+
+import datetime
+import re
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from form_designer import app_settings
+from form_designer.models import FormDefinition, FormSubmission, FormFieldSubmission
+from form_designer.search import unindex_submissions
+
+SCHEMES = ('month', 'definition', 'definition-month')
+KEY_RE = re.compile(r'^(?:f(\d+))?-?(?:(\d{4})-(\d{2}))?$')
+
+# partitioned tables, in the order they are converted and dropped
+MODELS = (FormSubmission, FormFieldSubmission)
+
+_lock = threading.Lock()
+_backends = {}
+
+
+#==============================================================================
+class PartitioningError(RuntimeError):
+    pass
+
+
+
+#------------------------------------------------------------------------------
+def get_scheme():
+    scheme = app_settings.get('FORM_DESIGNER_PARTITIONING')
+    if scheme and not scheme in SCHEMES:
+        raise ImproperlyConfigured('FORM_DESIGNER_PARTITIONING must be one of %s' % ', '.join(SCHEMES))
+    return scheme
+
+
+#------------------------------------------------------------------------------
+def get_partition(definition_id, created):
+    """
+    Returns the partition key of a submission, or an empty string if
+    submissions are not partitioned.
+    """
+    scheme = get_scheme()
+    parts = []
+    if scheme in ('definition', 'definition-month'):
+        if definition_id is None:
+            return ''
+        parts.append('f%d' % definition_id)
+    if scheme in ('month', 'definition-month'):
+        parts.append('%04d-%02d' % (created.year, created.month))
+    return '-'.join(parts)
+
+
+#------------------------------------------------------------------------------
+def parse_partition(key):
+    """
+    Returns the definition id and the (year, month) of a partition key;
+    either is None if the key does not contain it.
+    """
+    match = KEY_RE.match(key or '')
+    if not match or not key:
+        return None, None
+    definition_id, year, month = match.groups()
+    return (int(definition_id) if definition_id else None), ((int(year), int(month)) if year else None)
+
+
+#------------------------------------------------------------------------------
+def delete_submissions(queryset, batch_size=1000):
+    """
+    Deletes the submissions in queryset along with their values and search
+    index entries, committing after each batch of batch_size submissions.
+    Returns the number of submissions deleted.
+    """
+    using = queryset.db
+    count = 0
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        transaction.commit_on_success(using=using)(_delete)(ids, using)
+        count += len(ids)
+    return count
+
+
+#------------------------------------------------------------------------------
+def _delete(ids, using):
+    qn = connections[using].ops.quote_name
+    cursor = connections[using].cursor()
+    placeholders = ', '.join(['%s'] * len(ids))
+    unindex_submissions(placeholders, ids, using)
+    field_meta = FormFieldSubmission._meta
+    cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (qn(field_meta.db_table), qn(field_meta.get_field('submission').column), placeholders), ids)
+    cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (qn(FormSubmission._meta.db_table), qn(FormSubmission._meta.pk.column), placeholders), ids)
+
+
+
+#==============================================================================
+class PartitionBackend(object):
+    """
+    Keeps all partitions in the same tables, distinguished by the indexed
+    partition column.
+    """
+
+    native = False
+
+    def __init__(self, using):
+        self.using = using
+
+    #--------------------------------------------------------------------------
+    def setup(self, drop_foreign_keys=False):
+        """
+        Prepares the database for partitioning. Returns False if there was
+        nothing to do. Raises PartitioningError if foreign keys point to the
+        submission tables and drop_foreign_keys is not set.
+        """
+        return False
+
+    #--------------------------------------------------------------------------
+    def create(self, keys):
+        """
+        Creates the partitions for keys that do not exist yet. Returns the
+        keys of the partitions created.
+        """
+        return []
+
+    #--------------------------------------------------------------------------
+    def list(self):
+        return sorted(FormSubmission.objects.using(self.using).exclude(partition='').order_by().values_list('partition', flat=True).distinct())
+
+    #--------------------------------------------------------------------------
+    def drop(self, key, batch_size=1000):
+        """
+        Removes a partition with all its submissions.
+        """
+        delete_submissions(FormSubmission.objects.using(self.using).filter(partition=key), batch_size)
+
+
+
+#==============================================================================
+class PostgreSQLPartitionBackend(PartitionBackend):
+    """
+    Uses native list partitioning once setup() has converted the tables.
+    """
+
+    def __init__(self, using):
+        super(PostgreSQLPartitionBackend, self).__init__(using)
+        self.native = self._exists(FormSubmission._meta.db_table, 'p')
+
+    #--------------------------------------------------------------------------
+    def _exists(self, table, kind=None):
+        cursor = connections[self.using].cursor()
+        cursor.execute('SELECT relkind FROM pg_class WHERE relname = %s', [table])
+        row = cursor.fetchone()
+        return row is not None and (kind is None or row[0] == kind)
+
+    #--------------------------------------------------------------------------
+    def _table(self, model, key):
+        return '%s_p_%s' % (model._meta.db_table, key.replace('-', '_'))
+
+    #--------------------------------------------------------------------------
+    def _create(self, cursor, model, key):
+        """
+        Creates the partition of model's table for key, moving the rows that
+        belong to it out of the default partition.
+        """
+        if not key or not KEY_RE.match(key):
+            raise ValueError('Invalid partition key %r' % key)
+        qn = connections[self.using].ops.quote_name
+        table = model._meta.db_table
+        partition_table = self._table(model, key)
+        partition = qn(model._meta.get_field('partition').column)
+        cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (qn(partition_table), qn(table)))
+        cursor.execute('INSERT INTO %s SELECT * FROM %s WHERE %s = %%s' % (qn(partition_table), qn('%s_default' % table), partition), [key])
+        cursor.execute('DELETE FROM %s WHERE %s = %%s' % (qn('%s_default' % table), partition), [key])
+        # keys only consist of letters, digits and dashes, see KEY_RE
+        cursor.execute("ALTER TABLE %s ATTACH PARTITION %s FOR VALUES IN ('%s')" % (qn(table), qn(partition_table), key))
+
+    #--------------------------------------------------------------------------
+    def foreign_keys(self):
+        """
+        Returns (table, constraint) pairs of the foreign keys that point to
+        the submission tables.
+        """
+        cursor = connections[self.using].cursor()
+        cursor.execute("SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE contype = 'f' AND confrelid IN (%s::regclass, %s::regclass) ORDER BY 1, 2",
+            [model._meta.db_table for model in MODELS])
+        return cursor.fetchall()
+
+    #--------------------------------------------------------------------------
+    def setup(self, drop_foreign_keys=False):
+        if self.native:
+            return False
+        foreign_keys = self.foreign_keys()
+        if foreign_keys and not drop_foreign_keys:
+            raise PartitioningError('The foreign keys %s point to the submission tables. Partitioned tables can only be referenced by '
+                'their primary key including the partition key, so these foreign keys would have to be dropped; Django still '
+                'deletes related rows itself. Convert with drop_foreign_keys to proceed.' % ', '.join(['%s.%s' % row for row in foreign_keys]))
+        transaction.commit_on_success(using=self.using)(self._convert)(foreign_keys)
+        self.native = True
+        return True
+
+    #--------------------------------------------------------------------------
+    def _convert(self, foreign_keys):
+        qn = connections[self.using].ops.quote_name
+        cursor = connections[self.using].cursor()
+        keys = self.list()
+
+        for table, name in foreign_keys:
+            cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (table, qn(name)))
+
+        for model in MODELS:
+            table = model._meta.db_table
+            default = '%s_default' % table
+            pk = model._meta.pk.column
+            partition = model._meta.get_field('partition').column
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, pk])
+            sequence = cursor.fetchone()[0]
+            cursor.execute('ALTER TABLE %s RENAME TO %s' % (qn(table), qn(default)))
+            cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) PARTITION BY LIST (%s)' % (qn(table), qn(default), qn(partition)))
+            cursor.execute('ALTER TABLE %s ADD PRIMARY KEY (%s, %s)' % (qn(table), qn(pk), qn(partition)))
+            if sequence:
+                # Django looks the sequence up by the table's name
+                cursor.execute('ALTER SEQUENCE %s OWNED BY %s.%s' % (sequence, qn(table), qn(pk)))
+            for field in model._meta.fields:
+                if field.db_index and not field.primary_key:
+                    cursor.execute('CREATE INDEX %s ON %s (%s)' % (qn('%s_%s_idx' % (table, field.column)), qn(table), qn(field.column)))
+            # the default partition is attached last, so creating these does
+            # not have to scan it
+            for key in keys:
+                self._create(cursor, model, key)
+            cursor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (qn(table), qn(default)))
+
+    #--------------------------------------------------------------------------
+    def list(self):
+        if not self.native:
+            return super(PostgreSQLPartitionBackend, self).list()
+        # read from the catalog rather than scanning the submissions
+        prefix = '%s_p_' % FormSubmission._meta.db_table
+        cursor = connections[self.using].cursor()
+        cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass',
+            [FormSubmission._meta.db_table])
+        # keys only contain dashes where the table names have underscores
+        return sorted([name[len(prefix):].replace('_', '-') for (name,) in cursor.fetchall() if name.startswith(prefix)])
+
+    #--------------------------------------------------------------------------
+    def create(self, keys):
+        if not self.native:
+            return []
+        created = []
+        for key in keys:
+            if key and not self._exists(self._table(FormSubmission, key)):
+                transaction.commit_on_success(using=self.using)(self._create_all)(key)
+                created.append(key)
+        return created
+
+    #--------------------------------------------------------------------------
+    def _create_all(self, key):
+        cursor = connections[self.using].cursor()
+        for model in MODELS:
+            self._create(cursor, model, key)
+
+    #--------------------------------------------------------------------------
+    def drop(self, key, batch_size=1000):
+        if self.native and KEY_RE.match(key):
+            qn = connections[self.using].ops.quote_name
+            cursor = connections[self.using].cursor()
+            submissions = self._table(FormSubmission, key)
+            if self._exists(submissions):
+                unindex_submissions('SELECT %s FROM %s' % (qn(FormSubmission._meta.pk.column), qn(submissions)), [], self.using)
+            for model in reversed(MODELS):
+                cursor.execute('DROP TABLE IF EXISTS %s' % qn(self._table(model, key)))
+            transaction.commit_unless_managed(using=self.using)
+        # rows that ended up in the default partition
+        super(PostgreSQLPartitionBackend, self).drop(key, batch_size)
+
+
+
+#------------------------------------------------------------------------------
+def get_backend(using='default'):
+    _lock.acquire()
+    try:
+        if not using in _backends:
+            if getattr(connections[using], 'vendor', None) == 'postgresql':
+                _backends[using] = PostgreSQLPartitionBackend(using)
+            else:
+                _backends[using] = PartitionBackend(using)
+    finally:
+        _lock.release()
+    return _backends[using]
+
+
+#------------------------------------------------------------------------------
+def get_upcoming_keys(definition_ids, months_ahead, today=None):
+    """
+    Returns the partition keys for the given definitions (only used by the
+    definition schemes) from the current month up to months_ahead months
+    later (only used by the month schemes).
+    """
+    scheme = get_scheme()
+    today = today or datetime.date.today()
+    months = []
+    for offset in range(months_ahead + 1):
+        year, month = divmod(today.month - 1 + offset, 12)
+        months.append(datetime.date(today.year + year, month + 1, 1))
+    keys = []
+    for definition_id in (scheme == 'month' and [None] or definition_ids):
+        for month in (scheme == 'definition' and months[:1] or months):
+            key = get_partition(definition_id, month)
+            if key and not key in keys:
+                keys.append(key)
+    return keys
+
+
+#------------------------------------------------------------------------------
+def create_partitions(definition_ids=None, months_ahead=None, using='default'):
+    """
+    Creates the partitions that upcoming submissions of the given
+    definitions (default: all) will be stored in, if the database supports
+    native partitioning. Returns the keys of the partitions created.
+    """
+    if not get_scheme():
+        return []
+    backend = get_backend(using)
+    if not backend.native:
+        return []
+    if definition_ids is None:
+        definition_ids = list(FormDefinition.objects.using(using).values_list('pk', flat=True))
+    if months_ahead is None:
+        months_ahead = app_settings.get('FORM_DESIGNER_PARTITION_MONTHS_AHEAD')
+    return backend.create(get_upcoming_keys(definition_ids, months_ahead))
+
+
+#------------------------------------------------------------------------------
+def backfill(batch_size=1000, using='default'):
+    """
+    Stores the definition and partition key with submissions that were
+    logged without them. Returns the number of submissions updated.
+    """
+    count = 0
+    last_pk = 0
+    while True:
+        rows = list(FormSubmission.objects.using(using).filter(definition=None, pk__gt=last_pk).order_by('pk').values_list('pk', 'created')[:batch_size])
+        if not rows:
+            break
+        definitions = dict(FormFieldSubmission.objects.using(using).filter(submission__in=[pk for pk, created in rows]).values_list('submission', 'definition_field__form_definition'))
+        groups = {}
+        for pk, created in rows:
+            if pk in definitions:
+                definition_id = definitions[pk]
+                groups.setdefault((definition_id, get_partition(definition_id, created)), []).append(pk)
+        transaction.commit_on_success(using=using)(_update)(groups, using)
+        count += sum([len(ids) for ids in groups.values()])
+        last_pk = rows[-1][0]
+    return count
+
+
+#------------------------------------------------------------------------------
+def _update(groups, using):
+    for (definition_id, key), ids in groups.items():
+        FormSubmission.objects.using(using).filter(pk__in=ids).update(definition=definition_id, partition=key)
+        FormFieldSubmission.objects.using(using).filter(submission__in=ids).update(partition=key)
+
+
+#------------------------------------------------------------------------------
+def prune(before, definition=None, batch_size=1000, using='default'):
+    """
+    Removes the submissions created before the date before, optionally only
+    those of one form definition. Month partitions that lie entirely before
+    that date are dropped as a whole, the remaining submissions are deleted
+    in batches. Returns the list of dropped partitions and the number of
+    submissions deleted individually.
+    """
+    backend = get_backend(using)
+    dropped = []
+    for key in backend.list():
+        definition_id, month = parse_partition(key)
+        if month and month < (before.year, before.month) and (definition is None or definition_id == definition.pk):
+            backend.drop(key, batch_size)
+            dropped.append(key)
+    queryset = FormSubmission.objects.using(using).filter(created__lt=before)
+    if definition is not None:
+        queryset = queryset.filter(definition=definition)
+    return dropped, delete_submissions(queryset, batch_size)
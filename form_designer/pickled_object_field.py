@@ -1,4 +1,8 @@
 # http://www.smipple.net/snippet/IanLewis/Django%20Pickled%20Object%20Field
+#
+# Deprecated: loading pickles can execute arbitrary code. Use
+# form_designer.serialized_field.SerializedObjectField instead and convert
+# existing columns with the migrate_pickled_fields management command.
 
 try:
     import cPickle as pickle
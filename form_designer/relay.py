@@ -0,0 +1,162 @@
+"""
+Relay mode: the form is submitted to this site, processed as usual, and the
+submitted data is then forwarded to the definition's target URL by a
+background worker.
+
+Requests to the target use a shared keep-alive connection pool with a short
+timeout. A circuit breaker per host stops sending requests to a target
+after repeated failures, until FORM_DESIGNER_RELAY_RESET_TIMEOUT has passed.
+"""
+
+import logging
+import threading
+import time
+import urllib
+import urlparse
+
+from form_designer import app_settings
+from form_designer.httpclient import ConnectionPool, HTTPError
+from form_designer.workers import WorkerPool
+
+# fields that only matter to this site and are not forwarded, in addition to
+# the hidden fields of the form definition, see get_excluded_fields()
+EXCLUDED_FIELDS = ('csrfmiddlewaretoken',)
+
+_lock = threading.Lock()
+_pool = None
+_client = None
+_breaker = None
+
+
+#==============================================================================
+class CircuitBreaker(object):
+    """
+    Tracks consecutive failures per key. After failure_threshold failures
+    the circuit opens and allow() returns False for reset_timeout seconds;
+    then a single trial request is let through, which closes the circuit
+    again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened = {}
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def allow(self, key):
+        self.lock.acquire()
+        try:
+            opened = self.opened.get(key)
+            if opened is None:
+                return True
+            if time.time() - opened >= self.reset_timeout:
+                # half-open: let one request through, and keep the circuit
+                # open for everyone else until it has completed
+                self.opened[key] = time.time()
+                return True
+            return False
+        finally:
+            self.lock.release()
+
+    #--------------------------------------------------------------------------
+    def record_success(self, key):
+        self.lock.acquire()
+        try:
+            self.failures.pop(key, None)
+            self.opened.pop(key, None)
+        finally:
+            self.lock.release()
+
+    #--------------------------------------------------------------------------
+    def record_failure(self, key):
+        self.lock.acquire()
+        try:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if self.failures[key] >= self.failure_threshold:
+                self.opened[key] = time.time()
+        finally:
+            self.lock.release()
+
+
+
+#------------------------------------------------------------------------------
+def _setup():
+    global _pool, _client, _breaker
+    _lock.acquire()
+    try:
+        if _pool is None:
+            workers = app_settings.get('FORM_DESIGNER_RELAY_WORKERS')
+            _client = ConnectionPool(timeout=app_settings.get('FORM_DESIGNER_RELAY_TIMEOUT'), max_idle=workers)
+            _breaker = CircuitBreaker(app_settings.get('FORM_DESIGNER_RELAY_FAILURE_THRESHOLD'), app_settings.get('FORM_DESIGNER_RELAY_RESET_TIMEOUT'))
+            _pool = WorkerPool('form-designer-relay', workers, app_settings.get('FORM_DESIGNER_RELAY_QUEUE_SIZE'))
+    finally:
+        _lock.release()
+
+
+#------------------------------------------------------------------------------
+def get_pool():
+    _setup()
+    return _pool
+
+
+#------------------------------------------------------------------------------
+def get_excluded_fields(form_definition):
+    return EXCLUDED_FIELDS + (form_definition.submit_flag_name, form_definition.steps_field_name, form_definition.back_flag_name)
+
+
+#------------------------------------------------------------------------------
+def encode_form_data(form):
+    """
+    URL-encodes the submitted data as the browser would have sent it,
+    without the fields only used by this site.
+    """
+    excluded = get_excluded_fields(form.form_definition)
+    items = []
+    for key, values in form.data.lists():
+        if key in excluded:
+            continue
+        for value in values:
+            items.append((key.encode('utf-8'), unicode(value).encode('utf-8')))
+    return urllib.urlencode(items)
+
+
+#------------------------------------------------------------------------------
+def forward(method, url, data):
+    """
+    Sends the data to the target, unless its circuit is open. Runs on a
+    worker thread.
+    """
+    host = urlparse.urlsplit(url).netloc
+    if not _breaker.allow(host):
+        logging.warning('Form relay: circuit open for %s, dropping submission to %s' % (host, url))
+        return
+    if method == 'GET':
+        url += ('&' if '?' in url else '?') + data
+        body, headers = None, {}
+    else:
+        body, headers = data, {'Content-Type': 'application/x-www-form-urlencoded'}
+    try:
+        status, response = _client.request(method, url, body, headers)
+    except HTTPError as error:
+        _breaker.record_failure(host)
+        logging.error('Form relay to %s failed: %s' % (url, error))
+        return
+    if status >= 500:
+        _breaker.record_failure(host)
+        logging.error('Form relay to %s failed: HTTP %d' % (url, status))
+    else:
+        _breaker.record_success(host)
+        if status >= 400:
+            logging.warning('Form relay to %s was rejected: HTTP %d' % (url, status))
+
+
+#------------------------------------------------------------------------------
+def relay(form_definition, form):
+    """
+    Queues the submitted form data for forwarding to the definition's
+    target URL. Returns False if the relay queue is full.
+    """
+    _setup()
+    return _pool.submit(forward, form_definition.method, form_definition.action, encode_form_data(form))
@@ -0,0 +1,72 @@
+"""
+Routing of form_designer's queries between a primary database and a read
+replica.
+
+Reporting queries -- the submission changelist, CSV export and submission
+search -- run on FORM_DESIGNER_REPORTING_DATABASE if it is set, so they do
+not compete with submission writes on the primary. Everything else,
+including FormDefinition.log() and editing definitions in the admin, stays
+on the primary. Add ReportingRouter to DATABASE_ROUTERS so that objects that
+were read from the replica are still saved to the primary:
+
+    DATABASE_ROUTERS = ['form_designer.routers.ReportingRouter']
+    FORM_DESIGNER_REPORTING_DATABASE = 'replica'
+"""
+
+from django.db import DEFAULT_DB_ALIAS
+from form_designer import app_settings
+
+APP_LABEL = 'form_designer'
+
+
+#------------------------------------------------------------------------------
+def get_reporting_db():
+    """
+    Returns the alias of the database reporting queries run on, or None if
+    they run on the primary.
+    """
+    return app_settings.get('FORM_DESIGNER_REPORTING_DATABASE') or None
+
+
+#------------------------------------------------------------------------------
+def is_reporting_db(using):
+    alias = get_reporting_db()
+    return alias is not None and alias != DEFAULT_DB_ALIAS and using == alias
+
+
+#------------------------------------------------------------------------------
+def for_reporting(queryset):
+    """
+    Returns queryset on the reporting database, if one is configured.
+    """
+    alias = get_reporting_db()
+    return queryset.using(alias) if alias else queryset
+
+
+
+#==============================================================================
+class ReportingRouter(object):
+    """
+    Sends all writes of form_designer models to the primary database. Reads
+    are left alone: they go to the primary unless a queryset was explicitly
+    moved to the reporting database, in which case related objects are read
+    from there as well.
+    """
+
+    #--------------------------------------------------------------------------
+    def db_for_read(self, model, **hints):
+        return None
+
+    #--------------------------------------------------------------------------
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    #--------------------------------------------------------------------------
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds copies of the primary's rows, so objects read
+        # from either may be related to each other
+        if obj1._meta.app_label == APP_LABEL and obj2._meta.app_label == APP_LABEL:
+            return True
+        return None
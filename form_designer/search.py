@@ -0,0 +1,299 @@
+"""
+Full-text search over submitted values.
+
+Each submission is indexed once, when it is logged, as the concatenation of
+its field values. Depending on FORM_DESIGNER_SEARCH_BACKEND and the database,
+the index is an SQLite FTS5 table, a PostgreSQL tsvector column with a GIN
+index, or a plain inverted index (SubmissionSearchToken) that works on any
+database. All index operations run on the connection the submissions are
+written to, inside the same transaction. Searches run on the database of
+the queryset they filter, which may be the reporting replica.
+
+The tables of the index are created by syncdb (see the post_syncdb handler
+in form_designer.management) and by the rebuild_search_index management
+command, never while a request is processed. The index can be rebuilt at any
+time with that command.
+"""
+
+import re
+import threading
+
+from django.db import connections, transaction
+from django.db.models.query import QuerySet
+from form_designer import app_settings
+from form_designer.models import FormSubmission, FormFieldSubmission, SubmissionSearchToken
+from form_designer.routers import is_reporting_db
+from form_designer.serialized_field import is_serialized, loads
+
+TOKEN_RE = re.compile(r'[\w.@+-]+', re.UNICODE)
+PART_RE = re.compile(r'[^\W_]+', re.UNICODE)
+MAX_TOKEN_LENGTH = SubmissionSearchToken._meta.get_field('token').max_length
+
+_lock = threading.Lock()
+_backends = {}
+
+
+#------------------------------------------------------------------------------
+def tokenize(text):
+    """
+    Splits text into lowercase search tokens. Words containing punctuation,
+    like e-mail addresses, are indexed both as a whole and by their parts, so
+    "jane.doe@example.com" can be found by "jane" as well as by the full
+    address.
+    """
+    tokens = []
+    for word in TOKEN_RE.findall(text.lower()):
+        word = word.strip('.-+')
+        parts = PART_RE.findall(word)
+        for token in ([word] if parts != [word] else []) + parts:
+            token = token[:MAX_TOKEN_LENGTH]
+            if token and not token in tokens:
+                tokens.append(token)
+    return tokens
+
+
+
+#==============================================================================
+class TokenBackend(object):
+    """
+    An inverted index stored in the SubmissionSearchToken table. Every
+    query token has to match; the last one also matches as a prefix, so
+    partially typed words are found.
+    """
+
+    def __init__(self, using):
+        self.using = using
+
+    def setup(self):
+        pass
+
+    def clear(self):
+        connection = connections[self.using]
+        connection.cursor().execute('DELETE FROM %s' % connection.ops.quote_name(SubmissionSearchToken._meta.db_table))
+
+    def index(self, documents):
+        connection = connections[self.using]
+        meta = SubmissionSearchToken._meta
+        qn = connection.ops.quote_name
+        rows = []
+        for submission_id, text in documents:
+            rows.extend([(token, submission_id) for token in tokenize(text)])
+        if rows:
+            connection.cursor().executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (qn(meta.db_table),
+                qn(meta.get_field('token').column), qn(meta.get_field('submission').column)), rows)
+
+    def remove(self, ids_sql, params):
+        connection = connections[self.using]
+        meta = SubmissionSearchToken._meta
+        qn = connection.ops.quote_name
+        connection.cursor().execute('DELETE FROM %s WHERE %s IN (%s)' % (qn(meta.db_table), qn(meta.get_field('submission').column), ids_sql), params)
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        tokens_qs = SubmissionSearchToken.objects.using(queryset.db)
+        for token in tokens[:-1]:
+            queryset = queryset.filter(pk__in=tokens_qs.filter(token=token).values('submission'))
+        return queryset.filter(pk__in=tokens_qs.filter(token__startswith=tokens[-1]).values('submission'))
+
+
+
+#==============================================================================
+class SQLiteFTSBackend(TokenBackend):
+    """
+    Uses an FTS5 virtual table. Only available if SQLite was built with
+    FTS5.
+    """
+
+    table = 'form_designer_submission_fts'
+
+    def setup(self):
+        connections[self.using].cursor().execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(content, submission_id UNINDEXED)' % self.table)
+
+    def clear(self):
+        connections[self.using].cursor().execute('DELETE FROM %s' % self.table)
+
+    def index(self, documents):
+        if documents:
+            connections[self.using].cursor().executemany('INSERT INTO %s (content, submission_id) VALUES (%%s, %%s)' % self.table,
+                [(text, submission_id) for submission_id, text in documents])
+
+    def remove(self, ids_sql, params):
+        connections[self.using].cursor().execute('DELETE FROM %s WHERE submission_id IN (%s)' % (self.table, ids_sql), params)
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        match = ' '.join(['"%s"' % token.replace('"', '""') for token in tokens]) + '*'
+        return queryset.extra(where=['%s.%s IN (SELECT submission_id FROM %s WHERE %s MATCH %%s)' % (
+            FormSubmission._meta.db_table, FormSubmission._meta.pk.column, self.table, self.table)], params=[match])
+
+
+
+#==============================================================================
+class PostgreSQLBackend(TokenBackend):
+    """
+    Stores a tsvector per submission with a GIN index. The "simple" text
+    search configuration is used, since submissions can be in any language
+    and mostly consist of names and addresses.
+    """
+
+    table = 'form_designer_submission_fts'
+
+    def setup(self):
+        # CREATE INDEX IF NOT EXISTS requires PostgreSQL 9.5
+        cursor = connections[self.using].cursor()
+        cursor.execute('SELECT 1 FROM pg_class WHERE relname = %s', [self.table])
+        if not cursor.fetchone():
+            cursor.execute('CREATE TABLE %s (submission_id integer PRIMARY KEY, document tsvector NOT NULL)' % self.table)
+            cursor.execute('CREATE INDEX %s_document ON %s USING gin(document)' % (self.table, self.table))
+
+    def clear(self):
+        connections[self.using].cursor().execute('DELETE FROM %s' % self.table)
+
+    def index(self, documents):
+        if documents:
+            connections[self.using].cursor().executemany("INSERT INTO %s (submission_id, document) VALUES (%%s, to_tsvector('simple', %%s))" % self.table,
+                [(submission_id, u' '.join([text] + tokenize(text))) for submission_id, text in documents])
+
+    def remove(self, ids_sql, params):
+        connections[self.using].cursor().execute('DELETE FROM %s WHERE submission_id IN (%s)' % (self.table, ids_sql), params)
+
+    def filter(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        tsquery = ' & '.join(["'%s'" % token.replace("'", "''") for token in tokens]) + ':*'
+        return queryset.extra(where=["%s.%s IN (SELECT submission_id FROM %s WHERE document @@ to_tsquery('simple', %%s))" % (
+            FormSubmission._meta.db_table, FormSubmission._meta.pk.column, self.table)], params=[tsquery])
+
+
+
+#------------------------------------------------------------------------------
+def has_fts5(connection):
+    # without DDL, which would commit the current transaction
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    except Exception:
+        return False
+    return bool(cursor.fetchone()[0])
+
+
+#------------------------------------------------------------------------------
+def get_backend(using='default'):
+    """
+    Returns the search backend for a database, or None if search is
+    disabled.
+    """
+    name = app_settings.get('FORM_DESIGNER_SEARCH_BACKEND')
+    if not name:
+        return None
+    _lock.acquire()
+    try:
+        if not using in _backends:
+            vendor = getattr(connections[using], 'vendor', None)
+            if name == 'auto':
+                if vendor == 'postgresql':
+                    name = 'postgresql'
+                elif vendor == 'sqlite' and has_fts5(connections[using]):
+                    name = 'sqlite_fts'
+                else:
+                    name = 'tokens'
+            _backends[using] = {
+                'tokens': TokenBackend,
+                'sqlite_fts': SQLiteFTSBackend,
+                'postgresql': PostgreSQLBackend,
+            }[name](using)
+    finally:
+        _lock.release()
+    return _backends[using]
+
+
+#------------------------------------------------------------------------------
+def setup(using='default'):
+    """
+    Creates the index tables, unless using is the reporting database, which
+    is a replica of the primary.
+    """
+    backend = get_backend(using)
+    if backend and not is_reporting_db(using):
+        backend.setup()
+        transaction.commit_unless_managed(using=using)
+
+
+#------------------------------------------------------------------------------
+def get_text(values):
+    """
+    Returns the text indexed for a list of submitted values. The items of
+    multiple-value fields are indexed individually.
+    """
+    parts = []
+    for value in values:
+        if isinstance(value, (list, tuple, QuerySet)):
+            parts.append(get_text(value))
+        elif value is not None:
+            parts.append(unicode(value))
+    return u' '.join(parts)
+
+
+#------------------------------------------------------------------------------
+def index_submissions(documents, using='default'):
+    """
+    Adds (submission id, list of values) pairs to the index. Like model
+    saves, the index is committed unless a transaction is being managed.
+    """
+    backend = get_backend(using)
+    if backend:
+        backend.index([(submission_id, get_text(values)) for submission_id, values in documents])
+        transaction.commit_unless_managed(using=using)
+
+
+#------------------------------------------------------------------------------
+def unindex_submissions(ids_sql, params, using='default'):
+    """
+    Removes submissions from the index. ids_sql is a list of placeholders or
+    a subquery selecting submission ids.
+    """
+    backend = get_backend(using)
+    if backend:
+        backend.remove(ids_sql, params)
+
+
+#------------------------------------------------------------------------------
+def search(queryset, query):
+    """
+    Restricts a FormSubmission queryset to the submissions matching query.
+    """
+    backend = get_backend(queryset.db)
+    if backend is None:
+        return queryset.filter(fields__value__icontains=query).distinct()
+    return backend.filter(queryset, query)
+
+
+#------------------------------------------------------------------------------
+def rebuild(batch_size=1000, using='default'):
+    """
+    Clears the index and indexes all submissions again. Returns the number
+    of submissions indexed.
+    """
+    backend = get_backend(using)
+    if backend is None:
+        return 0
+    backend.clear()
+    count = 0
+    last_pk = 0
+    while True:
+        ids = list(FormSubmission.objects.using(using).filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        values = {}
+        for submission_id, value in FormFieldSubmission.objects.using(using).filter(submission__in=ids).order_by('pk').values_list('submission', 'value'):
+            # values_list() returns the stored text
+            values.setdefault(submission_id, []).append(loads(value) if is_serialized(value) else value)
+        backend.index([(submission_id, get_text(values.get(submission_id, []))) for submission_id in ids])
+        count += len(ids)
+        last_pk = ids[-1]
+    return count
@@ -0,0 +1,205 @@
+"""
+A model field that stores Python data as typed JSON instead of pickles.
+
+Values are written as ``j:<json>``, or as ``z:<base64 zlib json>`` once the
+JSON text reaches the compression threshold. Stored values are only decoded
+the first time the attribute is read, so loading rows whose data is never
+looked at costs nothing. Unlike pickle, loading a value can never execute
+code: only the types handled below can be stored.
+"""
+
+import base64
+import datetime
+import decimal
+import zlib
+
+from django.db import models
+from django.utils import simplejson
+from form_designer import app_settings
+
+JSON_PREFIX = 'j:'
+COMPRESSED_PREFIX = 'z:'
+TYPE_KEY = '__type__'
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M:%S.%f'
+
+
+#------------------------------------------------------------------------------
+def is_serialized(value):
+    """
+    Returns True if value is a string produced by dumps().
+    """
+    return isinstance(value, basestring) and (value.startswith(JSON_PREFIX) or value.startswith(COMPRESSED_PREFIX))
+
+
+#------------------------------------------------------------------------------
+def _encode(value):
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        if TYPE_KEY in value or [key for key in value if not isinstance(key, basestring)]:
+            return {TYPE_KEY: 'dict', 'value': [[_encode(key), _encode(item)] for key, item in value.items()]}
+        return dict([(key, _encode(item)) for key, item in value.items()])
+    if isinstance(value, tuple):
+        return {TYPE_KEY: 'tuple', 'value': [_encode(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        return {TYPE_KEY: 'set', 'value': [_encode(item) for item in value]}
+    if isinstance(value, datetime.datetime):
+        return {TYPE_KEY: 'datetime', 'value': '%04d-%02d-%02dT%02d:%02d:%02d.%06d' % (value.year, value.month, value.day,
+            value.hour, value.minute, value.second, value.microsecond)}
+    if isinstance(value, datetime.date):
+        return {TYPE_KEY: 'date', 'value': '%04d-%02d-%02d' % (value.year, value.month, value.day)}
+    if isinstance(value, datetime.time):
+        return {TYPE_KEY: 'time', 'value': '%02d:%02d:%02d.%06d' % (value.hour, value.minute, value.second, value.microsecond)}
+    if isinstance(value, decimal.Decimal):
+        return {TYPE_KEY: 'decimal', 'value': str(value)}
+    raise TypeError('Cannot serialize value of type %s' % type(value).__name__)
+
+
+#------------------------------------------------------------------------------
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if not TYPE_KEY in value:
+        return dict([(key, _decode(item)) for key, item in value.items()])
+    type_name, data = value[TYPE_KEY], value['value']
+    if type_name == 'dict':
+        return dict([(_decode(key), _decode(item)) for key, item in data])
+    if type_name == 'tuple':
+        return tuple([_decode(item) for item in data])
+    if type_name == 'set':
+        return set([_decode(item) for item in data])
+    if type_name == 'datetime':
+        return datetime.datetime.strptime(data, DATETIME_FORMAT)
+    if type_name == 'date':
+        return datetime.datetime.strptime(data, DATE_FORMAT).date()
+    if type_name == 'time':
+        return datetime.datetime.strptime(data, TIME_FORMAT).time()
+    if type_name == 'decimal':
+        return decimal.Decimal(data)
+    raise ValueError('Unknown serialized type "%s"' % type_name)
+
+
+#------------------------------------------------------------------------------
+def dumps(value, compress_threshold=None):
+    """
+    Serializes value, compressing it if the JSON text is at least
+    compress_threshold characters long.
+    """
+    text = simplejson.dumps(_encode(value), separators=(',', ':'))
+    if compress_threshold is not None and len(text) >= compress_threshold:
+        return COMPRESSED_PREFIX + base64.b64encode(zlib.compress(text, 6))
+    return JSON_PREFIX + text
+
+
+#------------------------------------------------------------------------------
+def loads(data):
+    """
+    Deserializes a string produced by dumps(). Raises ValueError for anything
+    else, including legacy pickled values.
+    """
+    if data.startswith(COMPRESSED_PREFIX):
+        text = zlib.decompress(base64.b64decode(data[len(COMPRESSED_PREFIX):]))
+    elif data.startswith(JSON_PREFIX):
+        text = data[len(JSON_PREFIX):]
+    else:
+        raise ValueError('Value is not in serialized field format')
+    return _decode(simplejson.loads(text))
+
+
+
+#==============================================================================
+class SerializedData(unicode):
+    """
+    Encoded data, as loaded from the database or returned by pre_save(),
+    which get_db_prep_save() passes on unchanged.
+    """
+    pass
+
+
+
+#==============================================================================
+class SerializedObjectDescriptor(object):
+    """
+    Keeps the raw database value on the instance and decodes it on first
+    access.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            raise AttributeError('The "%s" attribute can only be accessed from %s instances.' % (self.field.name, owner.__name__))
+        if not self.field.cache_name in instance.__dict__:
+            value = instance.__dict__[self.field.attname]
+            if self.field.is_loaded(instance):
+                value = loads(value)
+            instance.__dict__[self.field.cache_name] = value
+        return instance.__dict__[self.field.cache_name]
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        instance.__dict__.pop(self.field.cache_name, None)
+        # Model.__init__ sets the values of rows loaded from the database
+        # before the queryset stores the database on the instance, so
+        # whether this value was loaded is only known once it is used
+        instance.__dict__[self.field.loaded_name] = instance._state.db is None
+
+
+
+#==============================================================================
+class SerializedObjectField(models.TextField):
+    """
+    Stores any combination of None, bools, numbers, strings, lists, tuples,
+    sets, dicts, dates, times, datetimes and decimals.
+
+    Only values loaded from the database are decoded; anything assigned to
+    the attribute, including strings that look like encoded data, is
+    encoded when saved.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.compress_threshold = kwargs.pop('compress_threshold', app_settings.get('FORM_DESIGNER_SERIALIZED_FIELD_COMPRESS_THRESHOLD'))
+        super(SerializedObjectField, self).__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name):
+        super(SerializedObjectField, self).contribute_to_class(cls, name)
+        self.cache_name = '_%s_cache' % self.attname
+        self.loaded_name = '_%s_loaded' % self.attname
+        setattr(cls, self.name, SerializedObjectDescriptor(self))
+
+    def is_loaded(self, instance):
+        """
+        Returns True if the raw value of instance was loaded from the
+        database and has not been replaced since.
+        """
+        return instance.__dict__.get(self.attname) is not None and instance.__dict__.get(self.loaded_name, False) and instance._state.db is not None
+
+    def pre_save(self, model_instance, add):
+        # values that were never read are saved as loaded, without decoding;
+        # decoded values are encoded again since they may have been mutated
+        if not self.cache_name in model_instance.__dict__:
+            if self.is_loaded(model_instance):
+                return SerializedData(model_instance.__dict__[self.attname])
+            # keep assigned values decoded once the instance has been saved
+            model_instance.__dict__[self.cache_name] = model_instance.__dict__.get(self.attname)
+        model_instance.__dict__[self.loaded_name] = False
+        value = model_instance.__dict__[self.cache_name]
+        return None if value is None else SerializedData(dumps(value, self.compress_threshold))
+
+    def get_db_prep_save(self, value, *args, **kwargs):
+        if value is None:
+            return value
+        if isinstance(value, SerializedData):
+            return unicode(value)
+        return dumps(value, self.compress_threshold)
+
+    def value_to_string(self, obj):
+        return self.get_db_prep_save(self.pre_save(obj, False))
@@ -0,0 +1,128 @@
+"""
+Multi-step forms.
+
+The fields of a form definition can be spread over several pages by giving
+them different page numbers. The values entered on completed pages are not
+stored on the server: DesignedForm carries them along in a hidden field,
+compressed and signed with SECRET_KEY so they cannot be tampered with. Only
+after the last page has been submitted are the values of all pages
+validated together, and the submission logged and mailed.
+
+File fields are always shown on the last page, since uploaded files cannot
+be carried along.
+"""
+
+import time
+
+from django.http import QueryDict
+from django.utils.crypto import constant_time_compare, salted_hmac
+from form_designer import app_settings
+from form_designer.serialized_field import dumps, loads
+from form_designer.uploads import FILE_FIELD_CLASSES
+
+KEY_SALT = 'form_designer.steps'
+
+
+#==============================================================================
+class InvalidStepData(ValueError):
+    pass
+
+
+
+#------------------------------------------------------------------------------
+def get_pages(def_fields):
+    """
+    Returns the sorted page numbers of a list of FormDefinitionFields.
+    """
+    return sorted(set([def_field.page for def_field in def_fields if not def_field.field_class in FILE_FIELD_CLASSES])) or [1]
+
+
+#------------------------------------------------------------------------------
+def get_page(def_field, pages):
+    if def_field.field_class in FILE_FIELD_CLASSES:
+        return pages[-1]
+    return def_field.page
+
+
+#------------------------------------------------------------------------------
+def get_raw_data(data, names):
+    """
+    Returns the submitted values of the named fields as a dictionary of
+    lists, including the parts of fields with several widgets, like
+    "date_0" and "date_1".
+    """
+    raw_data = {}
+    for key in data.keys():
+        base, separator, suffix = key.rpartition('_')
+        if key in names or (suffix.isdigit() and base in names):
+            raw_data[key] = data.getlist(key)
+    return raw_data
+
+
+#------------------------------------------------------------------------------
+def replace_step(step_data, page, raw_data=None):
+    """
+    Returns step_data sorted by page, with the values of page replaced by
+    raw_data, or removed if raw_data is None.
+    """
+    step_data = [(step_page, data) for step_page, data in step_data if step_page != page]
+    if raw_data is not None:
+        step_data.append((page, raw_data))
+    return sorted(step_data, key=lambda step: step[0])
+
+
+#------------------------------------------------------------------------------
+def to_query_dict(step_data, data=None):
+    """
+    Returns a QueryDict of the values of all steps. Values from data are
+    only used for fields that are not in a step.
+    """
+    query_dict = QueryDict('', mutable=True)
+    if data is not None:
+        for key in data.keys():
+            query_dict.setlist(key, data.getlist(key))
+    for page, raw_data in step_data:
+        for key, values in raw_data.items():
+            query_dict.setlist(key, values)
+    return query_dict
+
+
+#------------------------------------------------------------------------------
+def _signature(form_definition, payload):
+    return salted_hmac(KEY_SALT + form_definition.name, payload).hexdigest()
+
+
+#------------------------------------------------------------------------------
+def sign(form_definition, page, step_data):
+    """
+    Returns the signed payload for page of form_definition, carrying
+    step_data, a list of (page, raw data) pairs of the completed pages.
+    """
+    payload = dumps({
+        'definition': form_definition.pk,
+        'page': page,
+        'steps': [[step_page, raw_data] for step_page, raw_data in step_data],
+        'time': int(time.time()),
+    }, compress_threshold=0)
+    return '%s:%s' % (payload, _signature(form_definition, payload))
+
+
+#------------------------------------------------------------------------------
+def unsign(form_definition, value):
+    """
+    Returns the page and the step data of a payload created by sign().
+    Raises InvalidStepData if the payload was modified, belongs to another
+    form or has expired.
+    """
+    payload, separator, signature = (value or '').encode('ascii', 'replace').rpartition(':')
+    if not payload or not constant_time_compare(signature, _signature(form_definition, payload)):
+        raise InvalidStepData('Invalid signature')
+    try:
+        data = loads(payload)
+    except Exception:
+        raise InvalidStepData('Invalid payload')
+    if data['definition'] != form_definition.pk:
+        raise InvalidStepData('Payload belongs to another form')
+    if data['time'] + app_settings.get('FORM_DESIGNER_STEP_MAX_AGE') < time.time():
+        raise InvalidStepData('Payload has expired')
+    return data['page'], [(step_page, raw_data) for step_page, raw_data in data['steps']]
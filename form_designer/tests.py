@@ -5,7 +5,21 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+from django.conf import settings
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+
+
+class SlowEmailBackend(LocmemEmailBackend):
+    """
+    Simulates a slow mail server, see BackgroundMailTest.
+    """
+    def send_messages(self, messages):
+        import time
+        time.sleep(BackgroundMailTest.delay)
+        return super(SlowEmailBackend, self).send_messages(messages)
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -21,3 +35,941 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+
+class SerializedFieldTest(TestCase):
+    def test_round_trip(self):
+        import datetime, decimal
+        from form_designer.serialized_field import dumps, loads
+        value = {
+            'text': u'caf\xe9',
+            'number': 3,
+            'items': [1, (2, 3), set([4])],
+            'created': datetime.datetime(2010, 5, 1, 12, 30, 15, 250),
+            'day': datetime.date(1850, 1, 2),
+            'time': datetime.time(8, 15),
+            'amount': decimal.Decimal('10.25'),
+            'nested': {1: 'one', '__type__': 'not a type tag'},
+        }
+        self.assertEqual(loads(dumps(value)), value)
+
+    def test_compression_threshold(self):
+        from form_designer.serialized_field import dumps, loads, COMPRESSED_PREFIX, JSON_PREFIX
+        value = [u'some repeated text'] * 100
+        self.assertTrue(dumps(value).startswith(JSON_PREFIX))
+        compressed = dumps(value, compress_threshold=100)
+        self.assertTrue(compressed.startswith(COMPRESSED_PREFIX))
+        self.assertTrue(len(compressed) < len(dumps(value)))
+        self.assertEqual(loads(compressed), value)
+
+    def test_rejects_pickles(self):
+        import base64, pickle
+        from form_designer.serialized_field import dumps, loads
+        self.assertRaises(ValueError, loads, base64.b64encode(pickle.dumps([1, 2])))
+        self.assertRaises(TypeError, dumps, object())
+
+    def test_model_round_trip(self):
+        import datetime
+        from form_designer.models import FormDefinition, MailDigestEntry
+        definition = FormDefinition.objects.create(name='serialized')
+        values = ['j:not json', 'z:not zlib', u'caf\xe9', [{'name': 'j:', 'value': datetime.date(2026, 1, 2)}], '']
+        entries = [MailDigestEntry.objects.create(form_definition=definition, form_data=value) for value in values]
+        self.assertEqual([entry.form_data for entry in entries], values)
+        self.assertEqual([MailDigestEntry.objects.get(pk=entry.pk).form_data for entry in entries], values)
+        # values that were never read are saved unchanged
+        entry = MailDigestEntry.objects.get(pk=entries[0].pk)
+        entry.save()
+        entry = MailDigestEntry.objects.get(pk=entry.pk)
+        self.assertEqual(entry.form_data, 'j:not json')
+        entry.form_data = 'z:replaced'
+        entry.save()
+        self.assertEqual((entry.form_data, MailDigestEntry.objects.get(pk=entry.pk).form_data), ('z:replaced', 'z:replaced'))
+        MailDigestEntry.objects.filter(pk=entry.pk).update(form_data='j:updated')
+        self.assertEqual(MailDigestEntry.objects.get(pk=entry.pk).form_data, 'j:updated')
+
+    def test_migrate_pickled_fields(self):
+        import base64, pickle, sys
+        from StringIO import StringIO
+        from django.core.management import call_command
+        from django.db import connection
+        from form_designer.models import FormDefinition, MailDigestEntry
+        from form_designer.serialized_field import dumps
+        definition = FormDefinition.objects.create(name='pickled')
+        rows = [base64.b64encode(pickle.dumps([{'name': 'a', 'value': (1, 2)}])), dumps(['new']), 'garbage']
+        entries = [MailDigestEntry.objects.create(form_definition=definition, form_data=[]) for row in rows]
+        cursor = connection.cursor()
+        for entry, row in zip(entries, rows):
+            cursor.execute('UPDATE %s SET form_data = %%s WHERE id = %%s' % MailDigestEntry._meta.db_table, [row, entry.pk])
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            call_command('migrate_pickled_fields', 'form_designer.MailDigestEntry', 'form_data', batch_size=2)
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        self.assertEqual(output, 'Converted 1 rows, skipped 1, failed 1\n')
+        self.assertTrue('pk=%d' % entries[2].pk in errors)
+        self.assertEqual([MailDigestEntry.objects.get(pk=entry.pk).form_data for entry in entries[:2]], [[{'name': 'a', 'value': (1, 2)}], ['new']])
+
+
+class UploadLimitTest(TestCase):
+    urls = 'form_designer.urls'
+
+    def test_allowed_types(self):
+        from form_designer.models import FormDefinitionField
+        from form_designer.uploads import is_allowed_type, check_file
+        field = FormDefinitionField(name='cv', field_class='forms.FileField', allowed_file_types='pdf, .DOC, image/*', max_file_size=100)
+        self.assertTrue(is_allowed_type(field, 'cv.pdf', 'application/octet-stream'))
+        self.assertTrue(is_allowed_type(field, 'cv.doc', None))
+        self.assertTrue(is_allowed_type(field, 'photo', 'image/png'))
+        self.assertFalse(is_allowed_type(field, 'script.exe', 'application/x-msdownload'))
+        self.assertEqual(check_file(field, 'cv.pdf', None, 100), None)
+        self.assertNotEqual(check_file(field, 'cv.pdf', None, 101), None)
+
+    def test_streamed_limit_with_csrf_checks(self):
+        from django.conf import settings
+        from django.test.client import Client
+        from StringIO import StringIO
+        from form_designer.models import FormDefinition, FormDefinitionField
+        definition = FormDefinition.objects.create(name='application', log_data=False)
+        FormDefinitionField.objects.create(form_definition=definition, name='cv', field_class='forms.FileField', max_file_size=10)
+        middleware = settings.MIDDLEWARE_CLASSES
+        settings.MIDDLEWARE_CLASSES = ('django.middleware.csrf.CsrfViewMiddleware',)
+        try:
+            client = Client(enforce_csrf_checks=True)
+            url = '/%s/' % definition.name
+            self.assertEqual(client.post(url, {definition.submit_flag_name: '1'}).status_code, 403)
+            client.get(url)
+            cv = StringIO('x' * 100)
+            cv.name = 'cv.pdf'
+            response = client.post(url, {definition.submit_flag_name: '1', 'cv': cv, 'csrfmiddlewaretoken': client.cookies[settings.CSRF_COOKIE_NAME].value})
+        finally:
+            settings.MIDDLEWARE_CLASSES = middleware
+        self.assertEqual(response.status_code, 200)
+        # rejected by the upload handler, not by the check after the fact
+        self.assertTrue('cv' in response.context['form'].upload_errors)
+
+    def test_files_stored_by_log(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from form_designer.models import FormDefinition, FormDefinitionField
+        from form_designer.views import DesignedForm
+        definition = FormDefinition.objects.create(name='application')
+        FormDefinitionField.objects.create(form_definition=definition, name='cv', field_class='forms.FileField')
+        form = DesignedForm(definition, None, {}, {'cv': SimpleUploadedFile('cv.pdf', 'PDF')})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(definition.get_form_data(form)[0]['value'], 'cv.pdf')
+        self.assertTrue(hasattr(form.cleaned_data['cv'], 'read'))
+
+
+class WebhookDeliveryTest(TestCase):
+    def setUp(self):
+        import BaseHTTPServer, SocketServer, threading
+        self.requests = []
+        self.status = 200
+        self.delay = 0
+        self.close = False
+        test = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                import time
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                test.requests.append((dict(self.headers), body))
+                time.sleep(test.delay)
+                self.send_response(test.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                # close the connection without telling the client
+                self.close_connection = test.close
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            # each worker keeps its own connection open
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # clients that time out close the connection early
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/hook' % self.server.server_port
+
+        from form_designer.models import FormDefinition, FormDefinitionWebhook
+        self.definition = FormDefinition.objects.create(name='hooked')
+        self.webhook = FormDefinitionWebhook.objects.create(form_definition=self.definition, url=self.url, secret='s3cret')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def queue(self, count=1):
+        from form_designer import webhooks
+        for i in range(count):
+            webhooks.queue(self.definition, [{'name': 'email', 'label': 'E-mail', 'value': 'user%d@example.com' % i}])
+
+    def test_signed_delivery(self):
+        from django.utils import simplejson
+        from form_designer.models import WebhookDelivery
+        from form_designer.webhooks import deliver_pending, sign, SIGNATURE_HEADER
+        self.queue()
+        self.assertEqual(deliver_pending(workers=2), (1, 0))
+        headers, body = self.requests[0]
+        self.assertEqual(headers[SIGNATURE_HEADER.lower()], sign('s3cret', body))
+        self.assertEqual(simplejson.loads(body)['data'][0]['value'], 'user0@example.com')
+        self.assertEqual(WebhookDelivery.objects.get().status, WebhookDelivery.STATUS_DELIVERED)
+
+    def test_batches(self):
+        from django.utils import simplejson
+        from form_designer.webhooks import deliver_pending
+        self.webhook.batch_size = 2
+        self.webhook.save()
+        self.queue(3)
+        self.assertEqual(deliver_pending(workers=2), (3, 0))
+        self.assertEqual(sorted([len(simplejson.loads(body)) for headers, body in self.requests]), [1, 2])
+
+    def test_claim(self):
+        import datetime
+        from form_designer.models import WebhookDelivery
+        from form_designer.webhooks import claim, deliver_pending
+        self.queue(2)
+        now = datetime.datetime.now()
+        first, second = list(WebhookDelivery.objects.order_by('pk')), list(WebhookDelivery.objects.order_by('pk'))
+        self.assertEqual(len(claim(first[:1], now)), 1)
+        # another process read the same rows before the claim
+        self.assertEqual(len(claim(second, now)), 1)
+        self.assertEqual(deliver_pending(), (0, 0))
+        WebhookDelivery.objects.update(next_attempt=now)
+        # claims have expired
+        self.assertEqual(deliver_pending(), (2, 0))
+        self.assertEqual(len(self.requests), 2)
+
+    def test_connection_reuse(self):
+        from form_designer.httpclient import ConnectionPool, HTTPError
+        pool = ConnectionPool(timeout=0.5)
+        self.close = True
+        self.assertEqual(pool.request('POST', self.url, 'a')[0], 200)
+        # the server closed the pooled connection, so the request is sent again
+        self.close = False
+        self.assertEqual(pool.request('POST', self.url, 'b')[0], 200)
+        self.assertEqual([body for headers, body in self.requests], ['a', 'b'])
+        # the request reached the server, so a timeout is not retried
+        self.delay = 1
+        self.assertRaises(HTTPError, pool.request, 'POST', self.url, 'c')
+        self.assertEqual([body for headers, body in self.requests], ['a', 'b', 'c'])
+        pool.close()
+
+    def test_backoff_and_dead_letter(self):
+        import datetime
+        from form_designer.models import WebhookDelivery
+        from form_designer.webhooks import deliver_pending
+        self.status = 500
+        self.queue()
+        self.assertEqual(deliver_pending(), (0, 1))
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual(delivery.status, WebhookDelivery.STATUS_PENDING)
+        self.assertTrue(delivery.next_attempt > datetime.datetime.now())
+        # not due yet
+        self.assertEqual(deliver_pending(), (0, 0))
+        from form_designer import app_settings
+        WebhookDelivery.objects.update(attempts=app_settings.get('FORM_DESIGNER_WEBHOOK_MAX_ATTEMPTS') - 1, next_attempt=datetime.datetime.now())
+        self.assertEqual(deliver_pending(), (0, 1))
+        self.assertEqual(WebhookDelivery.objects.get().status, WebhookDelivery.STATUS_DEAD)
+
+
+class RelayTest(TestCase):
+    def test_circuit_breaker(self):
+        import time
+        from form_designer.relay import CircuitBreaker
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        breaker.record_failure('host')
+        self.assertTrue(breaker.allow('host'))
+        breaker.record_failure('host')
+        self.assertFalse(breaker.allow('host'))
+        time.sleep(0.25)
+        # one trial request after the timeout, then closed again on success
+        self.assertTrue(breaker.allow('host'))
+        self.assertFalse(breaker.allow('host'))
+        breaker.record_success('host')
+        self.assertTrue(breaker.allow('host'))
+
+    def test_encode_form_data(self):
+        from django.http import QueryDict
+        from form_designer.models import FormDefinition
+        from form_designer.relay import encode_form_data
+
+        class Form(object):
+            form_definition = FormDefinition(name='relayed')
+            data = QueryDict('name=J%C3%BCrg&tags=a&tags=b&csrfmiddlewaretoken=x&submit__relayed=1&submit__relayed_steps=p:s&submit__relayed_back=1')
+
+        self.assertEqual(sorted(encode_form_data(Form()).split('&')), ['name=J%C3%BCrg', 'tags=a', 'tags=b'])
+
+
+class AdminFieldEditingTest(TestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='admin-form')
+        self.fields = [FormDefinitionField.objects.create(form_definition=self.definition, name='field_%d' % i, field_class='forms.CharField', position=i) for i in range(3)]
+
+    def test_update_positions(self):
+        from form_designer.models import FormDefinitionField
+        FormDefinitionField.objects.update_positions({self.fields[0].pk: 2, self.fields[2].pk: 0})
+        self.assertEqual([field.name for field in self.definition.fields.all()], ['field_2', 'field_1', 'field_0'])
+
+    def test_choice_list(self):
+        from form_designer.admin import FormDefinitionFieldInlineForm
+        from form_designer.models import FormDefinitionFieldChoice
+        field = self.fields[0]
+        data = {'form_definition': self.definition.pk, 'name': field.name, 'field_class': 'forms.ChoiceField',
+            'required': 'on', 'include_result': 'on', 'position': 0, 'choice_list': 'a|Apple\r\nb\r\n\r\n'}
+        form = FormDefinitionFieldInlineForm(data, instance=field)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual([(choice.value, choice.label) for choice in field.choices.all()], [('a', 'Apple'), ('b', 'b')])
+        # an empty page means the first one
+        self.assertEqual(field.page, 1)
+        self.assertEqual(FormDefinitionFieldInlineForm(instance=field).initial['choice_list'], 'a|Apple\r\nb')
+
+        data['choice_list'] = 'c|Cherry'
+        form = FormDefinitionFieldInlineForm(data, instance=field)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual([choice.value for choice in field.choices.all()], ['c'])
+        self.assertEqual(FormDefinitionFieldChoice.objects.count(), 1)
+
+    def test_choice_order_and_cleanup(self):
+        from form_designer.models import FormDefinitionFieldChoice
+        field = self.fields[0]
+        second = FormDefinitionFieldChoice.objects.create(value='b', label='B')
+        first = FormDefinitionFieldChoice.objects.create(value='a', label='A')
+        field.choices.add(first)
+        field.choices.add(second)
+        # in the order they were added, not by their primary keys
+        self.assertEqual([choice.value for choice in field.get_ordered_choices()], ['a', 'b'])
+        self.assertFalse(field.set_choices([('a', 'A'), ('b', 'B')]))
+        shared = FormDefinitionFieldChoice.objects.create(value='c', label='C')
+        self.fields[1].choices.add(shared)
+        field.choices.add(shared)
+        field.delete()
+        self.assertEqual(list(FormDefinitionFieldChoice.objects.values_list('value', flat=True)), ['c'])
+
+
+class BackgroundMailTest(TestCase):
+    delay = 0.5
+
+    def setUp(self):
+        from django.conf import settings
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='slow-mail', mail_to='admin@example.com', log_data=False)
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField')
+        self.email_backend = settings.EMAIL_BACKEND
+        settings.EMAIL_BACKEND = 'form_designer.tests.SlowEmailBackend'
+
+    def tearDown(self):
+        from django.conf import settings
+        settings.EMAIL_BACKEND = self.email_backend
+
+    def submit(self, background):
+        from django.http import HttpRequest, QueryDict
+        from form_designer.views import process_form
+        request = HttpRequest()
+        request.method = 'POST'
+        request.POST = QueryDict('name=Jane&%s=1' % self.definition.submit_flag_name)
+        return process_form(request, self.definition, {}, background=background)
+
+    def test_slow_mail_does_not_block(self):
+        import time
+        from django.core import mail
+        from form_designer.mail import get_pool
+        start = time.time()
+        self.submit(False)
+        self.assertTrue(time.time() - start >= self.delay)
+
+        start = time.time()
+        for i in range(4):
+            self.submit(True)
+        self.assertTrue(time.time() - start < self.delay)
+        get_pool().wait()
+        self.assertEqual(len(mail.outbox), 5)
+
+
+class SubmissionBufferTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='buffered')
+        for name in ('name', 'email'):
+            FormDefinitionField.objects.create(form_definition=self.definition, name=name, field_class='forms.CharField')
+        self.path = tempfile.mktemp(suffix='.sqlite3')
+
+    def tearDown(self):
+        import glob, os
+        for path in glob.glob(self.path + '*'):
+            os.remove(path)
+
+    def form_data(self, i):
+        return [{'name': 'name', 'label': 'Name', 'value': u'User %d' % i}, {'name': 'email', 'label': 'E-mail', 'value': 'user%d@example.com' % i}]
+
+    def test_flush(self):
+        from form_designer.buffer import SubmissionBuffer
+        from form_designer.models import FormSubmission, FormFieldSubmission
+        spool = SubmissionBuffer(self.path, max_entries=3)
+        for i in range(3):
+            self.assertTrue(spool.append(self.definition, self.form_data(i)))
+        self.assertFalse(spool.append(self.definition, self.form_data(3)))
+        self.assertEqual(FormSubmission.objects.count(), 0)
+
+        # a new instance sees the same data, as after a restart
+        spool = SubmissionBuffer(self.path)
+        self.assertEqual(spool.flush(batch_size=2), 2)
+        self.assertEqual(spool.flush(batch_size=2), 1)
+        self.assertEqual(spool.flush(batch_size=2), 0)
+        self.assertEqual(spool.count(), 0)
+        self.assertEqual(FormSubmission.objects.count(), 3)
+        self.assertEqual(sorted(FormFieldSubmission.objects.filter(definition_field__name='email').values_list('value', flat=True)),
+            ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertEqual(FormSubmission.objects.all()[0].form_definition, self.definition)
+
+
+class MailDigestTest(TestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition
+        self.definition = FormDefinition.objects.create(name='digest', title='Digest', mail_to='admin@example.com, {{ email }}',
+            mail_digest_interval=60, mail_digest_size=3)
+
+    def queue(self, email):
+        from form_designer import digest
+        return digest.queue(self.definition, [{'name': 'email', 'label': 'E-mail', 'value': email}])
+
+    def test_interval_and_size(self):
+        import datetime
+        from django.core import mail
+        from form_designer.digest import send_due_digests
+        from form_designer.models import MailDigestEntry
+        self.queue('a@example.com')
+        self.assertEqual(send_due_digests(), (0, 0))
+        self.assertEqual(send_due_digests(datetime.datetime.now() + datetime.timedelta(minutes=61)), (1, 1))
+        self.assertEqual(MailDigestEntry.objects.count(), 0)
+
+        for i in range(3):
+            self.queue('b@example.com')
+        self.queue('c@example.com')
+        self.assertEqual(send_due_digests(), (2, 4))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[1].to, ['admin@example.com', 'b@example.com'])
+        self.assertEqual(mail.outbox[1].body.count('b@example.com'), 3)
+        self.assertEqual(mail.outbox[1].subject, 'Digest (3 submissions)')
+
+    def test_subject_fallback_and_purge(self):
+        from django.core import mail
+        from form_designer.digest import send_due_digests
+        from form_designer.models import MailDigestEntry
+        self.definition.title = None
+        self.definition.mail_digest_size = 1
+        self.definition.save()
+        self.queue('a@example.com')
+        self.assertEqual(send_due_digests(), (1, 1))
+        self.assertEqual(mail.outbox[0].subject, 'digest (1 submissions)')
+
+        # entries of a definition that no longer uses digests are sent right away
+        self.definition.mail_digest_size = 5
+        self.definition.save()
+        self.queue('b@example.com')
+        self.definition.mail_digest_size = None
+        self.definition.mail_digest_interval = None
+        self.definition.save()
+        self.assertEqual(send_due_digests(), (1, 1))
+        self.assertEqual((len(mail.outbox), MailDigestEntry.objects.count()), (2, 0))
+
+        self.queue('c@example.com')
+        self.definition.mail_to = ''
+        self.definition.save()
+        self.assertEqual(send_due_digests(), (0, 0))
+        self.assertEqual(MailDigestEntry.objects.count(), 0)
+
+    def test_partial_failure(self):
+        import datetime
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from form_designer.digest import send_due_digests
+        from form_designer.models import MailDigestEntry
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            self.queue(email)
+        send_messages = EmailBackend.send_messages
+        def fail_for_b(backend, messages):
+            if 'b@example.com' in messages[0].to:
+                raise IOError('Connection lost')
+            return send_messages(backend, messages)
+        EmailBackend.send_messages = fail_for_b
+        try:
+            self.assertRaises(IOError, send_due_digests)
+        finally:
+            EmailBackend.send_messages = send_messages
+        # only the entries of the failed and the unsent messages are kept
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual([entry.form_data[0]['value'] for entry in MailDigestEntry.objects.order_by('pk')], ['b@example.com', 'c@example.com'])
+        self.assertEqual(send_due_digests(datetime.datetime.now() + datetime.timedelta(minutes=61)), (2, 2))
+
+
+class SubmissionSearchTest(TestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='searchable')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='email', field_class='forms.EmailField')
+
+    def log(self, name, email):
+        from form_designer.views import DesignedForm
+        form = DesignedForm(self.definition, None, {'name': name, 'email': email})
+        self.assertTrue(form.is_valid(), form.errors)
+        return self.definition.log(form)
+
+    def test_tokenize(self):
+        from form_designer.search import tokenize
+        self.assertEqual(tokenize(u'Jane Doe <Jane.Doe@Example.com>.'), ['jane', 'doe', 'jane.doe@example.com', 'example', 'com'])
+
+    def test_token_backend(self):
+        from form_designer.models import FormSubmission
+        from form_designer.search import TokenBackend
+        backend = TokenBackend('default')
+        first, second = self.log('Jane Doe', 'jane@example.com'), self.log('John Doe', 'john@example.org')
+        backend.clear()
+        backend.index([(first.pk, u'Jane Doe jane@example.com'), (second.pk, u'John Doe john@example.org')])
+        self.assertEqual(list(backend.filter(FormSubmission.objects.order_by('pk'), 'doe')), [first, second])
+        self.assertEqual(list(backend.filter(FormSubmission.objects.all(), 'jane@example.com')), [first])
+        self.assertEqual(list(backend.filter(FormSubmission.objects.all(), 'doe jo')), [second])
+
+    def test_search_logged_submissions(self):
+        from form_designer.models import FormSubmission
+        from form_designer.search import search, rebuild
+        first, second = self.log('Jane Doe', 'jane@example.com'), self.log('John Doe', 'john@example.org')
+        self.assertEqual(list(search(FormSubmission.objects.all(), 'john@example.org')), [second])
+        self.assertEqual(rebuild(batch_size=1), 2)
+        self.assertEqual(list(search(FormSubmission.objects.all(), 'jane')), [first])
+
+
+class CommittedSearchIndexTest(TransactionTestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition, FormDefinitionField
+        from form_designer.search import setup
+        setup()
+        self.definition = FormDefinition.objects.create(name='searchable')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='tags', field_class='forms.MultipleChoiceField').set_choices(
+            [(u'red', u'Red'), (u'green', u'Green')])
+
+    def tearDown(self):
+        from form_designer.models import FormDefinitionFieldChoice, FormSubmission
+        from form_designer.search import get_backend
+        get_backend().clear()
+        # committed data is only flushed before the next TransactionTestCase
+        FormSubmission.objects.all().delete()
+        FormDefinitionFieldChoice.objects.all().delete()
+        self.definition.delete()
+
+    def test_index_is_committed(self):
+        from django.db import transaction
+        from django.http import QueryDict
+        from form_designer.models import FormSubmission
+        from form_designer.search import search
+        from form_designer.views import DesignedForm
+        form = DesignedForm(self.definition, None, QueryDict('name=Jane&tags=red&tags=green'))
+        self.assertTrue(form.is_valid(), form.errors)
+        submission = self.definition.log(form)
+        # anything not committed by log() is lost
+        transaction.rollback()
+        self.assertEqual(list(search(FormSubmission.objects.all(), 'jane')), [submission])
+        self.assertEqual(list(search(FormSubmission.objects.all(), 'green')), [submission])
+        self.assertEqual(list(search(FormSubmission.objects.all(), 'u')), [])
+
+
+class FieldValidationTest(TestCase):
+    def test_regex_lint(self):
+        from form_designer.validators import lint_regex
+        self.assertEqual(lint_regex(r'^[\w.+-]+@[\w-]+\.[\w.]+$'), [])
+        self.assertEqual(lint_regex(r'^\d{3}-\d{4}$'), [])
+        self.assertEqual(len(lint_regex('(')), 1)
+        self.assertEqual(len(lint_regex('^(a+)+$')), 1)
+        self.assertEqual(len(lint_regex(r'^(\w+\s?)*$')), 1)
+        self.assertEqual(len(lint_regex(r'^(\w+a)+$')), 1)
+        self.assertEqual(len(lint_regex(r'^(.*,)*$')), 1)
+        # a mandatory separator the inner repetition cannot match makes
+        # nesting safe
+        self.assertEqual(lint_regex(r'^[\w.+-]+@(\w+\.)+\w+$'), [])
+        self.assertEqual(lint_regex(r'^([A-Z][a-z]+ )*[A-Z][a-z]+$'), [])
+        self.assertEqual(lint_regex(r'^\d+(,\d+)*$'), [])
+        # overlapping alternatives
+        self.assertEqual(len(lint_regex(r'^(\w|\d)+$')), 1)
+        self.assertEqual(len(lint_regex(r'^(a|a)+$')), 1)
+        self.assertEqual(len(lint_regex(r'(a|aa)+$')), 1)
+        self.assertEqual(len(lint_regex(r'^(x(\w|\d))*$')), 1)
+        self.assertEqual(lint_regex(r'^(com|org|net)+$'), [])
+        self.assertEqual(lint_regex(r'^(\d{3}-|[a-z]\.)*$'), [])
+        self.assertEqual(lint_regex(r'^(https?|ftp)://\S+$'), [])
+
+    def test_field_spec(self):
+        from django.core.exceptions import ValidationError
+        from form_designer.models import FormDefinitionField
+        field = FormDefinitionField(name='code', field_class='forms.RegexField', min_length=5, max_length=3, max_digits=2, decimal_places=3)
+        try:
+            field.clean_fields(exclude=['form_definition'])
+        except ValidationError as error:
+            self.assertEqual(sorted(error.message_dict.keys()), ['decimal_places', 'min_length', 'regex'])
+        else:
+            self.fail('ValidationError not raised')
+        field = FormDefinitionField(name='code', field_class='forms.RegexField', regex='^[A-Z]{3}$')
+        field.clean_fields(exclude=['form_definition'])
+
+    def test_field_spec_errors_in_admin(self):
+        from form_designer.admin import FormDefinitionFieldInlineForm
+        from form_designer.models import FormDefinition
+        definition = FormDefinition.objects.create(name='validated')
+        form = FormDefinitionFieldInlineForm({'form_definition': definition.pk, 'name': 'code', 'field_class': 'forms.RegexField',
+            'required': 'on', 'position': 0, 'min_length': 5, 'max_length': 3, 'regex': '^(a+)+$'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(sorted(form.errors.keys()), ['min_length', 'regex'])
+
+    def test_compiled_regex_reused(self):
+        from form_designer.models import FormDefinitionField
+        field = FormDefinitionField(name='code', field_class='forms.RegexField', regex='^[A-Z]{3}$')
+        self.assertTrue(field.get_form_field_init_args()['regex'] is field.get_form_field_init_args()['regex'])
+
+
+class DefinitionExchangeTest(TestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='exchange', title='Exchange', action='http://example.com/')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField', position=1)
+        color = FormDefinitionField.objects.create(form_definition=self.definition, name='color', field_class='forms.ChoiceField', position=2)
+        color.set_choices([(u'r', u'Red'), (u'g', u'Green')])
+
+    def test_round_trip(self):
+        from form_designer.exchange import export_definitions, import_definitions
+        from form_designer.models import FormDefinition
+        document = export_definitions(FormDefinition.objects.all())
+        stats = import_definitions(document)
+        self.assertEqual((stats['definitions_unchanged'], stats['fields_unchanged'], stats['choices_updated']), (1, 2, 0))
+
+        document['definitions'][0]['title'] = 'Changed'
+        document['definitions'][0]['fields'][1]['choices'].append({'value': 'b', 'label': 'Blue'})
+        document['definitions'][0]['fields'].append({'name': 'age', 'field_class': 'forms.IntegerField', 'choices': []})
+        stats = import_definitions(document)
+        self.assertEqual((stats['definitions_updated'], stats['fields_created'], stats['choices_updated']), (1, 1, 1))
+        definition = FormDefinition.objects.get(name='exchange')
+        self.assertEqual(definition.title, 'Changed')
+        self.assertEqual([choice.value for choice in definition.fields.get(name='color').choices.order_by('pk')], ['r', 'g', 'b'])
+
+        del document['definitions'][0]['fields'][0]
+        stats = import_definitions(document, prune=True)
+        self.assertEqual(stats['fields_deleted'], 1)
+        self.assertEqual(sorted(definition.fields.values_list('name', flat=True)), ['age', 'color'])
+
+    def test_invalid_document(self):
+        from form_designer.exchange import ExchangeError, import_definitions
+        self.assertRaises(ExchangeError, import_definitions, {'format': 'something else'})
+        self.assertRaises(ExchangeError, import_definitions, {'format': 'form_designer', 'version': 1, 'definitions': [{'title': 'No name'}]})
+
+    def test_invalid_fields(self):
+        from form_designer.exchange import ExchangeError, export_definitions, import_definitions
+        from form_designer.models import FormDefinition
+        for changes in ({'field_class': 'forms.RegexField', 'regex': '(a+)+$'}, {'regex': '('}, {'min_value': 10, 'max_value': 1},
+                {'max_length': 'many'}, {'name': 'color'}):
+            document = export_definitions(FormDefinition.objects.all())
+            document['definitions'][0]['fields'][0].update(changes)
+            document['definitions'][0]['title'] = 'Changed'
+            try:
+                import_definitions(document)
+            except ExchangeError as error:
+                self.assertTrue('"exchange"' in unicode(error), error)
+            else:
+                self.fail('ExchangeError not raised for %r' % changes)
+            self.assertEqual(FormDefinition.objects.get().title, 'Exchange')
+
+    def test_invalid_definition(self):
+        from form_designer.exchange import ExchangeError, import_definitions
+        from form_designer.models import FormDefinition, FormDefinitionField
+        document = {'format': 'form_designer', 'version': 1, 'definitions': [
+            {'name': 'bad name!', 'method': 'PUT', 'fields': [{'name': 'a b', 'field_class': 'forms.Bogus', 'widget': 'x.Y'}]}]}
+        for names in (('method', 'name'), ('field_class', 'name', 'widget')):
+            try:
+                import_definitions(document)
+            except ExchangeError as error:
+                for name in names:
+                    self.assertTrue('%s:' % name in unicode(error), error)
+            else:
+                self.fail('ExchangeError not raised')
+            document['definitions'][0].update({'name': 'good', 'method': 'POST'})
+        self.assertEqual((FormDefinition.objects.count(), FormDefinitionField.objects.count()), (1, 2))
+
+
+class ReportingRouterTest(TestCase):
+    def setUp(self):
+        from django.conf import settings
+        self.reporting_database = getattr(settings, 'FORM_DESIGNER_REPORTING_DATABASE', None)
+        settings.FORM_DESIGNER_REPORTING_DATABASE = 'replica'
+
+    def tearDown(self):
+        from django.conf import settings
+        settings.FORM_DESIGNER_REPORTING_DATABASE = self.reporting_database
+
+    def test_reporting_queries(self):
+        from django.conf import settings
+        from form_designer.models import FormSubmission
+        from form_designer.routers import for_reporting, is_reporting_db
+        self.assertEqual(for_reporting(FormSubmission.objects.all()).db, 'replica')
+        self.assertTrue(is_reporting_db('replica'))
+        self.assertFalse(is_reporting_db('default'))
+        settings.FORM_DESIGNER_REPORTING_DATABASE = None
+        self.assertEqual(for_reporting(FormSubmission.objects.all()).db, 'default')
+
+    def test_writes_stay_on_primary(self):
+        from django.contrib.auth.models import User
+        from form_designer.models import FormDefinition, FormSubmission
+        from form_designer.routers import ReportingRouter
+        router = ReportingRouter()
+        submission = FormSubmission()
+        submission._state.db = 'replica'
+        self.assertEqual(router.db_for_write(FormSubmission, instance=submission), 'default')
+        self.assertEqual(router.db_for_write(FormDefinition), 'default')
+        self.assertEqual(router.db_for_write(User), None)
+        self.assertEqual(router.db_for_read(FormSubmission, instance=submission), None)
+        self.assertTrue(router.allow_relation(submission, FormDefinition()))
+
+
+class ReplicaExportTest(TestCase):
+    """
+    Needs a second database alias "replica" that is a separate database, not
+    a TEST_MIRROR of the default one, e.g. another SQLite file.
+    """
+    multi_db = True
+    urls = 'form_designer.admin_urls'
+
+    def setUp(self):
+        from django.conf import settings
+        from django.db import router
+        from form_designer.routers import ReportingRouter
+        self.reporting_database = getattr(settings, 'FORM_DESIGNER_REPORTING_DATABASE', None)
+        settings.FORM_DESIGNER_REPORTING_DATABASE = 'replica'
+        self.routers = router.routers
+        router.routers = [ReportingRouter()]
+
+    def tearDown(self):
+        from django.conf import settings
+        from django.db import router
+        settings.FORM_DESIGNER_REPORTING_DATABASE = self.reporting_database
+        router.routers = self.routers
+
+    def log(self, using, pk, value):
+        from form_designer.models import FormDefinition, FormDefinitionField, FormSubmission, FormFieldSubmission
+        definition, created = FormDefinition.objects.using(using).get_or_create(pk=1, defaults={'name': 'replicated'})
+        def_field, created = FormDefinitionField.objects.using(using).get_or_create(pk=1, defaults={'form_definition': definition, 'name': 'name', 'field_class': 'forms.CharField'})
+        submission = FormSubmission(pk=pk, definition=definition)
+        submission.save(using=using)
+        FormFieldSubmission(submission=submission, definition_field=def_field, value=value).save(using=using)
+        return submission
+
+    @unittest.skipUnless('replica' in settings.DATABASES and not settings.DATABASES['replica'].get('TEST_MIRROR'), 'needs a separate "replica" database')
+    def test_export_reads_replica(self):
+        from django.contrib.auth.models import User
+        from form_designer.models import FormSubmission
+        self.log('default', 1, u'Written to the primary')
+        replicated = self.log('replica', 2, u'Read from the replica')
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.assertTrue(self.client.login(username='admin', password='secret'))
+        response = self.client.get('/formsubmission/export_csv/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('Read from the replica' in response.content)
+        self.assertFalse('Written to the primary' in response.content)
+
+        # objects read from the replica are saved to the primary
+        submission = FormSubmission.objects.using('replica').get(pk=replicated.pk)
+        submission.save()
+        self.assertEqual(sorted(FormSubmission.objects.using('default').values_list('pk', flat=True)), [1, 2])
+
+
+class PartitionTest(TestCase):
+    def setUp(self):
+        from django.conf import settings
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.partitioning = getattr(settings, 'FORM_DESIGNER_PARTITIONING', None)
+        settings.FORM_DESIGNER_PARTITIONING = 'definition-month'
+        self.definition = FormDefinition.objects.create(name='partitioned', log_data=True)
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField')
+
+    def tearDown(self):
+        from django.conf import settings
+        settings.FORM_DESIGNER_PARTITIONING = self.partitioning
+
+    def log(self, name, created=None):
+        from form_designer.models import FormSubmission, FormFieldSubmission
+        from form_designer.partitions import get_partition
+        from form_designer.views import DesignedForm
+        form = DesignedForm(self.definition, None, {'name': name})
+        self.assertTrue(form.is_valid(), form.errors)
+        submission = self.definition.log(form)
+        if created:
+            # created is set automatically on save
+            partition = get_partition(self.definition.pk, created)
+            FormSubmission.objects.filter(pk=submission.pk).update(created=created, partition=partition)
+            FormFieldSubmission.objects.filter(submission=submission).update(partition=partition)
+        return submission
+
+    def test_partition_keys(self):
+        import datetime
+        from form_designer.partitions import get_partition, parse_partition
+        self.assertEqual(get_partition(12, datetime.datetime(2026, 3, 5)), 'f12-2026-03')
+        self.assertEqual(get_partition(None, datetime.datetime(2026, 3, 5)), '')
+        self.assertEqual(parse_partition('f12-2026-03'), (12, (2026, 3)))
+        self.assertEqual(parse_partition('2026-03'), (None, (2026, 3)))
+        self.assertEqual(parse_partition('f12'), (12, None))
+        self.assertEqual(parse_partition(''), (None, None))
+
+    def test_upcoming_keys(self):
+        import datetime
+        from django.conf import settings
+        from form_designer.partitions import create_partitions, get_upcoming_keys
+        today = datetime.date(2026, 11, 15)
+        self.assertEqual(get_upcoming_keys([3, 4], 2, today), ['f3-2026-11', 'f3-2026-12', 'f3-2027-01', 'f4-2026-11', 'f4-2026-12', 'f4-2027-01'])
+        settings.FORM_DESIGNER_PARTITIONING = 'month'
+        self.assertEqual(get_upcoming_keys([3, 4], 1, today), ['2026-11', '2026-12'])
+        settings.FORM_DESIGNER_PARTITIONING = 'definition'
+        self.assertEqual(get_upcoming_keys([3, 4], 1, today), ['f3', 'f4'])
+        # partitions only exist as tables with native partitioning
+        self.assertEqual(create_partitions(), [])
+
+    def test_log_stores_partition(self):
+        import datetime
+        submission = self.log('Jane')
+        self.assertEqual(submission.definition, self.definition)
+        self.assertEqual(submission.partition, 'f%d-%s' % (self.definition.pk, datetime.date.today().strftime('%Y-%m')))
+        self.assertEqual(list(submission.fields.values_list('partition', flat=True)), [submission.partition])
+
+    def test_prune(self):
+        import datetime
+        from form_designer.models import FormSubmission, FormFieldSubmission
+        from form_designer.partitions import prune
+        old = self.log('Old', datetime.datetime(2025, 1, 10))
+        recent = self.log('Recent', datetime.datetime(2025, 2, 20))
+        current = self.log('Current')
+        dropped, deleted = prune(datetime.datetime(2025, 2, 25))
+        self.assertEqual((dropped, deleted), (['f%d-2025-01' % self.definition.pk], 1))
+        self.assertEqual(list(FormSubmission.objects.values_list('pk', flat=True)), [current.pk])
+        self.assertEqual(FormFieldSubmission.objects.filter(submission__in=[old.pk, recent.pk]).count(), 0)
+
+    def test_backfill(self):
+        from form_designer.models import FormSubmission
+        from form_designer.partitions import backfill
+        submission = self.log('Jane')
+        FormSubmission.objects.filter(pk=submission.pk).update(definition=None, partition='')
+        self.assertEqual(backfill(), 1)
+        submission = FormSubmission.objects.get(pk=submission.pk)
+        self.assertEqual((submission.definition_id, submission.partition), (self.definition.pk, submission.fields.all()[0].partition))
+
+
+class MultiStepFormTest(TestCase):
+    def setUp(self):
+        from form_designer.models import FormDefinition, FormDefinitionField
+        self.definition = FormDefinition.objects.create(name='questionnaire')
+        FormDefinitionField.objects.create(form_definition=self.definition, name='name', field_class='forms.CharField', page=1)
+        FormDefinitionField.objects.create(form_definition=self.definition, name='email', field_class='forms.EmailField', page=2)
+        FormDefinitionField.objects.create(form_definition=self.definition, name='comment', field_class='forms.CharField', required=False, page=3)
+
+    def submit(self, form, **values):
+        from django.http import QueryDict
+        from form_designer.views import bind_form
+        data = QueryDict('', mutable=True)
+        data[self.definition.submit_flag_name] = '1'
+        data[self.definition.steps_field_name] = form.fields[self.definition.steps_field_name].initial
+        data.update(values)
+        return bind_form(self.definition, data)
+
+    def test_steps(self):
+        from form_designer.models import FormSubmission
+        from form_designer.views import DesignedForm
+        form = DesignedForm(self.definition)
+        self.assertEqual((form.page, form.pages), (1, [1, 2, 3]))
+        self.assertTrue('name' in form.fields and not 'email' in form.fields)
+
+        form = self.submit(form, name='Jane')
+        self.assertTrue(form.is_valid() and not form.is_last_page)
+        form = self.submit(form.get_next_page(), email='invalid')
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.page, 2)
+        form = self.submit(form, email='jane@example.com')
+        self.assertTrue(form.is_valid())
+        form = self.submit(form.get_next_page(), comment='Thanks')
+        self.assertEqual(FormSubmission.objects.count(), 0)
+
+        self.assertTrue(form.is_valid() and form.page is None)
+        self.assertEqual((form.cleaned_data['name'], form.cleaned_data['email'], form.cleaned_data['comment']), ('Jane', 'jane@example.com', 'Thanks'))
+        submission = self.definition.log(form)
+        self.assertEqual(sorted(submission.fields.values_list('value', flat=True)), ['Jane', 'Thanks', 'jane@example.com'])
+
+    def test_back(self):
+        from form_designer.views import DesignedForm
+        form = self.submit(DesignedForm(self.definition), name='Jane').get_next_page()
+        form = self.submit(form, email='jane@', **{self.definition.back_flag_name: '1'})
+        self.assertFalse(form.is_bound)
+        self.assertEqual((form.page, form.fields['name'].initial, form.step_data), (1, 'Jane', [(2, {'email': ['jane@']})]))
+        # the values entered before going back are still there
+        form = self.submit(form, name='Joe').get_next_page()
+        self.assertEqual((form.page, form.fields['email'].initial, form.step_data), (2, 'jane@', [(1, {'name': ['Joe']})]))
+
+    def test_error_on_previous_page(self):
+        from form_designer.views import DesignedForm
+        form = self.submit(DesignedForm(self.definition), name='Jane').get_next_page()
+        form = self.submit(form, email='jane@example.com').get_next_page()
+        # the definition changed while the form was being filled in
+        self.definition.fields.filter(name='name').update(max_length=2)
+        form = self.submit(form, comment='Thanks')
+        self.assertFalse(form.is_valid())
+        self.assertEqual((form.page, form.errors.keys(), form.data['name']), (1, ['name'], 'Jane'))
+        form = self.submit(form, name='Jo').get_next_page()
+        self.assertEqual((form.page, form.fields['email'].initial), (2, 'jane@example.com'))
+        form = self.submit(form, email='jane@example.com').get_next_page()
+        self.assertEqual(form.fields['comment'].initial, 'Thanks')
+        form = self.submit(form, comment='Thanks')
+        self.assertTrue(form.is_valid() and form.page is None)
+        self.assertEqual(form.cleaned_data['name'], 'Jo')
+
+    def test_tampered_payload(self):
+        from form_designer import steps
+        from form_designer.models import FormDefinition
+        payload = steps.sign(self.definition, 2, [(1, {'name': ['Jane']})])
+        self.assertEqual(steps.unsign(self.definition, payload), (2, [(1, {'name': ['Jane']})]))
+        forged = steps.sign(self.definition, 2, [(1, {'name': ['Joe']})]).split(':')[:-1] + [payload.split(':')[-1]]
+        self.assertRaises(steps.InvalidStepData, steps.unsign, self.definition, ':'.join(forged))
+        other = FormDefinition.objects.create(name='other')
+        self.assertRaises(steps.InvalidStepData, steps.unsign, other, payload)
+
+
+class LoadTestTest(TestCase):
+    def test_mix_and_statistics(self):
+        from form_designer import loadtest
+        self.assertEqual(loadtest.parse_mix('render=3, valid=1,export=0'), [('render', 3.0), ('valid', 1.0)])
+        self.assertRaises(ValueError, loadtest.parse_mix, 'render=1,delete=1')
+        self.assertEqual(loadtest.percentile(range(1, 101), 0.9), 90)
+        self.assertEqual(loadtest.percentile([0.5], 0.99), 0.5)
+        self.assertEqual((loadtest.percentile(range(1, 11), 0.5), loadtest.percentile(range(1, 11), 0.0), loadtest.percentile(range(1, 11), 1.0)), (5, 1, 10))
+        rows = loadtest.summarize([('render', 0.1, 3, None), ('valid', 0.3, 9, None), ('valid', 0.5, 9, 'HTTP 500')], 2.0)
+        self.assertEqual([(row['operation'], row['requests'], row['errors']) for row in rows], [('render', 1, 0), ('valid', 2, 1), ('total', 3, 1)])
+        self.assertEqual((rows[2]['throughput'], rows[2]['queries']), (1.5, 7.0))
+
+    def test_synthetic_submissions(self):
+        from django.http import QueryDict
+        from form_designer import loadtest
+        from form_designer.views import DesignedForm
+        definition = loadtest.create_definitions(1, 7)[0]
+        target = loadtest.Target(definition)
+        for valid in (True, False):
+            data = QueryDict('', mutable=True)
+            for name, value in target.get_data(3, valid).items():
+                data[name] = value
+            self.assertEqual(DesignedForm(definition, None, data).is_valid(), valid)
+        loadtest.delete_definitions([definition])
@@ -0,0 +1,168 @@
+"""
+File upload support for designed forms.
+
+FormDesignerUploadHandler checks size and type limits while the request body
+is being streamed, before any other upload handler writes the data to memory
+or disk. Accepted files are saved to the configured storage and only their
+storage name ends up in logs and e-mails.
+"""
+
+import os
+import time
+
+from django.core.files.storage import get_storage_class
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from django.utils.translation import ugettext as _
+from form_designer import app_settings
+
+FILE_FIELD_CLASSES = ('forms.FileField', 'forms.ImageField')
+
+_storage = None
+
+
+#------------------------------------------------------------------------------
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = get_storage_class(app_settings.get('FORM_DESIGNER_FILE_STORAGE'))()
+    return _storage
+
+
+#------------------------------------------------------------------------------
+def get_max_size(def_field):
+    return def_field.max_file_size or app_settings.get('FORM_DESIGNER_FILE_MAX_SIZE')
+
+
+#------------------------------------------------------------------------------
+def is_allowed_type(def_field, file_name, content_type):
+    """
+    Checks a file against the field's comma-separated list of allowed
+    extensions ("pdf", ".doc") and MIME types ("application/pdf", "image/*").
+    """
+    if not def_field.allowed_file_types:
+        return True
+    extension = os.path.splitext(file_name or '')[1].lower().lstrip('.')
+    content_type = (content_type or '').lower()
+    for allowed in def_field.allowed_file_types.lower().split(','):
+        allowed = allowed.strip()
+        if not allowed:
+            continue
+        if '/' in allowed:
+            if allowed == content_type or (allowed.endswith('/*') and content_type.startswith(allowed[:-1])):
+                return True
+        elif allowed.lstrip('.') == extension:
+            return True
+    return False
+
+
+#------------------------------------------------------------------------------
+def check_file(def_field, file_name, content_type, size):
+    """
+    Returns an error message if the file violates the field's limits.
+    """
+    if not is_allowed_type(def_field, file_name, content_type):
+        return _('Files of this type are not allowed.')
+    max_size = get_max_size(def_field)
+    if max_size and size is not None and size > max_size:
+        return _('The file may not be larger than %s.') % filesizeformat(max_size)
+    return None
+
+
+#------------------------------------------------------------------------------
+def install_upload_handler(request, form_definition):
+    """
+    Puts a FormDesignerUploadHandler in front of the request's upload
+    handlers. This only works if the request body has not been parsed yet,
+    which is why the detail view is exempt from CsrfViewMiddleware and makes
+    the CSRF check itself; otherwise the limits are checked by DesignedForm
+    after the fact.
+    """
+    if request.method != 'POST' or hasattr(request, '_files'):
+        return False
+    if getattr(request, 'form_designer_upload_errors', None) is not None:
+        # already installed
+        return True
+    file_fields = dict([(field.name, field) for field in form_definition.fields.filter(field_class__in=FILE_FIELD_CLASSES)])
+    if file_fields:
+        request.upload_handlers.insert(0, FormDesignerUploadHandler(request, file_fields))
+    return True
+
+
+#------------------------------------------------------------------------------
+def get_upload_errors(request):
+    return getattr(request, 'form_designer_upload_errors', {})
+
+
+#------------------------------------------------------------------------------
+def store_uploaded_file(uploaded_file):
+    """
+    Saves an uploaded file to the form designer storage. The storage reads
+    the file in chunks, so large uploads are never held in memory.
+    """
+    storage = get_storage()
+    path = os.path.join(time.strftime(app_settings.get('FORM_DESIGNER_FILE_UPLOAD_TO')), storage.get_valid_name(uploaded_file.name))
+    return StoredFile(storage.save(path, uploaded_file), uploaded_file.size)
+
+
+
+#==============================================================================
+class StoredFile(object):
+    """
+    Reference to an uploaded file after it has been saved to storage.
+    """
+
+    def __init__(self, name, size=None):
+        self.name = name
+        self.size = size
+
+    @property
+    def url(self):
+        return get_storage().url(self.name)
+
+    def __form_data__(self):
+        return self.name
+
+    def __unicode__(self):
+        return self.name
+
+
+
+#==============================================================================
+class FormDesignerUploadHandler(FileUploadHandler):
+    """
+    Skips files that exceed their field's limits as soon as the limit is
+    hit, and records an error for DesignedForm to display.
+    """
+
+    def __init__(self, request, file_fields):
+        super(FormDesignerUploadHandler, self).__init__(request)
+        self.file_fields = file_fields
+        self.def_field = None
+        self.received = 0
+        request.form_designer_upload_errors = {}
+
+    def reject(self, message):
+        self.request.form_designer_upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None):
+        super(FormDesignerUploadHandler, self).new_file(field_name, file_name, content_type, content_length, charset)
+        self.def_field = self.file_fields.get(field_name)
+        self.received = 0
+        if self.def_field:
+            message = check_file(self.def_field, file_name, content_type, content_length)
+            if message:
+                self.reject(message)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.def_field:
+            self.received += len(raw_data)
+            max_size = get_max_size(self.def_field)
+            if max_size and self.received > max_size:
+                self.reject(check_file(self.def_field, self.file_name, self.content_type, self.received))
+        return raw_data
+
+    def file_complete(self, file_size):
+        # leave building the file object to the next handler
+        return None
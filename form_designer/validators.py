@@ -0,0 +1,314 @@
+"""
+Validation of field definitions when they are saved, and a process-wide
+cache of compiled regular expressions, so that RegexFields don't compile
+their pattern for every form instance.
+
+Patterns are also checked for nested unbounded repetition such as "(a+)+" or
+"(\\w*\\s?)*", which can take exponential time to fail on certain input
+(catastrophic backtracking) and would let a single submission tie up a
+worker. Nesting is accepted if every repetition of the group has to pass a
+separator that the inner repetition cannot match, as in "(\\w+\\.)+", since
+the input can then only be split up in one way. Likewise, alternatives inside
+an unbounded repetition must not be able to start with the same character,
+as in "(\\w|\\d)+" or "(a|aa)+".
+"""
+
+import re
+import sre_constants
+import sre_parse
+
+from django.utils.translation import ugettext as _
+from form_designer import app_settings
+
+MAXREPEAT = getattr(sre_constants, 'MAXREPEAT', 65535)
+REPEAT_OPS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+CHARACTER_OPS = (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN)
+ZERO_WIDTH_OPS = (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT)
+CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: re.compile(r'\d'),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(r'\D'),
+    sre_constants.CATEGORY_SPACE: re.compile(r'\s'),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(r'\S'),
+    sre_constants.CATEGORY_WORD: re.compile(r'\w'),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(r'\W'),
+}
+
+_patterns = {}
+
+
+#------------------------------------------------------------------------------
+def compile_regex(pattern):
+    """
+    Returns the compiled pattern, compiling it only on first use.
+    """
+    compiled = _patterns.get(pattern)
+    if compiled is None:
+        compiled = re.compile(pattern)
+        if len(_patterns) >= app_settings.get('FORM_DESIGNER_REGEX_CACHE_SIZE'):
+            _patterns.clear()
+        _patterns[pattern] = compiled
+    return compiled
+
+
+#------------------------------------------------------------------------------
+def _subpatterns(op, av):
+    """
+    Yields the nested subpatterns of a parsed regex item.
+    """
+    if op in REPEAT_OPS:
+        yield av[2]
+    elif op == sre_constants.SUBPATTERN:
+        # (group, pattern) in Python 2, (group, add_flags, del_flags, pattern) later
+        yield av[-1]
+    elif op == sre_constants.BRANCH:
+        for branch in av[1]:
+            yield branch
+    elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        yield av[1]
+
+
+#------------------------------------------------------------------------------
+def _is_unbounded(op, av):
+    return op in REPEAT_OPS and av[1] >= MAXREPEAT
+
+
+#------------------------------------------------------------------------------
+def _contains_unbounded(subpattern):
+    for op, av in subpattern:
+        if _is_unbounded(op, av):
+            return True
+        for nested in _subpatterns(op, av):
+            if _contains_unbounded(nested):
+                return True
+    return False
+
+
+#------------------------------------------------------------------------------
+def _matches_char(op, av, char):
+    """
+    Returns whether a single-character item matches char.
+    """
+    if op == sre_constants.LITERAL:
+        return ord(char) == av
+    if op == sre_constants.NOT_LITERAL:
+        return ord(char) != av
+    if op == sre_constants.ANY:
+        return char != u'\n'
+    if op == sre_constants.RANGE:
+        return av[0] <= ord(char) <= av[1]
+    if op == sre_constants.CATEGORY:
+        return av in CATEGORIES and CATEGORIES[av].match(char) is not None
+    if op == sre_constants.IN:
+        negate = bool(av) and av[0][0] == sre_constants.NEGATE
+        items = negate and av[1:] or av
+        return bool([item for item in items if _matches_char(item[0], item[1], char)]) != negate
+    return False
+
+
+#------------------------------------------------------------------------------
+def _literals(subpattern):
+    """
+    Returns the characters the pattern mentions literally.
+    """
+    chars = set()
+    for op, av in subpattern:
+        if op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL):
+            chars.add(unichr(av))
+        elif op == sre_constants.IN:
+            chars.update([unichr(item_av) for item_op, item_av in av if item_op == sre_constants.LITERAL])
+        for nested in _subpatterns(op, av):
+            chars.update(_literals(nested))
+    return chars
+
+
+
+#==============================================================================
+class _NestingChecker(object):
+    """
+    Finds nested unbounded repetitions that can match the same input in
+    more than one way. Character classes are compared over Latin-1 and the
+    characters the pattern mentions.
+    """
+
+    def __init__(self, parsed):
+        self.universe = set([unichr(code) for code in range(256)]) | _literals(parsed)
+        self.everything = frozenset(self.universe)
+
+    def chars(self, op, av):
+        return frozenset([char for char in self.universe if _matches_char(op, av, char)])
+
+    def all_chars(self, subpattern):
+        """
+        Returns the characters any part of subpattern can match.
+        """
+        chars = set()
+        for op, av in subpattern:
+            if op in CHARACTER_OPS:
+                chars |= self.chars(op, av)
+            elif op in ZERO_WIDTH_OPS:
+                continue
+            elif op in REPEAT_OPS or op in (sre_constants.SUBPATTERN, sre_constants.BRANCH):
+                for nested in _subpatterns(op, av):
+                    chars |= self.all_chars(nested)
+            else:
+                # backreferences and the like can match anything
+                return self.everything
+        return chars
+
+    def repeated_chars(self, op, av):
+        """
+        Returns the characters matched by the unbounded repetitions in an
+        item.
+        """
+        if _is_unbounded(op, av):
+            return self.all_chars(av[2])
+        chars = set()
+        for nested in _subpatterns(op, av):
+            for nested_op, nested_av in nested:
+                chars |= self.repeated_chars(nested_op, nested_av)
+        return chars
+
+    def first(self, subpattern):
+        """
+        Returns the characters that can come first in a match of subpattern,
+        up to and including its first mandatory character, and whether there
+        is such a character.
+        """
+        chars = set()
+        for op, av in subpattern:
+            if op in CHARACTER_OPS:
+                return chars | self.chars(op, av), True
+            if op in ZERO_WIDTH_OPS:
+                continue
+            if op in REPEAT_OPS:
+                nested_chars, mandatory = self.first(av[2])
+                chars |= nested_chars
+                if mandatory and av[0] > 0:
+                    return chars, True
+            elif op == sre_constants.SUBPATTERN:
+                nested_chars, mandatory = self.first(av[-1])
+                chars |= nested_chars
+                if mandatory:
+                    return chars, True
+            elif op == sre_constants.BRANCH:
+                results = [self.first(branch) for branch in av[1]]
+                for nested_chars, mandatory in results:
+                    chars |= nested_chars
+                if not [mandatory for nested_chars, mandatory in results if not mandatory]:
+                    return chars, True
+            else:
+                return self.everything, False
+        return chars, False
+
+    def is_ambiguous(self, body):
+        """
+        Checks the body of an unbounded repetition: each item containing an
+        unbounded repetition must be followed, before it can match again, by
+        a mandatory character it cannot match.
+        """
+        while len(body) == 1 and body[0][0] == sre_constants.SUBPATTERN:
+            body = body[0][1][-1]
+        body = list(body)
+        for index, (op, av) in enumerate(body):
+            if not _contains_unbounded([(op, av)]):
+                continue
+            following, mandatory = self.first(body[index + 1:] + body[:index])
+            if not mandatory or self.repeated_chars(op, av) & following:
+                return True
+        return False
+
+    def has_overlapping_branch(self, items, following):
+        """
+        Checks the alternatives in items, which are followed by following,
+        for characters that more than one of them can start with. Sharing a
+        prefix is fine, as sre_parse moves it out of the alternatives.
+        """
+        items = list(items)
+        for index, (op, av) in enumerate(items):
+            rest = items[index + 1:] + following
+            if op == sre_constants.SUBPATTERN:
+                if self.has_overlapping_branch(av[-1], rest):
+                    return True
+            elif op == sre_constants.BRANCH:
+                seen = set()
+                for branch in av[1]:
+                    chars, mandatory = self.first(list(branch) + rest)
+                    if chars & seen:
+                        return True
+                    seen |= chars
+        return False
+
+    def check(self, subpattern):
+        """
+        Returns True if subpattern contains an ambiguous nesting.
+        """
+        for op, av in subpattern:
+            if _is_unbounded(op, av) and _contains_unbounded(av[2]) and self.is_ambiguous(av[2]):
+                return True
+            for nested in _subpatterns(op, av):
+                if self.check(nested):
+                    return True
+        return False
+
+    def check_branches(self, subpattern):
+        """
+        Returns True if subpattern repeats overlapping alternatives without
+        bound.
+        """
+        for op, av in subpattern:
+            # the alternatives are followed by the next repetition
+            if _is_unbounded(op, av) and self.has_overlapping_branch(av[2], list(av[2])):
+                return True
+            for nested in _subpatterns(op, av):
+                if self.check_branches(nested):
+                    return True
+        return False
+
+
+#------------------------------------------------------------------------------
+def lint_regex(pattern):
+    """
+    Returns a list of problems with the pattern; empty if there are none.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+        re.compile(pattern)
+    except (re.error, sre_constants.error, OverflowError, RuntimeError) as error:
+        return [_('Invalid regular expression: %s') % error]
+    problems = []
+    if app_settings.get('FORM_DESIGNER_REGEX_LINT'):
+        checker = _NestingChecker(parsed)
+        if checker.check(parsed):
+            problems.append(_('This expression nests unbounded repetitions like "(a+)+", which can make matching extremely slow. Please rewrite it, e.g. as "a+".'))
+        if checker.check_branches(parsed):
+            problems.append(_('This expression repeats alternatives that can match the same text, like "(a|aa)+", which can make matching extremely slow. Please rewrite it, e.g. as "a+".'))
+    return problems
+
+
+#------------------------------------------------------------------------------
+def validate_field_spec(field):
+    """
+    Checks a FormDefinitionField's validation settings for consistency.
+    Returns a dictionary mapping field names to lists of error messages.
+    """
+    errors = {}
+
+    def add(name, message):
+        errors.setdefault(name, []).append(message)
+
+    for name in ('max_length', 'min_length', 'max_digits', 'decimal_places', 'max_file_size'):
+        if getattr(field, name) is not None and getattr(field, name) < 0:
+            add(name, _('This value may not be negative.'))
+    if field.min_length is not None and field.max_length is not None and field.min_length > field.max_length:
+        add('min_length', _('The minimum length may not exceed the maximum length.'))
+    if field.min_value is not None and field.max_value is not None and field.min_value > field.max_value:
+        add('min_value', _('The minimum value may not exceed the maximum value.'))
+    if field.decimal_places is not None and field.max_digits is not None and field.decimal_places > field.max_digits:
+        add('decimal_places', _('The number of decimal places may not exceed the number of digits.'))
+
+    if field.field_class == 'forms.RegexField' and not field.regex:
+        add('regex', _('This field class requires a regular expression.'))
+    if field.regex:
+        for message in lint_regex(field.regex):
+            add('regex', message)
+    return errors
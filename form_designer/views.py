@@ -7,7 +7,9 @@ from django import forms
 from django.forms import widgets
 from django.http import HttpResponseRedirect
 from django.conf import settings
-from form_designer import app_settings
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from form_designer import app_settings, relay, steps
+from form_designer.uploads import FILE_FIELD_CLASSES, check_file, get_upload_errors, install_upload_handler
 
 
 #==============================================================================
@@ -15,10 +17,117 @@ class DesignedForm(forms.Form):
     
     #--------------------------------------------------------------------------
     def __init__(self, form_definition, initial_data=None, *args, **kwargs):
+        """
+        For multi-step definitions, only the fields of page (default: the
+        first page) are included, along with the signed values of the
+        completed pages in step_data. Pass all_pages=True to include all
+        fields.
+        """
+        self.upload_errors = kwargs.pop('upload_errors', {})
+        page = kwargs.pop('page', None)
+        self.step_data = kwargs.pop('step_data', [])
+        all_pages = kwargs.pop('all_pages', False)
         super(DesignedForm, self).__init__(*args, **kwargs)
-        for def_field in form_definition.fields.all():
+        self.form_definition = form_definition
+        self.file_fields = {}
+        self.defined_field_names = []
+        def_fields = list(form_definition.fields.all())
+        self.pages = steps.get_pages(def_fields)
+        self.field_pages = dict([(def_field.name, steps.get_page(def_field, self.pages)) for def_field in def_fields])
+        if all_pages or not self.is_multi_step:
+            self.page = None
+        else:
+            self.page = page or self.pages[0]
+        for def_field in def_fields:
+            if self.page is not None and steps.get_page(def_field, self.pages) != self.page:
+                continue
             self.add_defined_field(def_field, initial_data)
+            self.defined_field_names.append(def_field.name)
+            if def_field.field_class in FILE_FIELD_CLASSES:
+                self.file_fields[def_field.name] = def_field
         self.fields[form_definition.submit_flag_name] = forms.BooleanField(required=False, initial=1, widget=widgets.HiddenInput)
+        if self.page is not None:
+            self.fields[form_definition.steps_field_name] = forms.CharField(required=False, widget=widgets.HiddenInput,
+                initial=steps.sign(form_definition, self.page, self.step_data))
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def is_multi_step(self):
+        return len(self.pages) > 1
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def is_first_page(self):
+        return self.page is None or self.page == self.pages[0]
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def is_last_page(self):
+        return self.page is None or self.page == self.pages[-1]
+
+
+    #--------------------------------------------------------------------------
+    @property
+    def page_number(self):
+        return self.pages.index(self.page) + 1 if self.page is not None else len(self.pages)
+
+
+    #--------------------------------------------------------------------------
+    def get_next_page(self):
+        """
+        Returns the unbound form for the page after this one, carrying the
+        values submitted on this page.
+        """
+        return self._get_page(self.pages[self.pages.index(self.page) + 1])
+
+
+    #--------------------------------------------------------------------------
+    def get_previous_page(self):
+        """
+        Returns the unbound form for the page before this one, carrying the
+        values submitted on this page, even if they are not valid yet.
+        """
+        return self._get_page(self.pages[self.pages.index(self.page) - 1])
+
+
+    #--------------------------------------------------------------------------
+    def _get_page(self, page):
+        # the form of page is filled in with the values that were submitted
+        # on it before, if any
+        step_data = steps.replace_step(self.step_data, self.page, steps.get_raw_data(self.data, self.defined_field_names))
+        initial_data = steps.to_query_dict([(step_page, data) for step_page, data in step_data if step_page == page])
+        return DesignedForm(self.form_definition, initial_data, page=page, step_data=steps.replace_step(step_data, page))
+
+
+    #--------------------------------------------------------------------------
+    def get_error_page(self):
+        """
+        Returns the page holding the first field with an error, or the last
+        page if there is none.
+        """
+        for name in self.fields:
+            if name in self.errors and name in self.field_pages:
+                return self.field_pages[name]
+        return self.pages[-1]
+
+
+    #--------------------------------------------------------------------------
+    def clean(self):
+        cleaned_data = self.cleaned_data
+        for name, def_field in self.file_fields.items():
+            message = self.upload_errors.get(name)
+            uploaded_file = cleaned_data.get(name)
+            if not message and uploaded_file and hasattr(uploaded_file, 'size'):
+                # limits could not be enforced while streaming, e.g. because
+                # the request body had already been parsed
+                message = check_file(def_field, uploaded_file.name, getattr(uploaded_file, 'content_type', None), uploaded_file.size)
+            if message:
+                self._errors[name] = self.error_class([message])
+                cleaned_data.pop(name, None)
+        return cleaned_data
 
 
 
@@ -35,34 +144,102 @@ class DesignedForm(forms.Form):
 
 
 #------------------------------------------------------------------------------
-def process_form(request, form_definition, context={}, is_cms_plugin=False):
+def bind_form(form_definition, data, files=None, upload_errors=None):
+    """
+    Returns a DesignedForm for the submitted data. For multi-step
+    definitions, this is the form of the submitted page, the unbound form of
+    the previous page if the user went back, or, once the last page is
+    valid, the form with all fields, bound to the values of all pages. If
+    those are not valid together, the form of the page holding the first
+    error is returned instead.
+    Raises steps.InvalidStepData if the values of the completed pages cannot
+    be restored.
+    """
+    upload_errors = upload_errors or {}
+    pages = steps.get_pages(form_definition.fields.all())
+    if len(pages) == 1:
+        return DesignedForm(form_definition, None, data, files, upload_errors=upload_errors)
+    page, step_data = steps.unsign(form_definition, data.get(form_definition.steps_field_name))
+    if not page in pages:
+        raise steps.InvalidStepData('Unknown page')
+    form = DesignedForm(form_definition, None, data, files, upload_errors=upload_errors, page=page, step_data=step_data)
+    if data.get(form_definition.back_flag_name) and not form.is_first_page:
+        return form.get_previous_page()
+    if form.is_last_page and form.is_valid():
+        step_data = steps.replace_step(step_data, page)
+        all_data = steps.to_query_dict(step_data, data)
+        all_data.pop(form_definition.steps_field_name, None)
+        all_form = DesignedForm(form_definition, None, all_data, files, upload_errors=upload_errors, all_pages=True)
+        if all_form.is_valid():
+            return all_form
+        # rendering all fields on one page would be confusing
+        error_page = all_form.get_error_page()
+        step_data = steps.replace_step(steps.replace_step(step_data, page, steps.get_raw_data(data, form.defined_field_names)), error_page)
+        all_data[form_definition.steps_field_name] = steps.sign(form_definition, error_page, step_data)
+        form = DesignedForm(form_definition, None, all_data, files, upload_errors=upload_errors, page=error_page, step_data=step_data)
+    return form
+
+
+#------------------------------------------------------------------------------
+def process_form(request, form_definition, context={}, is_cms_plugin=False, background=None):
+    """
+    Handles display and submission of a form definition. If background is
+    True (default: the FORM_DESIGNER_BACKGROUND_MAIL setting), notification
+    mails are handed to a worker thread instead of being sent before the
+    response is returned.
+    """
+    if background is None:
+        background = app_settings.get('FORM_DESIGNER_BACKGROUND_MAIL')
     success_message = form_definition.success_message or _('Thank you, the data was submitted successfully.')
     error_message = form_definition.error_message or _('The data could not be submitted, please try again.')
     message = None
 
-    is_submit = False
+    data = files = None
+    # must happen before request.POST is first accessed; detail() has done
+    # this already, but the CMS plugin has not
+    install_upload_handler(request, form_definition)
     # If the form has been submitted...
     if request.method == 'POST' and request.POST.get(form_definition.submit_flag_name):
-        form = DesignedForm(form_definition, None, request.POST)
-        is_submit = True
+        data, files = request.POST, request.FILES
     if request.method == 'GET' and request.GET.get(form_definition.submit_flag_name):
-        form = DesignedForm(form_definition, None, request.GET)
-        is_submit = True
+        data = request.GET
     
+    is_submit = data is not None
     if is_submit:
-        if form.is_valid():
+        try:
+            form = bind_form(form_definition, data, files, get_upload_errors(request))
+        except steps.InvalidStepData:
+            is_submit = False
+            message = _('Your previous answers could not be restored, please start again.')
+    
+    if is_submit and not form.is_bound:
+        # went back to the previous page
+        pass
+    elif is_submit:
+        if form.is_valid() and not form.is_last_page:
+            # nothing is stored until the last page has been submitted
+            form = form.get_next_page()
+        elif form.is_valid():
             # Successful submission
             if 'django_notify' in settings.INSTALLED_APPS:
                 request.notifications.success(success_message)
             else:
                 message = success_message
+            submission = None
             if form_definition.log_data:
-                form_definition.log(form)
+                submission = form_definition.log(form)
             if form_definition.mail_to:
-                form_definition.send_mail(form)
+                if form_definition.uses_mail_digest:
+                    form_definition.queue_mail_digest(form)
+                else:
+                    form_definition.send_mail(form, background=background)
+            if form_definition.has_active_webhooks:
+                form_definition.queue_webhooks(form, submission)
+            if form_definition.relay_action and form_definition.action:
+                relay.relay(form_definition, form)
             if form_definition.success_redirect and not is_cms_plugin:
                 # TODO Redirection does not work for cms plugin
-                return HttpResponseRedirect(form_definition.action or '?')
+                return HttpResponseRedirect(form_definition.form_action or '?')
             if form_definition.success_clear:
                 form = DesignedForm(form_definition) # clear form
         else:
@@ -87,9 +264,23 @@ def process_form(request, form_definition, context={}, is_cms_plugin=False):
 
 
 #------------------------------------------------------------------------------
-def detail(request, object_name):
+@csrf_exempt
+def detail(request, object_name, background=None):
+    """
+    Displays and processes a form definition. The CSRF check is made by
+    _detail(), after the upload handler has been installed: the middleware
+    would parse the request body before the view runs, leaving no chance to
+    enforce upload limits while the files are streamed.
+    """
     form_definition = get_object_or_404(FormDefinition, name=object_name)
-    result = process_form(request, form_definition)
+    install_upload_handler(request, form_definition)
+    return _detail(request, form_definition, background)
+
+
+#------------------------------------------------------------------------------
+@csrf_protect
+def _detail(request, form_definition, background=None):
+    result = process_form(request, form_definition, background=background)
     if isinstance(result, HttpResponseRedirect):
         return result
     else:
@@ -0,0 +1,203 @@
+"""
+Delivery of form submissions to webhooks.
+
+Submissions are written to an outbox (WebhookDelivery) while the request is
+processed, and sent later by a pool of worker threads sharing keep-alive
+connections. Failed deliveries are retried with exponential backoff until
+FORM_DESIGNER_WEBHOOK_MAX_ATTEMPTS is reached, after which they are marked
+as dead. Deliveries are claimed before they are sent, so that several
+deliver_webhooks processes can run at the same time without sending any of
+them twice.
+"""
+
+import datetime
+import decimal
+import hashlib
+import hmac
+import logging
+import threading
+import Queue
+
+from django.db.models.query import QuerySet
+from django.utils import simplejson
+from form_designer import app_settings
+from form_designer.httpclient import ConnectionPool, HTTPError
+from form_designer.models import WebhookDelivery
+
+SIGNATURE_HEADER = 'X-Form-Designer-Signature'
+
+
+#------------------------------------------------------------------------------
+def json_value(value):
+    """
+    Converts a cleaned form value to something JSON can represent.
+    """
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (list, tuple, QuerySet)):
+        return [json_value(item) for item in value]
+    return unicode(value)
+
+
+#------------------------------------------------------------------------------
+def build_payload(form_definition, form_data, submission=None):
+    return {
+        'form': form_definition.name,
+        'submission': submission.pk if submission else None,
+        'submitted': datetime.datetime.now().isoformat(),
+        'data': [{'name': item['name'], 'label': unicode(item['label'] or ''), 'value': json_value(item['value'])} for item in form_data],
+    }
+
+
+#------------------------------------------------------------------------------
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+#------------------------------------------------------------------------------
+def queue(form_definition, form_data, submission=None):
+    """
+    Creates a pending delivery for each active webhook of the definition.
+    """
+    webhooks = list(form_definition.webhooks.filter(active=True))
+    if not webhooks:
+        return []
+    payload = simplejson.dumps(build_payload(form_definition, form_data, submission))
+    return [WebhookDelivery.objects.create(webhook=webhook, payload=payload) for webhook in webhooks]
+
+
+#------------------------------------------------------------------------------
+def get_retry_delay(attempts):
+    delay = app_settings.get('FORM_DESIGNER_WEBHOOK_RETRY_DELAY') * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, app_settings.get('FORM_DESIGNER_WEBHOOK_MAX_RETRY_DELAY')))
+
+
+#------------------------------------------------------------------------------
+def get_batches(deliveries):
+    """
+    Groups deliveries into the requests that will be made, respecting each
+    webhook's batch size.
+    """
+    batches = []
+    open_batches = {}
+    for delivery in deliveries:
+        webhook = delivery.webhook
+        batch = open_batches.get(webhook.pk)
+        if batch is None or len(batch) >= max(webhook.batch_size, 1):
+            batch = open_batches[webhook.pk] = []
+            batches.append(batch)
+        batch.append(delivery)
+    return batches
+
+
+#------------------------------------------------------------------------------
+def send_batch(pool, batch):
+    """
+    Posts a batch to its webhook. Returns None on success, or an error
+    message.
+    """
+    webhook = batch[0].webhook
+    if webhook.batch_size > 1:
+        body = '[%s]' % ','.join([delivery.payload for delivery in batch])
+    else:
+        body = batch[0].payload
+    body = body.encode('utf-8')
+    headers = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'X-Form-Designer-Delivery': ','.join([str(delivery.pk) for delivery in batch]),
+    }
+    if webhook.secret:
+        headers[SIGNATURE_HEADER] = sign(webhook.secret, body)
+    try:
+        status, data = pool.request('POST', webhook.url, body, headers)
+    except HTTPError as error:
+        return unicode(error)
+    if status < 200 or status >= 300:
+        return u'HTTP %d: %s' % (status, data[:500].decode('utf-8', 'replace'))
+    return None
+
+
+#------------------------------------------------------------------------------
+def claim(deliveries, now):
+    """
+    Marks deliveries as being sent, unless another process has claimed or
+    updated them since they were read, and returns the ones claimed. A claim
+    expires after FORM_DESIGNER_WEBHOOK_CLAIM_TIMEOUT seconds.
+    """
+    expires = now + datetime.timedelta(seconds=app_settings.get('FORM_DESIGNER_WEBHOOK_CLAIM_TIMEOUT'))
+    claimed = []
+    for delivery in deliveries:
+        if WebhookDelivery.objects.filter(pk=delivery.pk, status=delivery.status, attempts=delivery.attempts,
+                next_attempt=delivery.next_attempt).update(status=WebhookDelivery.STATUS_SENDING, next_attempt=expires):
+            delivery.status = WebhookDelivery.STATUS_SENDING
+            claimed.append(delivery)
+    return claimed
+
+
+#------------------------------------------------------------------------------
+def deliver_pending(workers=None, limit=1000, pool=None):
+    """
+    Sends up to limit due deliveries using a pool of worker threads and
+    returns (delivered, failed) counts. Only the calling thread touches the
+    database; workers just make HTTP requests.
+    """
+    workers = workers or app_settings.get('FORM_DESIGNER_WEBHOOK_WORKERS')
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(timeout=app_settings.get('FORM_DESIGNER_WEBHOOK_TIMEOUT'), max_idle=workers)
+
+    now = datetime.datetime.now()
+    # sending deliveries whose claim has expired are taken over
+    deliveries = claim(WebhookDelivery.objects.filter(status__in=(WebhookDelivery.STATUS_PENDING, WebhookDelivery.STATUS_SENDING),
+        next_attempt__lte=now, webhook__active=True).select_related('webhook').order_by('pk')[:limit], now)
+
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    for batch in get_batches(deliveries):
+        tasks.put(batch)
+
+    def work():
+        while True:
+            try:
+                batch = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                error = send_batch(pool, batch)
+            except Exception as exception:
+                error = u'%s: %s' % (type(exception).__name__, exception)
+            results.put((batch, error))
+
+    threads = [threading.Thread(target=work) for i in range(min(workers, tasks.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if own_pool:
+        pool.close()
+
+    delivered = failed = 0
+    max_attempts = app_settings.get('FORM_DESIGNER_WEBHOOK_MAX_ATTEMPTS')
+    while not results.empty():
+        batch, error = results.get()
+        for delivery in batch:
+            delivery.attempts += 1
+            if error is None:
+                delivery.status = WebhookDelivery.STATUS_DELIVERED
+                delivery.last_error = None
+                delivered += 1
+            else:
+                delivery.last_error = error
+                if delivery.attempts >= max_attempts:
+                    delivery.status = WebhookDelivery.STATUS_DEAD
+                    logging.error('Webhook delivery %s to %s failed permanently: %s' % (delivery.pk, delivery.webhook.url, error))
+                else:
+                    delivery.status = WebhookDelivery.STATUS_PENDING
+                    delivery.next_attempt = now + get_retry_delay(delivery.attempts)
+                failed += 1
+            delivery.save()
+    return delivered, failed
@@ -0,0 +1,69 @@
+"""
+A bounded in-process pool of background threads for work that should not
+hold up the response, such as talking to slow external services.
+"""
+
+import logging
+import threading
+import Queue
+
+
+#==============================================================================
+class WorkerPool(object):
+    """
+    Runs submitted callables on up to `workers` daemon threads, which are
+    started on first use. If more than `queue_size` tasks are waiting, new
+    tasks are rejected instead of piling up in memory.
+    """
+
+    def __init__(self, name, workers=4, queue_size=1000):
+        self.name = name
+        self.workers = workers
+        self.tasks = Queue.Queue(queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def start(self):
+        self.lock.acquire()
+        try:
+            if not self.threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.work, name='%s-%d' % (self.name, i))
+                    thread.setDaemon(True)
+                    thread.start()
+                    self.threads.append(thread)
+        finally:
+            self.lock.release()
+
+    #--------------------------------------------------------------------------
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues func(*args, **kwargs). Returns False if the queue is full.
+        """
+        if not self.threads:
+            self.start()
+        try:
+            self.tasks.put_nowait((func, args, kwargs))
+        except Queue.Full:
+            logging.error('%s: queue full, dropping %r' % (self.name, func))
+            return False
+        return True
+
+    #--------------------------------------------------------------------------
+    def wait(self):
+        """
+        Blocks until all queued tasks have been processed.
+        """
+        self.tasks.join()
+
+    #--------------------------------------------------------------------------
+    def work(self):
+        while True:
+            func, args, kwargs = self.tasks.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logging.exception('%s: task %r failed' % (self.name, func))
+            finally:
+                self.tasks.task_done()